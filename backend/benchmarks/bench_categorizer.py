@@ -0,0 +1,86 @@
+"""Microbenchmark for SmartCategorizer.predict.
+
+Compares the keyword automaton with the previous loop, which normalized and
+substring-searched every keyword of every category on each call, and reports
+batch throughput (predict_many plus category resolution):
+
+    python -m backend.benchmarks.bench_categorizer
+    python -m backend.benchmarks.bench_categorizer --descriptions 50000
+"""
+import argparse
+import random
+import time
+import unicodedata
+from types import SimpleNamespace
+from ..smart_categorization import CategoryResolver, SmartCategorizer
+
+
+def legacy_normalize(text: str) -> str:
+    nfkd = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+
+def legacy_predict(categorizer: SmartCategorizer, description: str, transaction_type: str = "expense") -> str:
+    """The pre-automaton predict()."""
+    desc_normalized = legacy_normalize(description)
+    relevant = categorizer.INCOME_CATEGORIES if transaction_type == "income" else {
+        k for k in categorizer.rules if k not in categorizer.INCOME_CATEGORIES
+    }
+    for category, data in categorizer.rules.items():
+        if category not in relevant:
+            continue
+        for keyword in data["keywords"]:
+            if legacy_normalize(keyword) in desc_normalized:
+                return category
+    return "Outros" if transaction_type == "expense" else "Receita"
+
+
+FILLER = ["compra", "no", "débito", "loja", "centro", "sao", "joão", "ltda", "parcela", "r$", "12,90", "cartão", "via", "app"]
+
+
+def sample_descriptions(categorizer: SmartCategorizer, count: int, seed: int = 7):
+    """Statement/WhatsApp-like text: some keywords with accents and casing mixed in, some misses."""
+    rng = random.Random(seed)
+    keywords = [k for data in categorizer.rules.values() for k in data["keywords"]]
+    descriptions = []
+    for _ in range(count):
+        words = rng.sample(FILLER, rng.randint(1, 4))
+        if rng.random() < 0.7:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords))
+        text = " ".join(words)
+        descriptions.append(text.upper() if rng.random() < 0.3 else text)
+    return descriptions
+
+
+def run(count: int):
+    categorizer = SmartCategorizer()
+    descriptions = sample_descriptions(categorizer, count)
+    print(f"{'type':>8} {'legacy µs':>10} {'automaton µs':>13} {'speedup':>8}")
+    for tx_type in ("expense", "income"):
+        started = time.perf_counter()
+        legacy = [legacy_predict(categorizer, d, tx_type) for d in descriptions]
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        current = [categorizer.predict(d, tx_type) for d in descriptions]
+        current_time = time.perf_counter() - started
+
+        assert legacy == current, "predictions differ from the legacy loop"
+        print(f"{tx_type:>8} {legacy_time / count * 1e6:>10.1f} {current_time / count * 1e6:>13.1f} {legacy_time / current_time:>7.1f}x")
+
+    # Import-style batch: predict_many plus name -> id resolution against one category list
+    resolver = CategoryResolver([SimpleNamespace(id=i, name=name) for i, name in enumerate(categorizer.rules)])
+    types = ["income" if i % 5 == 0 else "expense" for i in range(count)]
+    started = time.perf_counter()
+    names = categorizer.predict_many(descriptions, types, fallback=False)
+    ids = [resolver.resolve(name) if name else None for name in names]
+    batch_time = time.perf_counter() - started
+    assert len(ids) == count
+    print(f"predict_many + resolve: {count / batch_time:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SmartCategorizer.predict.")
+    parser.add_argument("--descriptions", type=int, default=20_000)
+    args = parser.parse_args()
+    run(args.descriptions)
@@ -0,0 +1,100 @@
+"""Throughput of every registered statement parser on synthetic statements.
+
+Builds an in-memory file per format (100k lines by default) and times the full
+normalized pipeline (decode, parse, rule and smart categorization, fingerprint), without the database:
+
+    python -m backend.benchmarks.bench_importers
+    python -m backend.benchmarks.bench_importers --rows 250000 --repeat 5
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from ..importers import PARSERS
+from ..services.statement_parser import iter_statement_rows
+from ..smart_categorization import CategoryResolver
+
+DESCRIPTIONS = [
+    "Transferência enviada pelo Pix - Padaria", "Compra no débito - Supermercado", "Uber *Trip",
+    "Pagamento de boleto efetuado - CELESC", "Aplicação RDB", "Transferência Recebida - Salário",
+    "Mensalidade UNINTER", "Restaurante São João", "Farmácia Popular", "Posto Pista Livre",
+]
+CAT_MAP = {name.lower(): {"id": i, "name": name} for i, name in enumerate(
+    ["Alimentação", "Transferências", "Investimentos", "Boletos", "Serviços", "Educação", "Pix", "Outros"], start=1
+)}
+
+
+def _lines(rows: int):
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    for i in range(rows):
+        yield start + timedelta(days=i // 50), rng.choice(DESCRIPTIONS), round(rng.uniform(-500, 500), 2), i
+
+
+def nubank_checking(rows: int) -> bytes:
+    out = ["Data,Valor,Identificador,Descrição"]
+    out += [f"{d:%d/%m/%Y},{amount:.2f},{i:08x},{desc}" for d, desc, amount, i in _lines(rows)]
+    return "\n".join(out).encode("utf-8")
+
+
+def nubank_card(rows: int) -> bytes:
+    out = ["date,title,amount"]
+    out += [f"{d:%Y-%m-%d},{desc},{-amount:.2f}" for d, desc, amount, _ in _lines(rows)]
+    return "\n".join(out).encode("utf-8")
+
+
+def ofx(rows: int) -> bytes:
+    out = ["OFXHEADER:100", "DATA:OFXSGML", "CHARSET:1252", "", "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"]
+    for d, desc, amount, i in _lines(rows):
+        out.append(
+            f"<STMTTRN>\n<TRNTYPE>{'CREDIT' if amount > 0 else 'DEBIT'}\n<DTPOSTED>{d:%Y%m%d}000000[-3:BRT]\n"
+            f"<TRNAMT>{amount:.2f}\n<FITID>{i}\n<MEMO>{desc}\n</STMTTRN>"
+        )
+    out.append("</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>")
+    return "\n".join(out).encode("cp1252")
+
+
+def qif(rows: int) -> bytes:
+    out = ["!Type:Bank"]
+    for d, desc, amount, _ in _lines(rows):
+        out += [f"D{d:%d/%m/%Y}", f"T{amount:.2f}".replace(".", ","), f"P{desc}", "^"]
+    return "\n".join(out).encode("utf-8")
+
+
+FIXTURES = {
+    "nubank_checking": (nubank_checking, "extrato.csv"),
+    "nubank_card": (nubank_card, "fatura.csv"),
+    "ofx": (ofx, "extrato.ofx"),
+    "qif": (qif, "extrato.qif"),
+}
+
+
+def run(rows: int, repeat: int):
+    missing = set(PARSERS) - set(FIXTURES)
+    if missing:
+        print(f"No synthetic fixture for: {', '.join(sorted(missing))}")
+
+    print(f"{'parser':>16} {'rows':>8} {'MB':>6} {'median s':>9} {'rows/s':>10} {'MB/s':>6}")
+    for name, (build, filename) in FIXTURES.items():
+        payload = build(rows)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            resolver = CategoryResolver([SimpleNamespace(**c) for c in CAT_MAP.values()])
+            parsed = sum(1 for _ in iter_statement_rows(io.BytesIO(payload), filename, CAT_MAP, resolver))
+            samples.append(time.perf_counter() - started)
+        assert parsed == rows, f"{name}: parsed {parsed} of {rows} rows"
+        median = statistics.median(samples)
+        megabytes = len(payload) / 1e6
+        print(f"{name:>16} {rows:>8} {megabytes:>6.1f} {median:>9.3f} {rows / median:>10.0f} {megabytes / median:>6.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark statement parsers on synthetic files.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
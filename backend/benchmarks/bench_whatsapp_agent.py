@@ -0,0 +1,269 @@
+"""End-to-end replay of WhatsApp messages through WhatsappAgent.process_message.
+
+Seeds a user, a workspace and a few categories, then replays a corpus of
+realistic messages (expenses, incomes, installments, recurrences, dates and the
+saldo/ultimas/meta/categorias/desfazer commands) against SQLite by default or any
+database URL, and reports messages per second and where the time goes:
+
+    parse            message_parser.parse_transaction + clean_description
+    categorize       learned model (crud_category_learning.predict) + keyword rules
+    category lookup  categorizer.resolver / find_category_id
+    insert           crud.create_user_transaction (installments, rollups, learning)
+    queries          saldo, ultimas, meta, categorias, desfazer
+    format/other     the rest: normalization, routing, schema building, reply text
+
+    python -m backend.benchmarks.bench_whatsapp_agent
+    python -m backend.benchmarks.bench_whatsapp_agent --messages 20000 --save-baseline
+
+Results are compared with backend/benchmarks/baselines/whatsapp_agent.json (written
+by --save-baseline); a stage or the throughput more than --tolerance worse than the
+baseline is flagged and the exit status is 1. Baselines are machine specific: save
+one on the machine that runs the comparison. Tables are created in the target
+database, so point --db-url at a scratch database.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from ..database import Base
+from .. import crud, crud_category_learning, models
+from ..services import message_parser
+from ..services.whatsapp_agent import WhatsappAgent
+from ..smart_categorization import categorizer, normalize
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "whatsapp_agent.json")
+
+STAGES = ("parse", "categorize", "category lookup", "insert", "queries", "format/other")
+
+# (owner, attribute, stage): wrapped for the duration of the replay
+TIMED = (
+    (message_parser, "parse_transaction", "parse"),
+    (message_parser, "clean_description", "parse"),
+    (crud_category_learning, "predict", "categorize"),
+    (categorizer, "predict", "categorize"),
+    (categorizer, "resolver", "category lookup"),
+    (categorizer, "find_category_id", "category lookup"),
+    (crud, "create_user_transaction", "insert"),
+    (WhatsappAgent, "_get_balance", "queries"),
+    (WhatsappAgent, "_get_recent_transactions", "queries"),
+    (WhatsappAgent, "_get_savings_goal", "queries"),
+    (WhatsappAgent, "_get_categories", "queries"),
+    (WhatsappAgent, "_undo_last_transaction", "queries"),
+)
+
+# Categories the user already has; the rest are created by the agent on first use
+SEEDED_CATEGORIES = (
+    ("Alimentação", "expense"), ("Transporte", "expense"), ("Moradia", "expense"),
+    ("Saúde", "expense"), ("Lazer", "expense"), ("Salário", "income"),
+)
+
+EXPENSES = [
+    "uber", "99 pop", "ifood", "mercado", "supermercado extra", "padaria são joão", "almoço", "jantar com amigos",
+    "farmácia", "drogasil", "posto shell", "gasolina", "aluguel", "condomínio", "conta de luz", "conta de água",
+    "internet vivo", "netflix", "spotify", "academia smart fit", "cinema", "barbearia", "pet shop", "estacionamento",
+    "material escolar", "presente da mãe", "consulta médica", "ração do cachorro", "feira", "açougue",
+]
+INCOMES = ["salário", "freela", "reembolso da empresa", "pix do joão", "aluguel do apartamento", "dividendos", "venda da bike"]
+AMOUNTS = ["12", "25,90", "50", "89,99", "120", "R$ 45", "R$ 230,50", "1200", "3500", "7,50"]
+
+TRANSACTION_TEMPLATES = [
+    (30, "gastei {amount} no {expense}"),
+    (12, "{amount} {expense}"),
+    (10, "{Expense} {amount}"),
+    (8, "paguei {amount} {expense} no pix"),
+    (6, "vou pagar {amount} {expense} dia {day}/{month}"),
+    (5, "comprei {amount} {expense} no cartão ontem"),
+    (5, "compra {amount} {expense} em {n}x no cartão"),
+    (4, "assinatura {expense} {amount} fixo mensal"),
+    (8, "recebi {amount} {income}"),
+    (4, "Recebi {amount} {income} ontem"),
+    (3, "vou receber {amount} {income} amanhã"),
+    (2, "{amount} {expense} pendente"),
+]
+COMMAND_TEMPLATES = [
+    (30, "saldo"), (25, "ultimas"), (15, "meta"), (10, "categorias"), (8, "ajuda"), (7, "desfazer"),
+    (5, "bom dia, tudo certo?"),
+]
+# Share of the corpus that is commands (the rest are transactions)
+COMMAND_SHARE = 0.1
+
+
+def sample_messages(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    weights = [w for w, _ in TRANSACTION_TEMPLATES]
+    command_weights = [w for w, _ in COMMAND_TEMPLATES]
+    messages = []
+    for _ in range(count):
+        if rng.random() < COMMAND_SHARE:
+            messages.append(rng.choices(COMMAND_TEMPLATES, command_weights)[0][1])
+            continue
+        template = rng.choices(TRANSACTION_TEMPLATES, weights)[0][1]
+        expense = rng.choice(EXPENSES)
+        messages.append(template.format(
+            amount=rng.choice(AMOUNTS), expense=expense, Expense=expense.capitalize(), income=rng.choice(INCOMES),
+            day=rng.randint(1, 28), month=rng.randint(1, 12), n=rng.choice([2, 3, 6, 10, 12])
+        ))
+    return messages
+
+
+class StageTimer:
+    """Wraps the TIMED callables to add their wall time to a stage.
+
+    Only the outermost timed call counts, so find_category_id calling resolver
+    isn't counted twice.
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self._active = False
+        self._originals = []
+
+    def _wrap(self, func, stage):
+        def timed(*args, **kwargs):
+            if self._active:
+                return func(*args, **kwargs)
+            self._active = True
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.totals[stage] += time.perf_counter() - started
+                self._active = False
+        return timed
+
+    def install(self):
+        for owner, name, stage in TIMED:
+            # Class attributes are read raw so methods stay methods once wrapped
+            original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+            self._originals.append((owner, name, original, name in vars(owner)))
+            setattr(owner, name, self._wrap(original, stage))
+
+    def uninstall(self):
+        for owner, name, original, own_attribute in reversed(self._originals):
+            if own_attribute:
+                setattr(owner, name, original)
+            else:
+                # A bound method read from the instance: drop the shadowing attribute
+                delattr(owner, name)
+        self._originals = []
+
+
+def seed(db):
+    stamp = time.time_ns()
+    user = models.User(email=f"bench-{stamp}@example.com", hashed_password="x", full_name="Bench", phone_number=f"+55{stamp % 10**11}")
+    workspace = models.Workspace(name="Bench", type="personal")
+    db.add_all([user, workspace])
+    db.flush()
+    db.add(models.UserWorkspace(user_id=user.id, workspace_id=workspace.id, role="owner", status="active"))
+    db.add(models.WorkspaceSettings(workspace_id=workspace.id, monthly_savings_goal=2000.0))
+    for name, tx_type in SEEDED_CATEGORIES:
+        db.add(models.Category(name=name, type=tx_type, user_id=user.id, workspace_id=workspace.id))
+    db.commit()
+    return user, workspace
+
+
+def load_baseline(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, result: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change against the baseline; True if anything regressed past the tolerance."""
+    print(f"\nvs baseline of {baseline['saved_at']} ({baseline['messages']} messages, {baseline['python']}):")
+    if baseline["messages"] != result["messages"]:
+        # Queries and inserts get slower as the ledger grows, so only equal runs compare
+        print(f"  (this run replayed {result['messages']} messages: rerun with --messages {baseline['messages']} to compare)")
+    regressed = False
+    rows = [(stage, result["us_per_msg"][stage], baseline["us_per_msg"].get(stage), False) for stage in STAGES]
+    rows.append(("msgs/s", result["msgs_per_s"], baseline["msgs_per_s"], True))
+    for name, current, previous, higher_is_better in rows:
+        if not previous:
+            continue
+        change = current / previous - 1
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:>16} {previous:>10.1f} -> {current:>10.1f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def run(db_url: str, count: int, warmup: int):
+    engine = create_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user, workspace = seed(db)
+    agent = WhatsappAgent(db, user, workspace.id)
+
+    messages = sample_messages(warmup + count)
+    for message in messages[:warmup]:
+        agent.process_message(message)
+
+    timer = StageTimer()
+    timer.install()
+    try:
+        started = time.perf_counter()
+        for message in messages[warmup:]:
+            agent.process_message(message)
+        elapsed = time.perf_counter() - started
+    finally:
+        timer.uninstall()
+        db.close()
+
+    timer.totals["format/other"] = max(0.0, elapsed - sum(timer.totals.values()))
+    commands = sum(1 for message in messages[warmup:] if normalize(message) in message_parser.COMMANDS)
+    print(f"{count} messages ({commands} commands) in {elapsed:.2f}s: {count / elapsed:,.0f} msgs/s")
+    print(f"{'stage':>16} {'µs/msg':>10} {'share':>8}")
+    for stage in STAGES:
+        print(f"{stage:>16} {timer.totals[stage] / count * 1e6:>10.1f} {timer.totals[stage] / elapsed:>8.1%}")
+
+    return {
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "messages": count,
+        "database": engine.dialect.name,
+        "python": platform.python_version(),
+        "msgs_per_s": round(count / elapsed, 1),
+        "us_per_msg": {stage: round(timer.totals[stage] / count * 1e6, 1) for stage in STAGES},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay WhatsApp messages through the agent.")
+    parser.add_argument("--db-url", default=None, help="SQLAlchemy URL (default: temporary SQLite file)")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    db_url = args.db_url
+    if db_url is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        db_url = f"sqlite:///{path}"
+    result = run(db_url, args.messages, args.warmup)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, result)
+        print(f"\nbaseline saved to {args.baseline}")
+    else:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print("\nno baseline yet (run with --save-baseline)")
+        elif compare(result, baseline, args.tolerance):
+            sys.exit(1)
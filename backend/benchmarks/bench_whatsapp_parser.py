@@ -0,0 +1,156 @@
+"""Messages per second (one core) for the WhatsApp message grammar.
+
+Compares services.message_parser with the previous code path, which ran each
+status/recurrence/date regex in turn, rebuilt the transaction patterns with
+f-strings on every message and cleaned descriptions with a dozen re.sub calls:
+
+    python -m backend.benchmarks.bench_whatsapp_parser
+    python -m backend.benchmarks.bench_whatsapp_parser --messages 200000
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from ..services import message_parser
+from ..smart_categorization import normalize
+
+NOW = datetime(2024, 3, 15, 10, 30)
+
+
+def legacy_parse(message: str):
+    """The pre-grammar WhatsappAgent.process_message, minus the database (same return shape as parse())."""
+    msg = message.strip()
+    msg_lower = normalize(msg)
+    is_future = bool(re.search(r"(?:vou|irei|planejo|agendar|agendado[oa]?|vencimento|para|pro|previsto[oa]?|a pagar|a receber|amanh[aã]|amanha|boleto)", msg_lower))
+    is_paid_explicit = bool(re.search(r"(?:paguei|recebi|gastei|ja|concluido|feito|pago|recebido|quitado|liquidado|hoje|ontem)", msg_lower))
+    payment_method = "Outros"
+    for key, val in message_parser.PAYMENT_METHODS:
+        if key in msg_lower:
+            payment_method = val
+            break
+    if is_future and not is_paid_explicit:
+        status = "pending"
+    elif is_paid_explicit:
+        status = "paid"
+    else:
+        status = "pending" if re.search(r"(?:pendente|aberto|devendo|conta)", msg_lower) else "paid"
+    installment_count = 1
+    installment_match = re.search(r"(\d{1,2})\s*(?:x|vezes|parcelas)", msg_lower)
+    if installment_match:
+        installment_count = int(installment_match.group(1))
+    is_recurring = bool(re.search(r"(mensal|todo mes|todo mês|fixo|recorrente|assinatura)", msg_lower))
+    target_date = NOW
+    date_match = re.search(r"(\d{1,2})\s*[/-]\s*(\d{1,2})(?:\s*[/-]\s*(\d{2,4}))?", msg)
+    if date_match:
+        year = int(date_match.group(3)) if date_match.group(3) else target_date.year
+        try:
+            if year < 100:
+                year += 2000
+            target_date = target_date.replace(day=int(date_match.group(1)), month=int(date_match.group(2)), year=year)
+        except ValueError:
+            pass
+    elif "amanha" in msg_lower:
+        target_date += timedelta(days=1)
+    elif "ontem" in msg_lower:
+        target_date -= timedelta(days=1)
+
+    if msg_lower in message_parser.COMMANDS:
+        return message_parser.COMMANDS[msg_lower]
+
+    verb_prefixes = r"(?:vou|irei|quero|queria|planejo|agendar|agendado[oa]?|preciso|devo|tenho que)?\s*"
+    expense_keywords = r"(?:gastei|paguei|pagar|comprei|compra|pago|gastos|despesa|debito|debitei|assinatura|plano|mensalidade)"
+    income_keywords = r"(?:recebi|receber|ganhei|ganhar|entrada|entrou|ganho|receita|pix|credito|creditei)"
+    found = None
+    match = re.match(rf"^{verb_prefixes}({expense_keywords})\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s*(?:no|na|em|com|de|do|da|pra|pro|para|at[eé]|no\(a\))?\s*(.*)", msg_lower)
+    if match:
+        found = (match.group(2), match.group(3), "expense")
+    if not found:
+        match = re.match(rf"^{verb_prefixes}({income_keywords})\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s*(?:de|do|da|via|por|no|na)?\s*(.*)", msg_lower)
+        if match:
+            found = (match.group(2), match.group(3), "income")
+    if not found:
+        match = re.match(rf"^{verb_prefixes}R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s+(.+)", msg_lower)
+        if match:
+            found = (match.group(1), match.group(2), "expense")
+    if not found:
+        match = re.match(rf"^(.*?)\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)(?:\s+(.*))?$", msg_lower)
+        if match and match.group(1).strip() not in ("ajuda", "saldo", "ultimas", "recentes", "meta"):
+            found = (match.group(2), f"{match.group(1)} {match.group(3) or ''}".strip(), "expense")
+    if not found:
+        return None
+
+    amount_str, description, tx_type = found
+    description = description.strip()
+    description = re.sub(r"^(?:reais|real)\s*", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\b(ontem|hoje|amanhã|amanha)\b", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\b(pix|cartão|cartao|tranferencia|transferencia|boleto|dinheiro|debito|débito|credito|crédito)\b", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\b(em|de)?\s*\d+\s*(?:x|vezes|parcelas)\b", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\b(mensal|todo mes|todo mês|fixo|recorrente|assinatura)\b", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\s+(?:no dia|dia|para|pro|p/|em|primeira|vencimento|venc|1ª|1a)?\s*(?:dia)?\s*\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?$", "", description, flags=re.IGNORECASE).strip()
+    description = re.sub(r"\s+", " ", description)
+    description = re.sub(r"\s+(?:no|na|de|do|da|com|por|via|em|de apenas|primeira|1ª|1a)$", "", description, flags=re.IGNORECASE).strip()
+    if not description:
+        description = "Despesa via WhatsApp" if tx_type == "expense" else "Receita via WhatsApp"
+    else:
+        description = description[0].upper() + description[1:]
+    return (tx_type, amount_str, description, status, target_date, payment_method, installment_count, is_recurring)
+
+
+def parse(message: str):
+    msg = message.strip()
+    normalized = normalize(msg)
+    command = message_parser.COMMANDS.get(normalized)
+    if command:
+        return command
+    parsed = message_parser.parse_transaction(msg, normalized, now=NOW)
+    if parsed is None:
+        return None
+    return (
+        parsed.tx_type, parsed.amount_str, message_parser.clean_description(parsed.description, parsed.tx_type),
+        parsed.status, parsed.custom_date, parsed.payment_method, parsed.installment_count, parsed.is_recurring
+    )
+
+
+TEMPLATES = [
+    "gastei {amount} no {what}", "Paguei {amount} {what} no pix", "vou pagar {amount} {what} dia {day}/04",
+    "compra {amount} {what} em {n}x no cartão", "Recebi {amount} {what} ontem", "{amount} {what}", "{What} {amount}",
+    "assinatura {what} {amount} fixo mensal", "vou receber {amount} {what} amanhã", "saldo", "ultimas", "oi",
+]
+WHAT = ["uber", "mercado", "almoço", "farmácia", "salário", "netflix", "aluguel", "padaria são joão", "conta de luz"]
+
+
+def sample_messages(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        what = rng.choice(WHAT)
+        messages.append(rng.choice(TEMPLATES).format(
+            amount=rng.choice(["50", "12,90", "1200", "R$ 45"]), what=what, What=what.title(),
+            day=rng.randint(1, 28), n=rng.randint(2, 12)
+        ))
+    return messages
+
+
+def run(count: int):
+    messages = sample_messages(count)
+    started = time.perf_counter()
+    legacy = [legacy_parse(m) for m in messages]
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    current = [parse(m) for m in messages]
+    current_time = time.perf_counter() - started
+
+    assert legacy == current, "the grammar disagrees with the legacy parser"
+    print(f"{'parser':>8} {'msgs/s':>10} {'µs/msg':>8}")
+    print(f"{'legacy':>8} {count / legacy_time:>10,.0f} {legacy_time / count * 1e6:>8.1f}")
+    print(f"{'grammar':>8} {count / current_time:>10,.0f} {current_time / count * 1e6:>8.1f}")
+    print(f"speedup: {legacy_time / current_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark WhatsApp message parsing.")
+    parser.add_argument("--messages", type=int, default=50_000)
+    args = parser.parse_args()
+    run(args.messages)
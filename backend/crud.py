@@ -1,11 +1,17 @@
+import logging
 from typing import Optional, List
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_, insert
 from datetime import datetime, timedelta
+import base64
+import heapq
+from types import SimpleNamespace
 from dateutil.relativedelta import relativedelta
-from . import models, schemas, schemas_transaction, schemas_category, schemas_workspace
+from . import models, schemas, schemas_transaction, schemas_category, schemas_workspace, crud_rollups, crud_recurrence, crud_category_learning, data_versions
 from passlib.context import CryptContext
 
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
@@ -40,7 +46,28 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
-def get_transactions(db: Session, user_id: int, workspace_id: Optional[int] = None, skip: int = 0, limit: int = 100, summary_view: bool = False, filter_by: Optional[str] = None):
+def encode_transaction_cursor(transaction: dict, summary_view: bool = False) -> str:
+    """Build the opaque keyset cursor pointing just after `transaction`."""
+    if summary_view:
+        raw = f"i|{transaction['id']}"
+    else:
+        raw = f"d|{transaction['date'].isoformat()}|{transaction['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_transaction_cursor(cursor: str, summary_view: bool = False):
+    """Decode a cursor into (date, id) or (None, id). Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if summary_view and parts[0] == "i" and len(parts) == 2:
+            return None, int(parts[1])
+        if not summary_view and parts[0] == "d" and len(parts) == 3:
+            return datetime.fromisoformat(parts[1]), int(parts[2])
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    raise ValueError(f"Invalid cursor: {cursor}")
+
+def get_transactions(db: Session, user_id: int, workspace_id: Optional[int] = None, skip: int = 0, limit: int = 100, summary_view: bool = False, filter_by: Optional[str] = None, cursor: Optional[str] = None):
     query = db.query(
         models.Transaction, 
         models.Category.name.label("category_name"),
@@ -48,21 +75,24 @@ def get_transactions(db: Session, user_id: int, workspace_id: Optional[int] = No
         models.Category.color.label("category_color")
     ).outerjoin(models.Category, models.Transaction.category_id == models.Category.id)
     
+    # Person filters are kept aside so recurrence rules can be filtered the same way
+    person_filters = []
     if workspace_id:
         query = query.filter(models.Transaction.workspace_id == workspace_id)
         
         # Apply person filter
         if filter_by == "mine":
-            query = query.filter(models.Transaction.created_by_user_id == user_id)
+            person_filters.append(models.Transaction.created_by_user_id == user_id)
         elif filter_by == "partner":
             # Get workspace members excluding current user
             workspace = db.query(models.Workspace).filter(models.Workspace.id == workspace_id).first()
             if workspace:
                 partner_ids = [uw.user_id for uw in workspace.members if uw.user_id != user_id]
-                query = query.filter(models.Transaction.created_by_user_id.in_(partner_ids))
+                person_filters.append(models.Transaction.created_by_user_id.in_(partner_ids))
         elif filter_by == "joint":
-            query = query.filter(models.Transaction.is_joint == True)
+            person_filters.append(models.Transaction.is_joint == True)
         # filter_by == "all" or None: no additional filter
+        query = query.filter(*person_filters)
     else:
         query = query.filter(models.Transaction.user_id == user_id)
 
@@ -77,12 +107,46 @@ def get_transactions(db: Session, user_id: int, workspace_id: Optional[int] = No
         query = query.filter(models.Transaction.parent_id == None)
         
         # Sort by ID desc (inclusion order) for Recent Transactions
-        results = query.order_by(models.Transaction.id.desc())\
-            .offset(skip).limit(limit).all()
+        query = query.order_by(models.Transaction.id.desc())
     else:
-        # Default sort by Date for Statement
-        results = query.order_by(models.Transaction.date.desc())\
-            .offset(skip).limit(limit).all()
+        # Statement shows occurrences, not recurrence rules (their occurrences are merged in below)
+        query = query.filter(models.Transaction.is_recurrence_rule.isnot(True))
+        # Default sort by Date for Statement (id breaks ties so the order is stable for cursors)
+        query = query.order_by(models.Transaction.date.desc(), models.Transaction.id.desc())
+
+    if cursor:
+        # Keyset pagination: seek past the last row of the previous page instead of
+        # making the database scan and discard `skip` rows
+        last_date, last_id = decode_transaction_cursor(cursor, summary_view)
+        if summary_view:
+            query = query.filter(models.Transaction.id < last_id)
+        else:
+            query = query.filter(or_(
+                models.Transaction.date < last_date,
+                and_(models.Transaction.date == last_date, models.Transaction.id < last_id)
+            ))
+
+    # Virtual occurrences of recurrence rules, newest first, up to the listing horizon
+    virtual = []
+    if not summary_view:
+        rules = crud_recurrence.get_rules(db, user_id, workspace_id, *person_filters)
+        if rules:
+            end = crud_recurrence.listing_end()
+            if cursor:
+                end = min(end, last_date + timedelta(microseconds=1))
+            # With a cursor, a rule's occurrence on last_date may be the row the cursor points at
+            # and gets filtered out below: one extra per rule keeps the page full
+            virtual = crud_recurrence.expand(db, rules, end=end, newest_first=True, limit_per_rule=limit + 1 if cursor else skip + limit)
+            if cursor:
+                virtual = [v for v in virtual if (v["date"], v["id"]) < (last_date, last_id)]
+
+    if cursor:
+        results = query.limit(limit).all()
+    elif virtual:
+        # The page position depends on both sources, so merge first and slice after
+        results = query.limit(skip + limit).all()
+    else:
+        results = query.offset(skip).limit(limit).all()
     
     output = []
     for row in results:
@@ -103,136 +167,308 @@ def get_transactions(db: Session, user_id: int, workspace_id: Optional[int] = No
             t_dict['total_value'] = t.amount
 
         output.append(t_dict)
+
+    if virtual:
+        merged = heapq.merge(output, virtual, key=lambda t: (t["date"] or datetime.min, t["id"]), reverse=True)
+        output = list(merged)[0 if cursor else skip:][:limit]
     return output
 
-def create_user_transaction(db: Session, transaction: schemas_transaction.TransactionCreate, user_id: int, workspace_id: Optional[int] = None):
-    # Handle Installments
-    # Determine Status and Approvals for Expenses
-    approval_status = transaction.status if transaction.status else "paid"
-    approver_id = None
-    
-    if workspace_id and transaction.type == "expense":
-        settings = db.query(models.WorkspaceSettings).filter(models.WorkspaceSettings.workspace_id == workspace_id).first()
-        if settings and transaction.amount > settings.approval_threshold:
-             # Find a partner to approve
-             # We pick the first active member who is NOT the creator
-             partner_membership = db.query(models.UserWorkspace).filter(
-                 models.UserWorkspace.workspace_id == workspace_id,
-                 models.UserWorkspace.user_id != user_id,
-                 models.UserWorkspace.status == 'active'
-             ).first()
-             
-             if partner_membership:
-                 approval_status = "pending_approval"
-                 approver_id = partner_membership.user_id
+def installment_rows(transaction: schemas_transaction.TransactionCreate, user_id: int, workspace_id: Optional[int] = None) -> List[dict]:
+    """Column values for every installment of `transaction` (parent_id left for the caller to fill)."""
+    rows = []
+    base = transaction.model_dump(exclude={"installment_number", "parent_id", "date", "amount", "due_date", "reminder", "status", "import_fingerprint"})
 
-    
-    # Handle Installments
-    if transaction.installment_count > 1:
-        first_transaction = None
-        
-        # Calculate base installment amount (rounded down/nearest 2 decimals)
-        total_amount = transaction.amount
-        base_amount = round(total_amount / transaction.installment_count, 2)
-        
-        for i in range(1, transaction.installment_count + 1):
-            # Accurate month shift
-            installment_date = transaction.date + relativedelta(months=i - 1)
-            
-            # Update Due Date if it exists (shift it as well)
-            installment_due_date = None
-            if transaction.due_date:
-                installment_due_date = transaction.due_date + relativedelta(months=i - 1)
-
-            # Determine amount for this installment
-            if i == transaction.installment_count:
-                amount = total_amount - (base_amount * (transaction.installment_count - 1))
-                amount = round(amount, 2)
-            else:
-                amount = base_amount
-
-            db_transaction = models.Transaction(
-                **transaction.model_dump(exclude={"installment_number", "parent_id", "date", "amount", "due_date", "reminder", "status"}),
-                user_id=user_id,
-                created_by_user_id=user_id,
-                workspace_id=workspace_id,
-                installment_number=i,
-                date=installment_date,
-                due_date=installment_due_date,
-                amount=amount,
-                status=transaction.status
-            )
-            if first_transaction:
-                db_transaction.parent_id = first_transaction.id
-            
-            db.add(db_transaction)
-            db.flush() # Get ID
-            if i == 1:
-                first_transaction = db_transaction
-        
-        db.commit()
-        db.refresh(first_transaction)
-        return first_transaction
-
-    # Handle Simple Recurrence (Simple approach: generate first 12 if monthly)
-    if transaction.is_recurring and transaction.recurrence_period == "monthly":
-        first_transaction = None
-        for i in range(1, 13): # Generate 1 year
-            recur_date = transaction.date + relativedelta(months=i - 1)
-            
-            recur_due_date = None
-            if transaction.due_date:
-                recur_due_date = transaction.due_date + relativedelta(months=i - 1)
-
-            db_transaction = models.Transaction(
-                **transaction.model_dump(exclude={"date", "due_date", "reminder", "status"}),
-                user_id=user_id,
-                created_by_user_id=user_id,
-                workspace_id=workspace_id,
-                date=recur_date,
-                due_date=recur_due_date,
-                status=transaction.status
-            )
-            
-            if first_transaction:
-                db_transaction.parent_id = first_transaction.id
+    # Calculate base installment amount (rounded down/nearest 2 decimals)
+    total_amount = transaction.amount
+    base_amount = round(total_amount / transaction.installment_count, 2)
 
-            db.add(db_transaction)
-            if i == 1:
-                db.flush()
-                first_transaction = db_transaction
-        
-        db.commit()
-        db.refresh(first_transaction)
-        return first_transaction
+    for i in range(1, transaction.installment_count + 1):
+        # Accurate month shift
+        installment_date = transaction.date + relativedelta(months=i - 1)
+
+        # Update Due Date if it exists (shift it as well)
+        installment_due_date = None
+        if transaction.due_date:
+            installment_due_date = transaction.due_date + relativedelta(months=i - 1)
+
+        # Determine amount for this installment
+        if i == transaction.installment_count:
+            amount = total_amount - (base_amount * (transaction.installment_count - 1))
+            amount = round(amount, 2)
+        else:
+            amount = base_amount
+
+        rows.append(dict(
+            base,
+            user_id=user_id,
+            created_by_user_id=user_id,
+            workspace_id=workspace_id,
+            installment_number=i,
+            date=installment_date,
+            due_date=installment_due_date,
+            amount=amount,
+            status=transaction.status,
+            parent_id=None,
+            is_recurrence_rule=False,
+            # The statement line maps to the series, not to every installment
+            import_fingerprint=transaction.import_fingerprint if i == 1 else None
+        ))
+    return rows
+
+def transaction_rows(transaction: schemas_transaction.TransactionCreate, user_id: int, workspace_id: Optional[int] = None) -> List[dict]:
+    """Column values for the rows a new transaction expands to; the first is the root.
 
-    # Default Single Transaction
-    db_transaction = models.Transaction(
-        **transaction.model_dump(exclude={"installment_number", "parent_id", "reminder", "status"}),
+    Installments expand to one row per installment (children still need parent_id);
+    recurrences are a single rule row whose occurrences are generated on read (see
+    crud_recurrence); anything else is a single row.
+    """
+    if transaction.installment_count > 1:
+        return installment_rows(transaction, user_id, workspace_id)
+    # A rule keeps the statement line's fingerprint; its occurrences don't inherit it (crud_recurrence.materialize)
+    return [dict(
+        transaction.model_dump(exclude={"installment_number", "parent_id", "reminder", "status"}),
         user_id=user_id,
         created_by_user_id=user_id,
         workspace_id=workspace_id,
-        status=transaction.status
-    )
-        
+        status=transaction.status,
+        installment_number=1,
+        parent_id=None,
+        is_recurrence_rule=crud_recurrence.is_lazy(transaction)
+    )]
+
+def create_user_transaction(db: Session, transaction: schemas_transaction.TransactionCreate, user_id: int, workspace_id: Optional[int] = None):
+    rows = transaction_rows(transaction, user_id, workspace_id)
+
+    # The root goes through the ORM (its id links an installment series); the
+    # children follow in one executemany instead of a flush per installment
+    db_transaction = models.Transaction(**rows[0])
     db.add(db_transaction)
+    children = rows[1:]
+    if children:
+        db.flush()
+        for row in children:
+            row["parent_id"] = db_transaction.id
+        db.execute(insert(models.Transaction), children)
+
+    crud_rollups.add_transactions(db, [db_transaction] + [SimpleNamespace(**row) for row in children])
+    crud_category_learning.learn(db, [db_transaction])
     db.commit()
     db.refresh(db_transaction)
-    
     return db_transaction
 
+def _insert_expanded(db: Session, expanded: List[List[dict]]) -> List[int]:
+    """Insert rows from transaction_rows() for many items; returns the root ids in order. Does not commit.
+
+    Roots go in with one executemany ... RETURNING, installment children with
+    another, and the rollups get a single set of deltas.
+    """
+    root_ids = db.execute(
+        insert(models.Transaction).returning(models.Transaction.id, sort_by_parameter_order=True),
+        [rows[0] for rows in expanded]
+    ).scalars().all()
+
+    children = []
+    for root_id, rows in zip(root_ids, expanded):
+        for row in rows[1:]:
+            row["parent_id"] = root_id
+            children.append(row)
+    if children:
+        db.execute(insert(models.Transaction), children)
+
+    crud_rollups.add_transactions(db, [SimpleNamespace(**row) for rows in expanded for row in rows])
+    crud_category_learning.learn(db, [SimpleNamespace(**rows[0]) for rows in expanded])
+    return list(root_ids)
+
+def create_user_transactions_batch(db: Session, transactions: List[schemas_transaction.TransactionCreate], user_id: int, workspace_id: Optional[int] = None) -> List[int]:
+    """Create many transactions in one DB transaction; returns each item's root id, in order."""
+    expanded = [transaction_rows(transaction, user_id, workspace_id) for transaction in transactions]
+    if not expanded:
+        return []
+
+    try:
+        root_ids = _insert_expanded(db, expanded)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return root_ids
+
+def _with_created(summary: dict, ids: List[int]) -> dict:
+    """`summary` with `ids` counted as created (a copy; the original is untouched)."""
+    updated = dict(summary)
+    updated["created"] += len(ids)
+    if ids:
+        updated["first_id"] = min(ids) if summary["first_id"] is None else min(summary["first_id"], min(ids))
+        updated["last_id"] = max(ids) if summary["last_id"] is None else max(summary["last_id"], max(ids))
+    return updated
+
+def existing_fingerprints(db: Session, user_id: int, workspace_id: Optional[int], fingerprints) -> set:
+    """The subset of `fingerprints` already imported in the scope (unique index lookups)."""
+    fingerprints = list(set(fingerprints))
+    if not fingerprints:
+        return set()
+    # Personal rows are deduplicated among themselves, like the ux_transactions_fingerprint_* indexes
+    scope = models.Transaction.workspace_id == workspace_id if workspace_id else and_(
+        models.Transaction.user_id == user_id, models.Transaction.workspace_id.is_(None)
+    )
+    return {fp for (fp,) in db.query(models.Transaction.import_fingerprint).filter(
+        scope, models.Transaction.import_fingerprint.in_(fingerprints)
+    )}
+
+def import_transactions(db: Session, transactions: List[schemas_transaction.TransactionCreate], user_id: int, workspace_id: Optional[int] = None, chunk_size: int = 500, before_commit=None) -> dict:
+    """Bulk ingest for reviewed imports: insert and commit `chunk_size` items at a time.
+
+    Items whose import_fingerprint is already in the scope (or earlier in the
+    list) are skipped, so re-uploading an overlapping statement is idempotent.
+    A chunk that fails is split in halves and retried, so a bad row only fails
+    itself and costs a few extra round trips rather than one per row.
+    Only counts and the id range are kept, never the created objects.
+    before_commit(summary, done) runs right before every commit, where `done` is how
+    many leading items are settled (created, skipped or failed) once it commits, so
+    callers can stage progress in the same DB transaction as the rows it describes.
+    """
+    summary = {"received": len(transactions), "created": 0, "skipped": 0, "failed": 0, "first_id": None, "last_id": None, "failures": []}
+    seen = set()
+
+    def settle(done: int):
+        # Progress-only commit (nothing inserted)
+        if before_commit:
+            before_commit(summary, done)
+            db.commit()
+
+    def ingest(items, done: int):
+        expanded = [transaction_rows(transaction, user_id, workspace_id) for _, transaction in items]
+        try:
+            ids = _insert_expanded(db, expanded)
+            if before_commit:
+                before_commit(_with_created(summary, ids), done)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(items) == 1:
+                index, transaction = items[0]
+                fingerprint = transaction.import_fingerprint
+                if fingerprint and existing_fingerprints(db, user_id, workspace_id, [fingerprint]):
+                    # Lost a race with a concurrent import of the same line
+                    summary["skipped"] += 1
+                else:
+                    summary["failed"] += 1
+                    summary["failures"].append({"index": index, "error": (str(e).splitlines() or [type(e).__name__])[0]})
+                settle(done)
+                return
+            logger.warning(f"Import chunk at {items[0][0]} failed, splitting ({e})")
+            half = len(items) // 2
+            ingest(items[:half], items[half][0])
+            ingest(items[half:], done)
+            return
+
+        summary.update(_with_created(summary, ids))
+
+    chunk_size = max(1, chunk_size)
+    for offset in range(0, len(transactions), chunk_size):
+        chunk = transactions[offset:offset + chunk_size]
+        duplicates = existing_fingerprints(db, user_id, workspace_id, (t.import_fingerprint for t in chunk if t.import_fingerprint))
+        fresh = []
+        for index, transaction in enumerate(chunk, start=offset):
+            fingerprint = transaction.import_fingerprint
+            if fingerprint and (fingerprint in duplicates or fingerprint in seen):
+                summary["skipped"] += 1
+                continue
+            if fingerprint:
+                seen.add(fingerprint)
+            fresh.append((index, transaction))
+        if fresh:
+            ingest(fresh, offset + len(chunk))
+        else:
+            settle(offset + len(chunk))
+    return summary
+
+EXPORT_COLUMNS = [
+    "id", "date", "description", "amount", "type", "status", "category_name", "payment_method",
+    "tags", "location", "due_date", "paid_at", "installment_number", "installment_count", "is_recurring"
+]
+
+def iter_transactions_for_export(db: Session, user_id: int, workspace_id: Optional[int] = None, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None, batch_size: int = 1000):
+    """Yield export rows (tuples in EXPORT_COLUMNS order) oldest first.
+
+    Uses yield_per so rows are fetched in batches (a server-side cursor on
+    PostgreSQL) and plain column tuples instead of ORM objects, keeping memory
+    constant regardless of how many transactions the scope has.
+    """
+    query = db.query(
+        models.Transaction.id,
+        models.Transaction.date,
+        models.Transaction.description,
+        models.Transaction.amount,
+        models.Transaction.type,
+        models.Transaction.status,
+        models.Category.name,
+        models.Transaction.payment_method,
+        models.Transaction.tags,
+        models.Transaction.location,
+        models.Transaction.due_date,
+        models.Transaction.paid_at,
+        models.Transaction.installment_number,
+        models.Transaction.installment_count,
+        models.Transaction.is_recurring
+    ).outerjoin(models.Category, models.Transaction.category_id == models.Category.id)
+
+    if workspace_id:
+        query = query.filter(models.Transaction.workspace_id == workspace_id)
+    else:
+        query = query.filter(models.Transaction.user_id == user_id)
+    query = query.filter(models.Transaction.is_recurrence_rule.isnot(True))
+    if date_from:
+        query = query.filter(models.Transaction.date >= date_from)
+    if date_to:
+        query = query.filter(models.Transaction.date < date_to)
+
+    # Virtual recurrence occurrences in the range are merged into the stream in order
+    rules = crud_recurrence.get_rules(db, user_id, workspace_id, start=date_from, end=date_to)
+    virtual = [
+        tuple(v[c] for c in EXPORT_COLUMNS)
+        for v in crud_recurrence.expand(db, rules, start=date_from, end=date_to)
+    ]
+
+    rows = (tuple(row) for row in query.order_by(models.Transaction.date.asc(), models.Transaction.id.asc()).yield_per(batch_size))
+    yield from heapq.merge(rows, virtual, key=lambda row: (row[1] or datetime.min, row[0]))
+
 def get_transaction(db: Session, transaction_id: int):
     return db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
 
-def update_user_transaction(db: Session, transaction_id: int, transaction: schemas_transaction.TransactionCreate):
+def update_user_transaction(db: Session, transaction_id: int, transaction: schemas_transaction.TransactionCreate, occurrence: Optional[int] = None):
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
     if not db_transaction:
         return None
+
+    # Editing one occurrence of a recurrence materializes it; editing the rule itself
+    # changes every occurrence that is still virtual
+    if occurrence is not None and db_transaction.is_recurrence_rule:
+        db_transaction = crud_recurrence.materialize(db, db_transaction, occurrence)
+        if not db_transaction:
+            return None
     
+    crud_rollups.remove_transactions(db, [db_transaction])
+    before = SimpleNamespace(
+        description=db_transaction.description,
+        category_id=db_transaction.category_id,
+        user_id=db_transaction.user_id,
+        workspace_id=db_transaction.workspace_id
+    )
+
     # Update fields
-    for key, value in transaction.model_dump(exclude={"installment_number", "parent_id", "reminder"}).items():
+    for key, value in transaction.model_dump(exclude={"installment_number", "parent_id", "reminder", "import_fingerprint"}).items():
         setattr(db_transaction, key, value)
+
+    # A rule that stops recurring becomes a plain transaction
+    if db_transaction.is_recurrence_rule and not crud_recurrence.is_lazy(db_transaction):
+        db_transaction.is_recurrence_rule = False
     
+    crud_rollups.add_transactions(db, [db_transaction])
+    # Recategorizing or renaming is exactly what the learned categorizer learns from
+    # (series count once, through their root)
+    if db_transaction.parent_id is None:
+        crud_category_learning.relearn(db, before, db_transaction)
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
@@ -247,6 +483,27 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
         return None
 
     try:
+        rule = crud_recurrence.rule_for(db_transaction)
+        if rule is not None and delete_type != "all":
+            # Single occurrence of a lazy recurrence: record it as skipped (and drop
+            # its row if it was materialized). Deleting the rule row itself directly
+            # removes the whole series, since the rule is not an occurrence.
+            if month is not None and year is not None:
+                k = crud_recurrence.occurrence_in_month(rule, year, month)
+            elif db_transaction is not rule:
+                k = db_transaction.installment_number
+            else:
+                k = None
+                delete_type = "all"
+
+            if delete_type != "all":
+                if k is None:
+                    return None
+                crud_recurrence.skip_occurrence(db, rule, k)
+                db.commit()
+                print(f"DEBUG CRUD: Skipped occurrence {k} of recurrence {rule.id}")
+                return db_transaction
+
         if delete_type == "all":
             # DELETE ALL RECURRENCES
             # Strategy: If it has a parent_id, the parent is the anchor. If it IS the parent, it is the anchor.
@@ -254,6 +511,12 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
             
             parent_id = db_transaction.parent_id if db_transaction.parent_id else db_transaction.id
             
+            # The series goes away with its root, which is what the learned categorizer counted
+            crud_category_learning.forget(db, [db_transaction if db_transaction.id == parent_id else db_transaction.parent])
+            crud_rollups.remove_matching(
+                db, (models.Transaction.id == parent_id) | (models.Transaction.parent_id == parent_id)
+            )
+
             # Delete children (linked by parent_id)
             db.query(models.Transaction).filter(models.Transaction.parent_id == parent_id).delete()
             
@@ -275,8 +538,7 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
              # Find transaction in this group matching month/year
              target_to_delete = db.query(models.Transaction).filter(
                  (models.Transaction.id == parent_id) | (models.Transaction.parent_id == parent_id),
-                 func.extract('month', models.Transaction.date) == month,
-                 func.extract('year', models.Transaction.date) == year
+                 *month_range_filter(models.Transaction.date, year, month)
              ).first()
              
              if target_to_delete:
@@ -315,7 +577,10 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
                      # Flush changes before deleting the old parent to avoid constraint violations
                      db.add(new_parent)
                      db.flush()
+                 else:
+                     crud_category_learning.forget(db, [target_to_delete])
 
+                 crud_rollups.remove_transactions(db, [target_to_delete])
                  db.delete(target_to_delete)
                  db.commit()
                  print(f"DEBUG CRUD: Deleted specific instance for {month}/{year}")
@@ -328,6 +593,7 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
                      parent.installment_count -= 1
                      db.add(parent)
                  
+                 crud_rollups.remove_transactions(db, [target_to_delete])
                  db.delete(target_to_delete)
                  db.commit()
                  print(f"DEBUG CRUD: Deleted specific child instance {target_to_delete.id}")
@@ -364,6 +630,7 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
                 db.add(new_parent)
                 db.flush()
                 
+                crud_rollups.remove_transactions(db, [db_transaction])
                 db.delete(db_transaction)
                 db.commit()
                 return db_transaction
@@ -375,6 +642,8 @@ def delete_user_transaction(db: Session, transaction_id: int, delete_type: str =
                      parent.installment_count -= 1
                      db.add(parent)
                 
+                crud_rollups.remove_transactions(db, [db_transaction])
+                crud_category_learning.forget(db, [db_transaction])
                 db.delete(db_transaction)
                 db.commit()
                 print("DEBUG CRUD: Delete committed (single/direct)")
@@ -390,6 +659,15 @@ def delete_user_transactions(db: Session, transaction_ids: List[int]):
     
     # Cascade delete for all selected transactions
     try:
+        crud_rollups.remove_matching(
+            db, models.Transaction.id.in_(transaction_ids) | models.Transaction.parent_id.in_(transaction_ids)
+        )
+
+        crud_category_learning.forget(db, db.query(
+            models.Transaction.description, models.Transaction.category_id, models.Transaction.user_id,
+            models.Transaction.workspace_id, models.Transaction.parent_id
+        ).filter(models.Transaction.id.in_(transaction_ids)).all())
+
         # Delete children
         db.query(models.Transaction).filter(models.Transaction.parent_id.in_(transaction_ids)).delete(synchronize_session=False)
         
@@ -421,6 +699,9 @@ def get_credit_cards(db: Session, user_id: int, workspace_id: Optional[int] = No
 def delete_category(db: Session, category_id: int):
     category = db.query(models.Category).filter(models.Category.id == category_id).first()
     if category:
+        data_versions.bump_for(db, category.user_id, category.workspace_id)
+        data_versions.bump_categories(db, category.user_id, category.workspace_id)
+        db.query(models.CategoryTokenCount).filter(models.CategoryTokenCount.category_id == category.id).delete(synchronize_session=False)
         db.delete(category)
         db.commit()
     return category
@@ -434,8 +715,45 @@ def create_planned_income(db: Session, income: schemas_gains.PlannedIncomeCreate
     db.refresh(db_income)
     return db_income
 
+PAID_STATUSES = ["paid", "Pago"]
+# What the upcoming list shows (pending_approval and other statuses are in neither);
+# compared with == so the ix_transactions_upcoming_* partial indexes (status = 'pending') apply
+PENDING_STATUS = "pending"
+
+def get_month_totals(db: Session, user_id: int, workspace_id: Optional[int], year: int, month: int, statuses=None):
+    """{(type, status): (total, count)} for one month: rollups plus virtual recurrence occurrences."""
+    totals = crud_rollups.get_month_totals(db, user_id, workspace_id, year, month, statuses)
+    start = datetime(int(year), int(month), 1)
+    end = start + relativedelta(months=1)
+    criteria = [models.Transaction.status.in_(statuses)] if statuses else []
+    rules = crud_recurrence.get_rules(db, user_id, workspace_id, *criteria, start=start, end=end)
+    for v in crud_recurrence.expand(db, rules, start=start, end=end):
+        total, count = totals.get((v["type"], v["status"]), (0.0, 0))
+        totals[(v["type"], v["status"])] = (total + float(v["amount"] or 0.0), count + 1)
+    return totals
+
+def month_range_filter(column, year: int, month: int):
+    """Half-open [first day, first day of next month) predicates; unlike extract() these can use an index on `column`."""
+    start = datetime(int(year), int(month), 1)
+    return [column >= start, column < start + relativedelta(months=1)]
+
+def _category_breakdown(category_data):
+    breakdown = []
+    total_for_percentage = float(sum([cat.total for cat in category_data]))
+    
+    for cat in category_data:
+        pct = (cat.total / total_for_percentage * 100) if total_for_percentage > 0 else 0
+        breakdown.append({
+            "name": cat.name,
+            "value": float(cat.total),
+            "percentage": round(pct, 1),
+            "limit": float(cat.budget_limit or 0.0),
+            "icon": cat.icon
+        })
+    return breakdown
+
 def get_dashboard_summary(db: Session, user_id: int, workspace_id: Optional[int] = None, month: Optional[int] = None, year: Optional[int] = None, interval: str = "monthly"):
-    from sqlalchemy import extract, cast, Float, func
+    from sqlalchemy import cast, Float, func, case
     
     # Use current month/year if not specified
     now = datetime.now()
@@ -448,47 +766,34 @@ def get_dashboard_summary(db: Session, user_id: int, workspace_id: Optional[int]
     else:
         workspace_filter = models.Transaction.user_id == user_id
 
-    # 1. Main Totals using extract for robustness on PostgreSQL (avoiding date range quirks)
-    income_query = db.query(func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0)).filter(
-        workspace_filter,
-        models.Transaction.type == "income",
-        models.Transaction.status.in_(["paid", "Pago"]),
-        extract('month', models.Transaction.date) == target_month,
-        extract('year', models.Transaction.date) == target_year
-    )
-    
-    expense_query = db.query(func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0)).filter(
-        workspace_filter,
-        models.Transaction.type == "expense",
-        models.Transaction.status.in_(["paid", "Pago"]),
-        extract('month', models.Transaction.date) == target_month,
-        extract('year', models.Transaction.date) == target_year
-    )
-    
-    income = float(income_query.scalar() or 0.0)
-    expenses = float(expense_query.scalar() or 0.0)
+    # 1. Main Totals from the monthly rollups (one small grouped read instead of scanning transactions)
+    month_totals = crud_rollups.get_month_totals(db, user_id, workspace_id, target_year, target_month, PAID_STATUSES)
+    income = sum(total for (tx_type, _), (total, _) in month_totals.items() if tx_type == "income")
+    expenses = sum(total for (tx_type, _), (total, _) in month_totals.items() if tx_type == "expense")
     
     print(f"DEBUG Summary: User={user_id}, Workspace={workspace_id}, Month={target_month}/{target_year}, Income={income}, Expenses={expenses}")
 
-    # Determine Period Range for trends and category breakdown
+    # Determine Period Range for trends and category breakdown.
+    # All ranges are half-open [start, end) so the date predicates stay index-friendly.
     target_date = datetime(target_year, target_month, 1)
     if interval == "monthly":
         period_start = target_date.replace(day=1, hour=0, minute=0, second=0)
-        period_end = period_start + relativedelta(months=1) - timedelta(seconds=1)
+        period_end = period_start + relativedelta(months=1)
     elif interval == "yearly":
         period_start = target_date.replace(month=1, day=1, hour=0, minute=0, second=0)
-        period_end = target_date.replace(month=12, day=31, hour=23, minute=59, second=59)
+        period_end = period_start + relativedelta(years=1)
     elif interval == "weekly":
         period_start = target_date - timedelta(days=target_date.weekday())
         period_start = period_start.replace(hour=0, minute=0, second=0)
-        period_end = period_start + timedelta(days=6, hours=23, minutes=59, seconds=59)
+        period_end = period_start + timedelta(days=7)
     elif interval == "biweekly":
         period_start = target_date - timedelta(days=target_date.weekday())
         period_start = period_start.replace(hour=0, minute=0, second=0)
-        period_end = period_start + timedelta(days=13, hours=23, minutes=59, seconds=59)
+        period_end = period_start + timedelta(days=14)
     else:
         period_start = target_date.replace(day=1, hour=0, minute=0, second=0)
-        period_end = period_start + relativedelta(months=1) - timedelta(seconds=1)
+        period_end = period_start + relativedelta(months=1)
+    period_last_day = period_end - timedelta(days=1)
 
     # 2. Trend Data Calculation
     income_trend = []
@@ -504,7 +809,7 @@ def get_dashboard_summary(db: Session, user_id: int, workspace_id: Optional[int]
             ranges.append({
                 "label": date_point.strftime("%b %Y"),
                 "start": date_point.replace(day=1, hour=0, minute=0, second=0),
-                "end": date_point.replace(day=1) + relativedelta(months=1) - timedelta(seconds=1)
+                "end": date_point.replace(day=1) + relativedelta(months=1)
             })
     elif interval == "yearly":
         for i in range(-2, 3):
@@ -512,7 +817,7 @@ def get_dashboard_summary(db: Session, user_id: int, workspace_id: Optional[int]
             ranges.append({
                 "label": date_point.strftime("%Y"),
                 "start": date_point.replace(month=1, day=1, hour=0, minute=0, second=0),
-                "end": date_point.replace(month=12, day=31, hour=23, minute=59, second=59)
+                "end": date_point.replace(month=1, day=1) + relativedelta(years=1)
             })
     elif interval == "weekly" or interval == "biweekly":
         step = 1 if interval == "weekly" else 2
@@ -520,90 +825,118 @@ def get_dashboard_summary(db: Session, user_id: int, workspace_id: Optional[int]
         for i in range(-points_before, points_after + 1):
             s = start_of_current + timedelta(weeks=i*step)
             s = s.replace(hour=0, minute=0, second=0)
-            e = s + timedelta(days=(7*step)-1, hours=23, minutes=59, seconds=59)
+            e = s + timedelta(days=7*step)
             ranges.append({
-                "label": f"{s.strftime('%d/%m')} - {e.strftime('%d/%m')}",
+                "label": f"{s.strftime('%d/%m')} - {(e - timedelta(days=1)).strftime('%d/%m')}",
                 "start": s,
                 "end": e
             })
     
-    for r in ranges:
-        inc_v = db.query(func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0)).filter(
-            workspace_filter,
-            models.Transaction.type == "income",
-            models.Transaction.status.in_(["paid", "Pago"]),
-            models.Transaction.date >= r["start"],
-            models.Transaction.date <= r["end"]
-        ).scalar()
-        exp_v = db.query(func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0)).filter(
+    # Paid occurrences of recurrence rules are virtual: add them on top of the stored totals
+    month_start = datetime(target_year, target_month, 1)
+    month_end = month_start + relativedelta(months=1)
+    span_start = min([month_start, period_start] + [r["start"] for r in ranges])
+    span_end = max([month_end, period_end] + [r["end"] for r in ranges])
+    rules = crud_recurrence.get_rules(db, user_id, workspace_id, models.Transaction.status.in_(PAID_STATUSES), start=span_start, end=span_end)
+    virtual = crud_recurrence.expand(db, rules, start=span_start, end=span_end)
+
+    def virtual_total(tx_type: str, start: datetime, end: datetime) -> float:
+        return sum(float(v["amount"] or 0.0) for v in virtual if v["type"] == tx_type and start <= v["date"] < end)
+
+    if virtual:
+        income += virtual_total("income", month_start, month_end)
+        expenses += virtual_total("expense", month_start, month_end)
+
+    # Month-aligned intervals read the rollups; week-based ones need the raw rows
+    use_rollups = interval not in ("weekly", "biweekly")
+
+    trend_totals = {}
+    if ranges and use_rollups:
+        series = crud_rollups.get_monthly_series(
+            db, user_id, workspace_id,
+            (ranges[0]["start"].year, ranges[0]["start"].month),
+            ((ranges[-1]["end"] - timedelta(days=1)).year, (ranges[-1]["end"] - timedelta(days=1)).month),
+            PAID_STATUSES
+        )
+        for i, r in enumerate(ranges):
+            first = crud_rollups.month_index(r["start"].year, r["start"].month)
+            last = crud_rollups.month_index(r["end"].year, r["end"].month) - 1
+            for (y, m, tx_type), total in series.items():
+                if first <= crud_rollups.month_index(y, m) <= last:
+                    trend_totals[(i, tx_type)] = trend_totals.get((i, tx_type), 0.0) + total
+    elif ranges:
+        # Bucket every row into its trend range with a CASE expression so income and
+        # expense for all ranges come back from a single grouped query
+        bucket = case(
+            *[
+                (and_(models.Transaction.date >= r["start"], models.Transaction.date < r["end"]), i)
+                for i, r in enumerate(ranges)
+            ],
+            else_=None
+        ).label("bucket")
+        trend_rows = db.query(
+            bucket,
+            models.Transaction.type,
+            func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0)
+        ).filter(
             workspace_filter,
-            models.Transaction.type == "expense",
-            models.Transaction.status.in_(["paid", "Pago"]),
-            models.Transaction.date >= r["start"],
-            models.Transaction.date <= r["end"]
-        ).scalar()
-        
-        income_trend.append({"name": r["label"], "value": float(inc_v or 0.0)})
-        expense_trend.append({"name": r["label"], "value": float(exp_v or 0.0)})
+            models.Transaction.is_recurrence_rule.isnot(True),
+            models.Transaction.type.in_(["income", "expense"]),
+            models.Transaction.status.in_(PAID_STATUSES),
+            models.Transaction.date >= ranges[0]["start"],
+            models.Transaction.date < ranges[-1]["end"]
+        ).group_by(bucket, models.Transaction.type).all()
+
+        for bucket_index, tx_type, total in trend_rows:
+            if bucket_index is not None:
+                trend_totals[(int(bucket_index), tx_type)] = float(total or 0.0)
+
+    for i, r in enumerate(ranges):
+        income_trend.append({"name": r["label"], "value": trend_totals.get((i, "income"), 0.0) + virtual_total("income", r["start"], r["end"])})
+        expense_trend.append({"name": r["label"], "value": trend_totals.get((i, "expense"), 0.0) + virtual_total("expense", r["start"], r["end"])})
 
     # 3. Category breakdown
-    category_query = db.query(
-        models.Category.name,
-        models.Category.icon,
-        models.Category.budget_limit,
-        func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0).label('total')
-    ).join(
-        models.Transaction, models.Transaction.category_id == models.Category.id
-    ).filter(
-        workspace_filter,
-        models.Transaction.type == "expense",
-        models.Transaction.status.in_(["paid", "Pago"]),
-        models.Transaction.date >= period_start,
-        models.Transaction.date <= period_end
-    ).group_by(models.Category.name, models.Category.icon, models.Category.budget_limit)
-    
-    category_data = category_query.all()
-    category_breakdown = []
-    total_expenses_for_percentage = float(sum([cat.total for cat in category_data]))
-    
-    for cat in category_data:
-        pct = (cat.total / total_expenses_for_percentage * 100) if total_expenses_for_percentage > 0 else 0
-        category_breakdown.append({
-            "name": cat.name,
-            "value": float(cat.total),
-            "percentage": round(pct, 1),
-            "limit": float(cat.budget_limit or 0.0),
-            "icon": cat.icon
-        })
+    rules_by_id = {rule.id: rule for rule in rules}
 
-    income_cat_query = db.query(
-        models.Category.name,
-        models.Category.icon,
-        models.Category.budget_limit,
-        func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0).label('total')
-    ).join(
-        models.Transaction, models.Transaction.category_id == models.Category.id
-    ).filter(
-        workspace_filter,
-        models.Transaction.type == "income",
-        models.Transaction.status.in_(["paid", "Pago"]),
-        models.Transaction.date >= period_start,
-        models.Transaction.date <= period_end
-    ).group_by(models.Category.name, models.Category.icon, models.Category.budget_limit)
-    
-    income_cat_data = income_cat_query.all()
-    income_category_breakdown = []
-    total_income_for_percentage = float(sum([cat.total for cat in income_cat_data]))
-    
-    for cat in income_cat_data:
-        pct = (cat.total / total_income_for_percentage * 100) if total_income_for_percentage > 0 else 0
-        income_category_breakdown.append({
-            "name": cat.name,
-            "value": float(cat.total),
-            "percentage": round(pct, 1),
-            "limit": float(cat.budget_limit or 0.0),
-            "icon": cat.icon
-        })
+    def category_totals(tx_type: str):
+        rows = stored_category_totals(tx_type)
+        if not virtual:
+            return rows
+        merged = {(row.name, row.icon, row.budget_limit): float(row.total) for row in rows}
+        for v in virtual:
+            category = rules_by_id[v["id"]].category_rel
+            if category is None or v["type"] != tx_type or not (period_start <= v["date"] < period_end):
+                continue
+            key = (category.name, category.icon, category.budget_limit)
+            merged[key] = merged.get(key, 0.0) + float(v["amount"] or 0.0)
+        return [SimpleNamespace(name=name, icon=icon, budget_limit=limit, total=total) for (name, icon, limit), total in merged.items()]
+
+    def stored_category_totals(tx_type: str):
+        if use_rollups:
+            return crud_rollups.get_category_totals(
+                db, user_id, workspace_id, tx_type,
+                (period_start.year, period_start.month),
+                (period_last_day.year, period_last_day.month),
+                PAID_STATUSES
+            )
+        return db.query(
+            models.Category.name,
+            models.Category.icon,
+            models.Category.budget_limit,
+            func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0).label('total')
+        ).join(
+            models.Transaction, models.Transaction.category_id == models.Category.id
+        ).filter(
+            workspace_filter,
+            models.Transaction.is_recurrence_rule.isnot(True),
+            models.Transaction.type == tx_type,
+            models.Transaction.status.in_(PAID_STATUSES),
+            models.Transaction.date >= period_start,
+            models.Transaction.date < period_end
+        ).group_by(models.Category.name, models.Category.icon, models.Category.budget_limit).all()
+
+    category_breakdown = _category_breakdown(category_totals("expense"))
+    income_category_breakdown = _category_breakdown(category_totals("income"))
 
     return {
         "total_balance": income - expenses,
@@ -632,6 +965,8 @@ def get_categories(db: Session, user_id: int, workspace_id: Optional[int] = None
 def create_user_category(db: Session, category: schemas_category.CategoryCreate, user_id: int, workspace_id: Optional[int] = None):
     db_category = models.Category(**category.model_dump(), user_id=user_id, workspace_id=workspace_id)
     db.add(db_category)
+    data_versions.bump_for(db, user_id, workspace_id)
+    data_versions.bump_categories(db, user_id, workspace_id)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -644,6 +979,8 @@ def update_user_category(db: Session, category_id: int, category: schemas_catego
     for key, value in category.model_dump().items():
         setattr(db_category, key, value)
     
+    data_versions.bump_for(db, db_category.user_id, db_category.workspace_id)
+    data_versions.bump_categories(db, db_category.user_id, db_category.workspace_id)
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -654,7 +991,8 @@ def get_upcoming_transactions(db: Session, user_id: int, workspace_id: Optional[
     effective_date = func.coalesce(models.Transaction.due_date, models.Transaction.date)
     
     query = db.query(models.Transaction).filter(
-        models.Transaction.status == "pending"
+        models.Transaction.status == PENDING_STATUS,
+        models.Transaction.is_recurrence_rule.isnot(True)
     )
     
     if workspace_id:
@@ -662,6 +1000,7 @@ def get_upcoming_transactions(db: Session, user_id: int, workspace_id: Optional[
     else:
         query = query.filter(models.Transaction.user_id == user_id)
 
+    start_date = end_date = None
     if month and year:
         # Filter by specific month and year using effective_date
         try:
@@ -675,9 +1014,20 @@ def get_upcoming_transactions(db: Session, user_id: int, workspace_id: Optional[
         except ValueError:
             pass # Invalid date, ignore filter
         
-    return query.order_by(effective_date.asc()).limit(limit).all()
+    results = query.order_by(effective_date.asc()).limit(limit).all()
+
+    # Pending recurrences contribute their virtual occurrences (windowed by occurrence date)
+    rules = crud_recurrence.get_rules(db, user_id, workspace_id, models.Transaction.status == PENDING_STATUS, start=start_date, end=end_date)
+    if not rules:
+        return results
+    virtual = crud_recurrence.expand(db, rules, start=start_date, end=end_date, limit_per_rule=limit)
 
-def settle_transaction(db: Session, transaction_id: int, user_id: int):
+    def effective(t):
+        return ((t["due_date"] or t["date"]) if isinstance(t, dict) else (t.due_date or t.date)) or datetime.min
+
+    return sorted(results + virtual, key=effective)[:limit]
+
+def settle_transaction(db: Session, transaction_id: int, user_id: int, occurrence: Optional[int] = None):
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
     if not db_transaction:
         return None
@@ -696,11 +1046,21 @@ def settle_transaction(db: Session, transaction_id: int, user_id: int):
             # Personal transaction of another user
             return None
 
+    # Paying a recurrence settles one occurrence (the first open one unless given)
+    if db_transaction.is_recurrence_rule:
+        if occurrence is None:
+            occurrence = crud_recurrence.next_open_occurrence(db, db_transaction)
+        db_transaction = crud_recurrence.materialize(db, db_transaction, occurrence) if occurrence else None
+        if not db_transaction:
+            return None
+
     if db_transaction.status == "paid":
         return db_transaction
 
+    crud_rollups.remove_transactions(db, [db_transaction])
     db_transaction.status = "paid"
     db_transaction.paid_at = datetime.now()
+    crud_rollups.add_transactions(db, [db_transaction])
     
     db.commit()
     db.refresh(db_transaction)
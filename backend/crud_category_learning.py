@@ -0,0 +1,250 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Optional, Iterable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import models, data_versions
+from .response_cache import LRUCache
+from .smart_categorization import normalize
+
+# Per-scope categorizer learned from how users actually categorize.
+# `category_token_counts` is an inverted index: for each scope (same rule as the
+# queries: workspace if set, else user) and description token, how many
+# transactions with that token went to each category. Every create and
+# recategorization updates it with one batched upsert, in the writer's DB
+# transaction. Predictions read an in-memory copy loaded on first use per scope;
+# this process's own writes replace it with a patched copy once their DB
+# transaction commits (nothing on rollback), and other workers pick them up when
+# their copy expires (MODEL_TTL_SECONDS), which is fine for suggestions.
+
+TokenCount = models.CategoryTokenCount
+
+MODEL_TTL_SECONDS = int(os.getenv("LEARNED_MODEL_TTL", "300"))
+# A prediction needs at least this many past transactions behind it...
+MIN_EVIDENCE = 2
+# ...and this share of the token votes
+MIN_CONFIDENCE = 0.6
+# Descriptions are long tails of noise after the first few words
+MAX_TOKENS = 8
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+# Session.info key of the deltas waiting for the commit
+_PENDING = "learned_token_deltas"
+
+
+def tokens(description: str) -> list:
+    """Distinct normalized words worth learning from (no short words or pure numbers)."""
+    seen = []
+    for token in _TOKEN_SPLIT.split(normalize(description or "")):
+        if len(token) >= 3 and not token.isdigit() and token not in seen:
+            seen.append(token)
+            if len(seen) == MAX_TOKENS:
+                break
+    return seen
+
+
+def _scopes(user_id: Optional[int], workspace_id: Optional[int]):
+    # A row counts in every scope it is visible in (like data_versions.bump_for)
+    return [scope for scope in (("user", user_id), ("workspace", workspace_id)) if scope[1] is not None]
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def learn(db: Session, transactions: Iterable, sign: int = 1):
+    """Count (description tokens -> category) of transactions (rows or objects); sign=-1 forgets them.
+
+    One upsert executemany for all of them. Does not commit. Returns how many were counted.
+    """
+    deltas = Counter()
+    counted = 0
+    for tx in transactions:
+        if tx.category_id is None:
+            continue
+        counted += 1
+        for scope, scope_id in _scopes(tx.user_id, tx.workspace_id):
+            for token in tokens(tx.description):
+                deltas[(scope, scope_id, token, tx.category_id)] += sign
+    deltas = {key: count for key, count in deltas.items() if count}
+    if not deltas:
+        return counted
+
+    insert = _insert(db)
+    stmt = insert(TokenCount)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[TokenCount.scope, TokenCount.scope_id, TokenCount.token, TokenCount.category_id],
+            set_={"count": TokenCount.count + stmt.excluded.count}
+        ),
+        [dict(scope=scope, scope_id=scope_id, token=token, category_id=category_id, count=count)
+         for (scope, scope_id, token, category_id), count in deltas.items()]
+    )
+    if sign < 0:
+        # Keep the table compact: drop pairs that were fully forgotten
+        touched = {}
+        for scope, scope_id, token, _ in deltas:
+            touched.setdefault((scope, scope_id), set()).add(token)
+        for (scope, scope_id), scope_tokens in touched.items():
+            db.query(TokenCount).filter(
+                TokenCount.scope == scope,
+                TokenCount.scope_id == scope_id,
+                TokenCount.token.in_(scope_tokens),
+                TokenCount.count <= 0
+            ).delete(synchronize_session=False)
+
+    db.info.setdefault(_PENDING, Counter()).update(deltas)
+    return counted
+
+
+def relearn(db: Session, before, after):
+    """Move the counts of a recategorized/renamed transaction. Does not commit."""
+    if (before.description, before.category_id) == (after.description, after.category_id):
+        return
+    learn(db, [before], sign=-1)
+    learn(db, [after])
+
+
+def forget(db: Session, transactions: Iterable):
+    """Uncount deleted transactions (series roots: children were never counted). Does not commit."""
+    return learn(db, [tx for tx in transactions if tx.parent_id is None], sign=-1)
+
+
+class LearnedModel:
+    """In-memory token -> {category_id: count} for one scope.
+
+    Shared by request threads, so a loaded model is never modified: patched() makes the updated copy.
+    """
+
+    def __init__(self):
+        self.index = {}
+
+    def add(self, token: str, category_id: int, count: int):
+        votes = self.index.setdefault(token, {})
+        votes[category_id] = votes.get(category_id, 0) + count
+        if votes[category_id] <= 0:
+            del votes[category_id]
+
+    def patched(self, changes) -> "LearnedModel":
+        """A copy with (token, category_id, count) changes applied; only the touched tokens are copied deeply."""
+        model = LearnedModel()
+        model.index = dict(self.index)
+        for token in {token for token, _, _ in changes}:
+            model.index[token] = dict(self.index.get(token, {}))
+        for token, category_id, count in changes:
+            model.add(token, category_id, count)
+        return model
+
+    def predict(self, description: str) -> Optional[int]:
+        """Category most of the description's tokens went to, or None without enough evidence. O(tokens)."""
+        scores = Counter()
+        evidence = 0
+        for token in tokens(description):
+            votes = self.index.get(token)
+            if not votes:
+                continue
+            total = sum(votes.values())
+            evidence = max(evidence, total)
+            for category_id, count in votes.items():
+                scores[category_id] += count / total
+        if not scores or evidence < MIN_EVIDENCE:
+            return None
+        category_id, score = scores.most_common(1)[0]
+        return category_id if score / sum(scores.values()) >= MIN_CONFIDENCE else None
+
+
+# (scope, scope_id) -> (loaded_at, LearnedModel)
+model_cache = LRUCache(max_size=int(os.getenv("LEARNED_MODEL_CACHE_SIZE", "256")))
+# Serializes the read-copy-replace of cached models, so concurrent commits don't lose each other's patches
+_patch_lock = threading.Lock()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    deltas = session.info.pop(_PENDING, None)
+    if not deltas:
+        return
+    changes = {}
+    for (scope, scope_id, token, category_id), count in deltas.items():
+        if count:
+            changes.setdefault((scope, scope_id), []).append((token, category_id, count))
+    with _patch_lock:
+        for key, scope_changes in changes.items():
+            cached = model_cache.get(key)
+            if cached:
+                model_cache.set(key, (cached[0], cached[1].patched(scope_changes)))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    # The counts were rolled back with everything else
+    session.info.pop(_PENDING, None)
+
+
+def forget_scopes(scopes: Iterable):
+    """Drop the cached models of (scope, scope_id) pairs whose counts were deleted (call after the commit)."""
+    scopes = set(scopes)
+    model_cache.discard(lambda key, value: key in scopes)
+
+
+def get_model(db: Session, user_id: int, workspace_id: Optional[int] = None) -> LearnedModel:
+    key = data_versions.scope_of(user_id, workspace_id)
+    cached = model_cache.get(key)
+    if cached and time.monotonic() - cached[0] < MODEL_TTL_SECONDS:
+        return cached[1]
+
+    model = LearnedModel()
+    for token, category_id, count in db.query(TokenCount.token, TokenCount.category_id, TokenCount.count).filter(
+        TokenCount.scope == key[0],
+        TokenCount.scope_id == key[1],
+        TokenCount.count > 0
+    ):
+        model.add(token, category_id, count)
+    if not db.info.get(_PENDING):
+        # (a session with uncommitted counts would cache them, then patch them in again at commit)
+        model_cache.set(key, (time.monotonic(), model))
+    return model
+
+
+def predict(db: Session, user_id: int, workspace_id: Optional[int], description: str) -> Optional[int]:
+    return get_model(db, user_id, workspace_id).predict(description)
+
+
+def rebuild(db: Session, batch_size: int = 5000) -> int:
+    """Recompute every scope's counts from categorized transactions. Commits."""
+    db.query(TokenCount).delete(synchronize_session=False)
+    # Series (installments, recurrences) are one categorization: count roots only
+    rows = db.query(
+        models.Transaction.description,
+        models.Transaction.category_id,
+        models.Transaction.user_id,
+        models.Transaction.workspace_id
+    ).filter(
+        models.Transaction.category_id.isnot(None),
+        models.Transaction.parent_id.is_(None)
+    ).yield_per(batch_size)
+    counted = learn(db, rows)
+    db.commit()
+    model_cache.clear()
+    return counted
+
+
+if __name__ == "__main__":
+    # Repair command: python -m backend.crud_category_learning
+    from .database import SessionLocal, create_tables
+
+    create_tables()
+    session = SessionLocal()
+    try:
+        count = rebuild(session)
+        print(f"Learned from {count} transactions.")
+    finally:
+        session.close()
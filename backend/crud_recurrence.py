@@ -0,0 +1,240 @@
+from collections import deque
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Optional, Iterable
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload
+from . import models, crud_rollups, data_versions
+
+# Lazily expanded recurrences.
+# A recurring transaction is stored once, as a rule row (is_recurrence_rule) that
+# holds the template plus the anchor date, period and optional end date.
+# Occurrence k (1-based) falls on anchor + (k - 1) periods and is generated on read.
+# Only occurrences that get paid or edited become real child rows
+# (parent_id = rule, installment_number = k); deleted ones are listed in
+# recurrence_skips. Rule rows never reach the rollups.
+
+PERIOD_STEPS = {
+    "daily": relativedelta(days=1),
+    "weekly": relativedelta(weeks=1),
+    "monthly": relativedelta(months=1),
+    "yearly": relativedelta(years=1),
+}
+
+# How far ahead open-ended rules are expanded when a read has no upper bound
+LISTING_HORIZON = relativedelta(months=12)
+
+
+def listing_end(today: Optional[date] = None) -> datetime:
+    """Exclusive end of reads with no upper bound: LISTING_HORIZON after the end of today.
+
+    Whole days, so the window only moves at midnight (listing ETags include it).
+    """
+    today = today or date.today()
+    return datetime.combine(today + timedelta(days=1), datetime.min.time()) + LISTING_HORIZON
+
+
+def is_lazy(transaction) -> bool:
+    """Whether a new transaction should be stored as a recurrence rule."""
+    return bool(transaction.is_recurring) and transaction.recurrence_period in PERIOD_STEPS and (transaction.installment_count or 1) <= 1
+
+
+def rule_for(transaction) -> Optional[models.Transaction]:
+    """The rule a row belongs to: itself, the rule of a materialized occurrence, or None."""
+    if transaction.is_recurrence_rule:
+        return transaction
+    parent = transaction.parent if transaction.parent_id else None
+    if parent is not None and parent.is_recurrence_rule:
+        return parent
+    return None
+
+
+def occurrence_date(anchor: datetime, period: str, k: int) -> datetime:
+    # Always offset from the anchor so month ends don't drift (Jan 31 -> Feb 29 -> Mar 31)
+    return anchor + PERIOD_STEPS[period] * (k - 1)
+
+
+def parse_skips(rule) -> set:
+    return {int(k) for k in (rule.recurrence_skips or "").split(",") if k.strip()}
+
+
+def _first_index_from(rule, start: Optional[datetime]) -> int:
+    """Smallest k whose occurrence falls on or after `start`."""
+    anchor = rule.date
+    if start is None or start <= anchor:
+        return 1
+    period = rule.recurrence_period
+    # Jump close to `start` without walking every period since the anchor
+    if period == "daily":
+        k = (start - anchor).days
+    elif period == "weekly":
+        k = (start - anchor).days // 7
+    else:
+        months = (start.year - anchor.year) * 12 + (start.month - anchor.month)
+        k = months if period == "monthly" else months // 12
+    k = max(1, k)
+    while occurrence_date(anchor, period, k) < start:
+        k += 1
+    return k
+
+
+def _within_end(rule, occurrence: datetime) -> bool:
+    # The end date is inclusive and compared by day
+    return rule.recurrence_end_date is None or occurrence.date() <= rule.recurrence_end_date.date()
+
+
+def iter_occurrences(rule, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Yield (k, date) for occurrences with start <= date < end, oldest first.
+
+    Skipped occurrences are left out; materialized ones are not (see expand()).
+    Without `end`, open-ended rules stop at listing_end().
+    """
+    if end is None:
+        end = listing_end()
+    skips = parse_skips(rule)
+    k = _first_index_from(rule, start)
+    while True:
+        occurrence = occurrence_date(rule.date, rule.recurrence_period, k)
+        if occurrence >= end or not _within_end(rule, occurrence):
+            return
+        if k not in skips:
+            yield k, occurrence
+        k += 1
+
+
+def get_rules(db: Session, user_id: int, workspace_id: Optional[int], *criteria, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Rules in the scope matching `criteria` that can have occurrences in [start, end)."""
+    query = db.query(models.Transaction).options(
+        joinedload(models.Transaction.category_rel)
+    ).filter(
+        models.Transaction.is_recurrence_rule == True,
+        models.Transaction.workspace_id == workspace_id if workspace_id else models.Transaction.user_id == user_id,
+        *criteria
+    )
+    if end is not None:
+        query = query.filter(models.Transaction.date < end)
+    if start is not None:
+        start_day = datetime.combine(start.date(), datetime.min.time())
+        query = query.filter(or_(
+            models.Transaction.recurrence_end_date.is_(None),
+            models.Transaction.recurrence_end_date >= start_day
+        ))
+    return query.all()
+
+
+def materialized_indexes(db: Session, rule_ids: Iterable[int]) -> dict:
+    """{rule_id: {k, ...}} of occurrences that already exist as rows."""
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return {}
+    rows = db.query(models.Transaction.parent_id, models.Transaction.installment_number).filter(
+        models.Transaction.parent_id.in_(rule_ids)
+    ).all()
+    taken = {}
+    for parent_id, k in rows:
+        taken.setdefault(parent_id, set()).add(k)
+    return taken
+
+
+def virtual_occurrence(rule, k: int, occurrence: Optional[datetime] = None) -> dict:
+    """Occurrence k as a transaction dict (same shape as get_transactions rows)."""
+    data = {c.name: getattr(rule, c.name) for c in rule.__table__.columns}
+    data.update(
+        date=occurrence or occurrence_date(rule.date, rule.recurrence_period, k),
+        due_date=occurrence_date(rule.due_date, rule.recurrence_period, k) if rule.due_date else None,
+        parent_id=rule.id,
+        installment_number=k,
+        is_recurrence_rule=False,
+        recurrence_skips=None,
+        total_value=rule.amount,
+        is_virtual=True
+    )
+    category = rule.category_rel
+    data["category_name"] = category.name if category else None
+    data["category_icon"] = category.icon if category else None
+    data["category_color"] = category.color if category else None
+    return data
+
+
+def expand(db: Session, rules, start: Optional[datetime] = None, end: Optional[datetime] = None, newest_first: bool = False, limit_per_rule: Optional[int] = None) -> list:
+    """Virtual (not materialized) occurrences of `rules` in [start, end), sorted by (date, id).
+
+    limit_per_rule keeps only the first (or, with newest_first, the last) N of each
+    rule, which is all a paginated reader can use.
+    """
+    taken = materialized_indexes(db, [rule.id for rule in rules])
+    output = []
+    for rule in rules:
+        rule_taken = taken.get(rule.id, set())
+        occurrences = ((k, d) for k, d in iter_occurrences(rule, start, end) if k not in rule_taken)
+        if limit_per_rule:
+            occurrences = deque(occurrences, maxlen=limit_per_rule) if newest_first else islice(occurrences, limit_per_rule)
+        output.extend(virtual_occurrence(rule, k, d) for k, d in occurrences)
+    output.sort(key=lambda t: (t["date"], t["id"]), reverse=newest_first)
+    return output
+
+
+def find_materialized(db: Session, rule, k: int) -> Optional[models.Transaction]:
+    return db.query(models.Transaction).filter(
+        models.Transaction.parent_id == rule.id,
+        models.Transaction.installment_number == k
+    ).first()
+
+
+def materialize(db: Session, rule, k: int) -> Optional[models.Transaction]:
+    """Turn occurrence k into a real child row (or return the existing one). Does not commit.
+
+    Returns None if the rule has no occurrence k (out of range or deleted).
+    """
+    existing = find_materialized(db, rule, k)
+    if existing:
+        return existing
+    if k < 1 or k in parse_skips(rule):
+        return None
+    occurrence = occurrence_date(rule.date, rule.recurrence_period, k)
+    if not _within_end(rule, occurrence):
+        return None
+
+    data = {c.name: getattr(rule, c.name) for c in rule.__table__.columns if c.name not in ("id", "created_at")}
+    data.update(
+        date=occurrence,
+        due_date=occurrence_date(rule.due_date, rule.recurrence_period, k) if rule.due_date else None,
+        parent_id=rule.id,
+        installment_number=k,
+        is_recurrence_rule=False,
+        recurrence_skips=None,
+        # The statement line maps to the rule; a copy would break the unique fingerprint index
+        import_fingerprint=None
+    )
+    child = models.Transaction(**data)
+    db.add(child)
+    db.flush()
+    crud_rollups.add_transactions(db, [child])
+    return child
+
+
+def skip_occurrence(db: Session, rule, k: int):
+    """Delete occurrence k (virtual or materialized) from the series. Does not commit."""
+    existing = find_materialized(db, rule, k)
+    if existing:
+        crud_rollups.remove_transactions(db, [existing])
+        db.delete(existing)
+    rule.recurrence_skips = ",".join(str(i) for i in sorted(parse_skips(rule) | {k}))
+    data_versions.bump_for(db, rule.user_id, rule.workspace_id)
+
+
+def occurrence_in_month(rule, year: int, month: int) -> Optional[int]:
+    start = datetime(int(year), int(month), 1)
+    for k, _ in iter_occurrences(rule, start, start + relativedelta(months=1)):
+        return k
+    return None
+
+
+def next_open_occurrence(db: Session, rule) -> Optional[int]:
+    """First occurrence that is still virtual (what paying a rule without naming one settles)."""
+    taken = materialized_indexes(db, [rule.id]).get(rule.id, set())
+    for k, _ in iter_occurrences(rule):
+        if k not in taken:
+            return k
+    return None
@@ -0,0 +1,237 @@
+from typing import Optional, Iterable
+from sqlalchemy.orm import Session
+from sqlalchemy import func, cast, Float, insert, bindparam
+from . import models, data_versions
+
+# Monthly rollups of `transactions`, kept in step with every write so dashboards
+# read a handful of pre-aggregated rows instead of re-scanning raw transactions.
+# Readers always SUM over matching rollup rows, so two concurrent writers that
+# both insert a row for the same key still produce correct totals.
+# Applying a delta also bumps the data version of the scopes it touched, which is
+# what response caches key on.
+
+Rollup = models.TransactionMonthlyRollup
+
+KEY_COLUMNS = ("workspace_id", "user_id", "year", "month", "type", "status", "category_id")
+
+
+def rollup_key(tx) -> Optional[tuple]:
+    # Recurrence rules are templates, not ledger entries (their occurrences are virtual)
+    if tx.date is None or tx.is_recurrence_rule:
+        return None
+    return (tx.workspace_id, tx.user_id, tx.date.year, tx.date.month, tx.type, tx.status, tx.category_id)
+
+
+def apply_deltas(db: Session, deltas: dict, scopes: Optional[set] = None):
+    """Add {key: (amount, count)} deltas to the rollup table (same DB transaction as the caller).
+
+    Existing rows for all keys are found with one read, then updated and inserted
+    with one executemany each, so a long installment series costs three statements.
+    """
+    scopes = set(scopes or ())
+    for key in deltas:
+        scopes.update([("workspace", key[0]), ("user", key[1])])
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+
+    if deltas:
+        indexes = [month_index(key[2], key[3]) for key in deltas]
+        idx = Rollup.year * 12 + (Rollup.month - 1)
+        existing = {}
+        for row in db.query(Rollup.id, *[getattr(Rollup, col) for col in KEY_COLUMNS]).filter(
+            Rollup.user_id.in_({key[1] for key in deltas}),
+            idx >= min(indexes),
+            idx <= max(indexes)
+        ):
+            existing.setdefault(tuple(row[1:]), row[0])
+
+        updates = [
+            {"rollup_id": existing[key], "d_total": amount, "d_count": count}
+            for key, (amount, count) in deltas.items() if key in existing
+        ]
+        inserts = [
+            dict(zip(KEY_COLUMNS, key), total=amount, count=count)
+            for key, (amount, count) in deltas.items() if key not in existing
+        ]
+        table = Rollup.__table__
+        if updates:
+            db.execute(
+                table.update().where(table.c.id == bindparam("rollup_id")).values(
+                    total=table.c.total + bindparam("d_total"),
+                    count=table.c.count + bindparam("d_count")
+                ),
+                updates
+            )
+        if inserts:
+            db.execute(insert(Rollup), inserts)
+    data_versions.bump(db, scopes)
+
+
+def add_transactions(db: Session, transactions: Iterable, sign: int = 1):
+    """Fold transactions into the rollups; sign=-1 removes them."""
+    deltas = {}
+    scopes = set()
+    for tx in transactions:
+        # Versions are bumped even for rows that never reach the rollups (rules)
+        scopes.update([("workspace", tx.workspace_id), ("user", tx.user_id)])
+        key = rollup_key(tx)
+        if key is None:
+            continue
+        amount, count = deltas.get(key, (0.0, 0))
+        deltas[key] = (amount + sign * float(tx.amount or 0.0), count + sign)
+    apply_deltas(db, deltas, scopes)
+
+
+def remove_transactions(db: Session, transactions: Iterable):
+    add_transactions(db, transactions, sign=-1)
+
+
+def _grouped_totals(db: Session, *criteria):
+    year = func.extract("year", models.Transaction.date)
+    month = func.extract("month", models.Transaction.date)
+    return db.query(
+        models.Transaction.workspace_id,
+        models.Transaction.user_id,
+        year,
+        month,
+        models.Transaction.type,
+        models.Transaction.status,
+        models.Transaction.category_id,
+        func.coalesce(func.sum(cast(models.Transaction.amount, Float)), 0.0),
+        func.count(models.Transaction.id)
+    ).filter(
+        models.Transaction.date.isnot(None),
+        models.Transaction.is_recurrence_rule.isnot(True),
+        *criteria
+    ).group_by(
+        models.Transaction.workspace_id,
+        models.Transaction.user_id,
+        year,
+        month,
+        models.Transaction.type,
+        models.Transaction.status,
+        models.Transaction.category_id
+    ).all()
+
+
+def remove_matching(db: Session, *criteria):
+    """Subtract every transaction matching `criteria`. Call before a bulk query.delete()."""
+    deltas = {}
+    for ws_id, user_id, year, month, tx_type, status, category_id, total, count in _grouped_totals(db, *criteria):
+        deltas[(ws_id, user_id, int(year), int(month), tx_type, status, category_id)] = (-float(total), -count)
+    # Recurrence rules have no rollup rows but deleting one still changes what readers see
+    scopes = set()
+    for ws_id, user_id in db.query(models.Transaction.workspace_id, models.Transaction.user_id).filter(
+        models.Transaction.is_recurrence_rule == True, *criteria
+    ).distinct():
+        scopes.update([("workspace", ws_id), ("user", user_id)])
+    apply_deltas(db, deltas, scopes)
+
+
+def rebuild_rollups(db: Session, workspace_id: Optional[int] = None, user_id: Optional[int] = None):
+    """Recompute rollups from raw transactions to repair drift. Commits."""
+    tx_criteria = []
+    rollup_query = db.query(Rollup)
+    if workspace_id:
+        tx_criteria.append(models.Transaction.workspace_id == workspace_id)
+        rollup_query = rollup_query.filter(Rollup.workspace_id == workspace_id)
+    if user_id:
+        tx_criteria.append(models.Transaction.user_id == user_id)
+        rollup_query = rollup_query.filter(Rollup.user_id == user_id)
+
+    rollup_query.delete(synchronize_session=False)
+    rows = _grouped_totals(db, *tx_criteria)
+    for ws_id, u_id, year, month, tx_type, status, category_id, total, count in rows:
+        db.add(Rollup(
+            workspace_id=ws_id,
+            user_id=u_id,
+            year=int(year),
+            month=int(month),
+            type=tx_type,
+            status=status,
+            category_id=category_id,
+            total=float(total),
+            count=count
+        ))
+    data_versions.bump(db, [("workspace", row[0]) for row in rows] + [("user", row[1]) for row in rows])
+    db.commit()
+    return len(rows)
+
+
+# ==================== READERS ====================
+
+def scope_filter(user_id: int, workspace_id: Optional[int] = None):
+    """Same scoping rule as the raw transaction queries: workspace if set, else owner."""
+    if workspace_id:
+        return Rollup.workspace_id == workspace_id
+    return Rollup.user_id == user_id
+
+
+def month_index(year: int, month: int) -> int:
+    return year * 12 + (month - 1)
+
+
+def get_month_totals(db: Session, user_id: int, workspace_id: Optional[int], year: int, month: int, statuses=None):
+    """{(type, status): (total, count)} for one month."""
+    query = db.query(
+        Rollup.type, Rollup.status, func.sum(Rollup.total), func.sum(Rollup.count)
+    ).filter(
+        scope_filter(user_id, workspace_id),
+        Rollup.year == year,
+        Rollup.month == month
+    )
+    if statuses:
+        query = query.filter(Rollup.status.in_(statuses))
+    rows = query.group_by(Rollup.type, Rollup.status).all()
+    return {(tx_type, status): (float(total or 0.0), int(count or 0)) for tx_type, status, total, count in rows}
+
+
+def get_monthly_series(db: Session, user_id: int, workspace_id: Optional[int], start: tuple, end: tuple, statuses):
+    """{(year, month, type): total} for the inclusive (year, month) range start..end."""
+    idx = Rollup.year * 12 + (Rollup.month - 1)
+    rows = db.query(
+        Rollup.year, Rollup.month, Rollup.type, func.sum(Rollup.total)
+    ).filter(
+        scope_filter(user_id, workspace_id),
+        Rollup.status.in_(statuses),
+        idx >= month_index(*start),
+        idx <= month_index(*end)
+    ).group_by(Rollup.year, Rollup.month, Rollup.type).all()
+    return {(year, month, tx_type): float(total or 0.0) for year, month, tx_type, total in rows}
+
+
+def get_category_totals(db: Session, user_id: int, workspace_id: Optional[int], tx_type: str, start: tuple, end: tuple, statuses):
+    """Per-category totals (name, icon, budget_limit, total) for the inclusive month range."""
+    idx = Rollup.year * 12 + (Rollup.month - 1)
+    return db.query(
+        models.Category.name,
+        models.Category.icon,
+        models.Category.budget_limit,
+        func.coalesce(func.sum(Rollup.total), 0.0).label('total')
+    ).join(
+        Rollup, Rollup.category_id == models.Category.id
+    ).filter(
+        scope_filter(user_id, workspace_id),
+        Rollup.type == tx_type,
+        Rollup.status.in_(statuses),
+        idx >= month_index(*start),
+        idx <= month_index(*end)
+    ).group_by(models.Category.name, models.Category.icon, models.Category.budget_limit).all()
+
+
+if __name__ == "__main__":
+    # Repair command: python -m backend.crud_rollups [--workspace ID] [--user ID]
+    import argparse
+    from .database import SessionLocal, create_tables
+
+    parser = argparse.ArgumentParser(description="Rebuild transaction monthly rollups from raw transactions.")
+    parser.add_argument("--workspace", type=int, default=None)
+    parser.add_argument("--user", type=int, default=None)
+    args = parser.parse_args()
+
+    create_tables()
+    session = SessionLocal()
+    try:
+        count = rebuild_rollups(session, workspace_id=args.workspace, user_id=args.user)
+        print(f"Rebuilt {count} rollup rows.")
+    finally:
+        session.close()
@@ -0,0 +1,67 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+from . import models
+
+# Per-scope data version counters. Every write to transactions or categories bumps
+# the counters of the scopes it touches inside the writer's DB transaction, so any
+# worker can tell whether something it cached is stale with a single-row read.
+# Category writes also bump separate "<scope>_categories" counters, so caches that
+# only depend on categories survive transaction writes.
+
+DataVersion = models.DataVersion
+
+
+def scope_of(user_id: int, workspace_id: Optional[int] = None) -> tuple:
+    """Scope a read is filtered by: the workspace when set, else the user (same rule as the queries)."""
+    if workspace_id:
+        return ("workspace", workspace_id)
+    return ("user", user_id)
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def bump(db: Session, scopes):
+    """Increment the version of each (scope, scope_id). Does not commit."""
+    insert = _insert(db)
+    for scope, scope_id in set(scopes):
+        if scope_id is None:
+            continue
+        stmt = insert(DataVersion).values(scope=scope, scope_id=scope_id, version=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DataVersion.scope, DataVersion.scope_id],
+            set_={"version": DataVersion.version + 1}
+        ))
+
+
+def bump_for(db: Session, user_id: Optional[int], workspace_id: Optional[int]):
+    """Bump every scope a row owned by user_id in workspace_id is visible in."""
+    bump(db, [("user", user_id), ("workspace", workspace_id)])
+
+
+def get_version(db: Session, user_id: int, workspace_id: Optional[int] = None) -> int:
+    scope, scope_id = scope_of(user_id, workspace_id)
+    version = db.query(DataVersion.version).filter(
+        DataVersion.scope == scope,
+        DataVersion.scope_id == scope_id
+    ).scalar()
+    return version or 0
+
+
+def bump_categories(db: Session, user_id: Optional[int], workspace_id: Optional[int]):
+    """Bump the category counters of every scope a category is visible in. Does not commit."""
+    bump(db, [("user_categories", user_id), ("workspace_categories", workspace_id)])
+
+
+def get_category_version(db: Session, user_id: int, workspace_id: Optional[int] = None) -> int:
+    scope, scope_id = scope_of(user_id, workspace_id)
+    version = db.query(DataVersion.version).filter(
+        DataVersion.scope == f"{scope}_categories",
+        DataVersion.scope_id == scope_id
+    ).scalar()
+    return version or 0
@@ -1,9 +1,13 @@
 from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Render provides DATABASE_URL, fallback to local sqlite
@@ -61,6 +65,32 @@ def get_db():
     finally:
         db.close()
 
+def _backfill_once(name: str, backfill):
+    """Run a data backfill (which commits) unless a `data_migrations` row says it already ran.
+
+    The row is inserted in the backfill's DB transaction, so when several workers
+    start together one runs it and the others wait on the key, then skip. A failed
+    backfill leaves no row and is retried on the next start.
+    """
+    from .models import DataMigration
+    db = SessionLocal()
+    try:
+        if db.get(DataMigration, name):
+            return
+        db.add(DataMigration(name=name))
+        db.flush()
+        print(f"Migrating: {name}...")
+        backfill(db)
+        print(f"Migration for {name} successful.")
+    except IntegrityError:
+        db.rollback()
+        logger.info(f"Backfill {name} already claimed by another worker")
+    except Exception:
+        db.rollback()
+        logger.exception(f"Backfill {name} failed")
+    finally:
+        db.close()
+
 def create_tables():
     try:
         print("Checking/Creating tables...")
@@ -103,5 +133,48 @@ def create_tables():
                     conn.commit()
                 print(f"Migration for '{col_name}' successful.")
                 
+        # Transactions table migrations
+        columns_tx = [col['name'] for col in inspector.get_columns("transactions")]
+        transaction_migrations = [
+            ('is_recurrence_rule', "ALTER TABLE transactions ADD COLUMN is_recurrence_rule BOOLEAN DEFAULT FALSE"),
+            ('recurrence_skips', "ALTER TABLE transactions ADD COLUMN recurrence_skips VARCHAR"),
+            ('import_fingerprint', "ALTER TABLE transactions ADD COLUMN import_fingerprint VARCHAR"),
+        ]
+
+        for col_name, sql in transaction_migrations:
+            if col_name not in columns_tx:
+                print(f"Migrating: Adding '{col_name}' column to transactions table...")
+                with engine.connect() as conn:
+                    conn.execute(text(sql))
+                    conn.commit()
+                print(f"Migration for '{col_name}' successful.")
+
+        # Import jobs table migrations
+        columns_jobs = [col['name'] for col in inspector.get_columns("import_jobs")]
+        if 'skipped_count' not in columns_jobs:
+            print("Migrating: Adding 'skipped_count' column to import_jobs table...")
+            with engine.connect() as conn:
+                conn.execute(text("ALTER TABLE import_jobs ADD COLUMN skipped_count INTEGER DEFAULT 0"))
+                conn.commit()
+
+        # Indexes added to existing tables (create_all only creates them with new tables)
+        from .models import Transaction
+        with engine.connect() as conn:
+            # Superseded by the ix_transactions_upcoming_* expression indexes
+            conn.execute(text("DROP INDEX IF EXISTS ix_transactions_pending_workspace"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_transactions_pending_user"))
+            conn.commit()
+        for index in Transaction.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+                
     except Exception as e:
-        print(f"Migration check failed: {e}")
+        logger.exception(f"Migration check failed: {e}")
+
+    # Data backfills, gated only on their marker row (so they run even when a schema
+    # migration above failed, and are retried until one succeeds)
+    from .crud_rollups import rebuild_rollups
+    from .crud_category_learning import rebuild
+    # Dashboard rollups from the existing transactions
+    _backfill_once("transaction_monthly_rollups", rebuild_rollups)
+    # Learned categories from the existing history
+    _backfill_once("category_token_counts", rebuild)
@@ -0,0 +1,38 @@
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+
+# Weak ETags for list/summary endpoints. The tag is derived from the scope's data
+# version (see data_versions) plus everything else the response depends on, so
+# checking it costs one single-row read instead of running the real query.
+
+
+def weak_etag(version: int, *parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header (handles lists and '*')."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def conditional_response(request: Request, response: Response, version: int, *parts) -> Optional[Response]:
+    """Return a 304 if the client already has this representation, else tag `response` and return None."""
+    etag = weak_etag(version, request.url.path, sorted(request.query_params.multi_items()), *parts)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,3 @@
+"""Bank statement parsers. Importing a module registers its formats (see base.register)."""
+from .base import PARSERS, StatementFormatError, StatementParser, detect, parse_amount, parse_date, register, supported_extensions
+from . import nubank, ofx, qif
@@ -0,0 +1,57 @@
+import csv
+from .base import register, parse_amount, parse_date
+
+# Nubank CSV exports: the checking account (Data, Valor, Identificador, Descrição)
+# and the credit card bill (date, title, amount, with purchases as positive amounts).
+
+DESCRIPTION_COLUMNS = ('descrição', 'descricao', 'description')
+
+
+def _header(head: str) -> set:
+    first_line = head.splitlines()[0] if head else ""
+    return {col.strip().lower() for col in next(csv.reader([first_line]), [])}
+
+
+def _sniff_checking(head: str) -> bool:
+    columns = _header(head)
+    return 'data' in columns and 'valor' in columns and any(c in columns for c in DESCRIPTION_COLUMNS)
+
+
+def _sniff_card(head: str) -> bool:
+    return {'date', 'title', 'amount'} <= _header(head)
+
+
+def _columns(reader):
+    # Normalized name -> original column name
+    return {col.strip().lower(): col for col in reader.fieldnames or []}
+
+
+@register("nubank_checking", "Nubank (conta)", [".csv"], _sniff_checking)
+def parse_checking(stream):
+    reader = csv.DictReader(stream)
+    norm_to_orig = _columns(reader)
+    data_col = norm_to_orig['data']
+    valor_col = norm_to_orig['valor']
+    desc_col = next(norm_to_orig[c] for c in DESCRIPTION_COLUMNS if c in norm_to_orig)
+
+    for row in reader:
+        yield {
+            "date": parse_date(row.get(data_col) or ''),
+            "description": (row.get(desc_col) or '').strip(),
+            "amount": parse_amount(row.get(valor_col) or '0')
+        }
+
+
+@register("nubank_card", "Nubank (cartão)", [".csv"], _sniff_card)
+def parse_card(stream):
+    reader = csv.DictReader(stream)
+    norm_to_orig = _columns(reader)
+    date_col, title_col, amount_col = norm_to_orig['date'], norm_to_orig['title'], norm_to_orig['amount']
+
+    for row in reader:
+        yield {
+            "date": parse_date(row.get(date_col) or ''),
+            "description": (row.get(title_col) or '').strip(),
+            # The bill lists purchases as positive and payments/refunds as negative
+            "amount": -parse_amount(row.get(amount_col) or '0')
+        }
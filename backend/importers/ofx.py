@@ -0,0 +1,64 @@
+import html
+import re
+from datetime import datetime
+from .base import register, parse_amount
+
+# OFX 1.x (SGML, closing tags optional) and 2.x (XML) statements.
+# Both are read as a flat stream of <TAG>value tokens, a block at a time, so the
+# file is never loaded whole; a transaction is whatever sits between <STMTTRN>
+# and </STMTTRN>.
+
+TOKEN = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+READ_SIZE = 64 * 1024
+
+
+def _sniff(head: str) -> bool:
+    upper = head.upper()
+    return "OFXHEADER" in upper or "<OFX>" in upper
+
+
+def _tokens(stream):
+    buffer = ""
+    while True:
+        block = stream.read(READ_SIZE)
+        if not block:
+            break
+        buffer += block
+        cut = buffer.rfind("<")
+        if cut < 0:
+            continue
+        # Keep an unfinished tag (and the value after the last tag) for the next block
+        for match in TOKEN.finditer(buffer, 0, cut):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+        buffer = buffer[cut:]
+    for match in TOKEN.finditer(buffer):
+        yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+
+
+def _date(value: str) -> datetime:
+    # YYYYMMDD[HHMMSS[.XXX]][[-3:BRT]]; the day is all that matters here
+    digits = value.strip()[:8]
+    try:
+        return datetime(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+    except ValueError:
+        return datetime.now()
+
+
+@register("ofx", "OFX", [".ofx", ".qfx"], _sniff)
+def parse(stream):
+    current = None
+    for closing, tag, value in _tokens(stream):
+        if tag == "STMTTRN":
+            if closing and current is not None:
+                name = current.get("NAME", "")
+                memo = current.get("MEMO", "")
+                yield {
+                    "date": _date(current.get("DTPOSTED", "")),
+                    "description": f"{name} - {memo}" if name and memo and name != memo else (name or memo),
+                    "amount": parse_amount(current.get("TRNAMT", "0"))
+                }
+            current = None if closing else {}
+        elif current is not None and not closing:
+            value = html.unescape(value.strip())
+            if value:
+                current[tag] = value
@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import Optional
+from .base import register, parse_amount, parse_date
+
+# Quicken Interchange Format: one field per line, keyed by its first character,
+# records separated by "^". Only bank/cash/card sections carry transactions.
+
+TRANSACTION_TYPES = ("!TYPE:BANK", "!TYPE:CASH", "!TYPE:CCARD")
+
+
+def _sniff(head: str) -> bool:
+    return head.lstrip("﻿").lstrip().upper().startswith(("!TYPE:", "!OPTION:"))
+
+
+# Day/month order of the numeric dates, chosen once per file
+DATE_FORMATS = {
+    "DMY": ("%d/%m/%Y", "%d/%m/%y"),
+    "MDY": ("%m/%d/%Y", "%m/%d/%y"),
+}
+# Header lines some exporters write to say which order they used
+DATE_OPTIONS = {"!OPTION:DMY": "DMY", "!OPTION:MDY": "MDY"}
+
+
+def _clean(value: str) -> str:
+    # Quicken writes years after 2000 as 1/15'24
+    return value.strip().replace("'", "/").replace(" ", "")
+
+
+def _date_order(value: str) -> Optional[str]:
+    """The order a date proves (a first or second part over 12), or None when it's ambiguous."""
+    parts = _clean(value).replace("-", "/").split("/")
+    if len(parts) != 3 or not (parts[0].isdigit() and parts[1].isdigit()) or len(parts[0]) == 4:
+        return None
+    first, second = int(parts[0]), int(parts[1])
+    if first > 12 >= second:
+        return "DMY"
+    if second > 12 >= first:
+        return "MDY"
+    return None
+
+
+def _date(value: str, order: str = "DMY") -> datetime:
+    value = _clean(value)
+    for fmt in DATE_FORMATS[order] + ("%Y-%m-%d",):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return parse_date(value)
+
+
+def _row(record: dict, order: str) -> dict:
+    payee, memo = record.get("P", ""), record.get("M", "")
+    return {
+        "date": _date(record["D"], order),
+        "description": payee or memo,
+        "amount": parse_amount(record.get("T") or record.get("U") or "0")
+    }
+
+
+@register("qif", "QIF", [".qif"], _sniff)
+def parse(stream):
+    # Until a header or an unambiguous date (13/1 or 1/13) settles the order, records are
+    # held back so every line of the file is read the same way; day/month if nothing does
+    order = None
+    held = []
+    in_transactions = False
+    record = {}
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line.startswith("!"):
+            header = line.strip().upper()
+            if header in DATE_OPTIONS:
+                order = order or DATE_OPTIONS[header]
+                continue
+            in_transactions = header in TRANSACTION_TYPES
+            record = {}
+            continue
+        if not in_transactions:
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == "^":
+            if "D" in record:
+                order = order or _date_order(record["D"])
+                if order is None:
+                    held.append(record)
+                else:
+                    for pending in held:
+                        yield _row(pending, order)
+                    held = []
+                    yield _row(record, order)
+            record = {}
+        elif code not in record:
+            # Split lines (S/E/$) repeat; the first value of a code is the transaction's own
+            record[code] = value
+    for pending in held:
+        yield _row(pending, order or "DMY")
@@ -3,6 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from backend.rate_limiter import limiter
+from backend.response_cache import summary_cache
+from backend.smart_categorization import category_index_cache
+from backend.phone_directory import phone_cache
 from backend.database import engine, Base, create_tables
 from backend.routers import auth as auth_router
 from backend.routers import transactions as transactions_router
@@ -45,6 +48,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 @app.exception_handler(RequestValidationError)
@@ -78,7 +82,14 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    from backend.services import whatsapp_queue
+    return {
+        "status": "healthy",
+        "summary_cache": summary_cache.stats(),
+        "category_index_cache": category_index_cache.stats(),
+        "whatsapp_queue": whatsapp_queue.pool.stats() if whatsapp_queue.pool else None,
+        "phone_cache": phone_cache.stats()
+    }
 
 # Background Task for Price Updates
 import asyncio
@@ -107,6 +118,27 @@ async def update_prices_loop():
             
         await asyncio.sleep(900) # 15 minutes
 
+import_worker_pool = None
+
 @app.on_event("startup")
 async def startup_event():
     asyncio.create_task(update_prices_loop())
+
+    # Background statement imports (jobs queued before a restart resume here)
+    global import_worker_pool
+    from backend.services import import_jobs
+    from backend.database import SessionLocal
+    if import_jobs.IMPORT_WORKERS > 0:
+        import_worker_pool = import_jobs.ImportWorkerPool(SessionLocal)
+        import_worker_pool.start()
+
+    # Fast-ack WhatsApp webhook (needs an outbound sender, e.g. Twilio credentials)
+    from backend.services import whatsapp_queue
+    whatsapp_queue.start_pool(SessionLocal)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if import_worker_pool:
+        import_worker_pool.stop()
+    from backend.services import whatsapp_queue
+    whatsapp_queue.stop_pool()
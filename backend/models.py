@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Index, LargeBinary, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -106,6 +106,33 @@ class CreditCard(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Statement listing / keyset pagination and date-range aggregates per scope
+        Index("ix_transactions_workspace_date", "workspace_id", "date", "id"),
+        Index("ix_transactions_user_date", "user_id", "date", "id"),
+        # Installment / recurrence groups
+        Index("ix_transactions_parent_id", "parent_id"),
+        # Upcoming bills only ever look at pending rows, ordered by their effective date
+        Index(
+            "ix_transactions_upcoming_workspace", "workspace_id", text("coalesce(due_date, date)"),
+            postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")
+        ),
+        Index(
+            "ix_transactions_upcoming_user", "user_id", text("coalesce(due_date, date)"),
+            postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")
+        ),
+        # Import dedup: a statement line can exist once per scope
+        Index(
+            "ux_transactions_fingerprint_workspace", "workspace_id", "import_fingerprint", unique=True,
+            postgresql_where=text("workspace_id IS NOT NULL AND import_fingerprint IS NOT NULL"),
+            sqlite_where=text("workspace_id IS NOT NULL AND import_fingerprint IS NOT NULL")
+        ),
+        Index(
+            "ux_transactions_fingerprint_user", "user_id", "import_fingerprint", unique=True,
+            postgresql_where=text("workspace_id IS NULL AND import_fingerprint IS NOT NULL"),
+            sqlite_where=text("workspace_id IS NULL AND import_fingerprint IS NOT NULL")
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Float)
     description = Column(String)
@@ -137,6 +164,12 @@ class Transaction(Base):
     installment_number = Column(Integer, default=1)
     parent_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
     credit_card_id = Column(Integer, ForeignKey("credit_cards.id"), nullable=True)
+    # Lazy recurrence: the row is a template whose occurrences are generated on read
+    # (see crud_recurrence); only paid/edited occurrences become child rows
+    is_recurrence_rule = Column(Boolean, default=False)
+    recurrence_skips = Column(String, nullable=True) # Deleted occurrence numbers, comma separated
+    # Content hash of the statement line this row was imported from (see services/statement_parser.Fingerprinter)
+    import_fingerprint = Column(String, nullable=True)
 
     owner = relationship("User", foreign_keys=[user_id], back_populates="transactions")
     workspace = relationship("Workspace", back_populates="transactions")
@@ -150,6 +183,106 @@ class Transaction(Base):
     parent = relationship("Transaction", remote_side=[id], back_populates="children")
     children = relationship("Transaction", back_populates="parent")
 
+class TransactionMonthlyRollup(Base):
+    """Pre-aggregated monthly totals of transactions, maintained by crud_rollups."""
+    __tablename__ = "transaction_monthly_rollups"
+    __table_args__ = (
+        Index("ix_rollups_workspace_period", "workspace_id", "year", "month"),
+        Index("ix_rollups_user_period", "user_id", "year", "month"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    workspace_id = Column(Integer, ForeignKey("workspaces.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    year = Column(Integer)
+    month = Column(Integer) # 1-12
+    type = Column(String) # income or expense
+    status = Column(String)
+    category_id = Column(Integer, nullable=True) # No FK: rows outlive deleted categories like transactions do
+    total = Column(Float, default=0.0)
+    count = Column(Integer, default=0)
+
+class DataVersion(Base):
+    """Monotonic change counter per scope ('workspace' or 'user'), bumped by every ledger write."""
+    __tablename__ = "data_versions"
+    __table_args__ = (
+        Index("ix_data_versions_scope", "scope", "scope_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String) # workspace, user
+    scope_id = Column(Integer)
+    version = Column(Integer, default=0)
+
+class DataMigration(Base):
+    """One-off data backfills already run (see database.create_tables). The key makes claiming one atomic."""
+    __tablename__ = "data_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+class CategoryTokenCount(Base):
+    """Learned categorizer: transactions per (scope, description token, category). See crud_category_learning."""
+    __tablename__ = "category_token_counts"
+    __table_args__ = (
+        Index("ix_category_token_counts_key", "scope", "scope_id", "token", "category_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String) # workspace, user
+    scope_id = Column(Integer)
+    token = Column(String)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"))
+    count = Column(Integer, default=0)
+
+class ImportJob(Base):
+    """Background statement import. The table is the queue: workers claim queued rows (see services/import_jobs)."""
+    __tablename__ = "import_jobs"
+    __table_args__ = (
+        Index("ix_import_jobs_status", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    workspace_id = Column(Integer, ForeignKey("workspaces.id"), nullable=True)
+    filename = Column(String)
+    file_size = Column(Integer, default=0)
+    chunk_size = Column(Integer, default=500)
+
+    status = Column(String, default="queued") # queued, running, done, failed
+    worker_id = Column(String, nullable=True)
+    processed_rows = Column(Integer, default=0) # Committed together with the rows, so a resumed job skips exactly these
+    processed_bytes = Column(Integer, default=0)
+    created_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    skipped_count = Column(Integer, default=0) # Lines that were already imported
+    first_id = Column(Integer, nullable=True)
+    last_id = Column(Integer, nullable=True)
+    errors = Column(String, nullable=True) # JSON list of {row, error}, capped
+    error = Column(String, nullable=True) # Why the whole job failed
+
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class ImportJobFile(Base):
+    """The uploaded file of an import job, kept in the database so any worker on any host can run
+    or resume the job. Deleted when the job finishes."""
+    __tablename__ = "import_job_files"
+
+    job_id = Column(Integer, ForeignKey("import_jobs.id"), primary_key=True)
+    data = Column(LargeBinary)
+
+class WhatsappDelivery(Base):
+    """Inbound WhatsApp MessageSids already handled, so Twilio retries don't write twice (see services/whatsapp_deliveries)."""
+    __tablename__ = "whatsapp_deliveries"
+
+    message_sid = Column(String, primary_key=True)
+    phone_number = Column(String)
+    reply = Column(String, nullable=True) # None while the first delivery is being processed
+    created_at = Column(DateTime, default=datetime.now, index=True) # Rows older than DEDUP_TTL_HOURS are purged
+
 class PlannedIncome(Base):
     __tablename__ = "planned_incomes"
     id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,61 @@
+import os
+from collections import namedtuple
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session
+from . import models
+from .response_cache import LRUCache
+
+# Phone number -> who is writing, for the WhatsApp webhook.
+# Resolving a sender takes up to three queries (user by phone, first membership,
+# fallback workspace) before the agent starts; repeat senders get it from an
+# in-process LRU instead. Linking a number and membership changes discard the
+# affected entries here; other processes see them when their entry expires
+# (PHONE_CACHE_TTL), which bounds how long a removed member keeps writing.
+
+# `id` is the user's: the tuple stands in for models.User in WhatsappAgent
+PhoneOwner = namedtuple("PhoneOwner", "id workspace_id name email")
+
+# Unknown numbers are cached too (as None), so spam doesn't hit the database
+_MISSING = object()
+
+phone_cache = LRUCache(
+    max_size=int(os.getenv("PHONE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PHONE_CACHE_TTL", "60"))
+)
+
+
+def _load(db: Session, phone_number: str) -> Optional[PhoneOwner]:
+    user = db.query(models.User).filter(models.User.phone_number == phone_number).first()
+    if not user:
+        return None
+
+    # Workspace linked to the user; fallback to ANY workspace (should ideally be handled better)
+    workspace_link = db.query(models.UserWorkspace.workspace_id).filter(models.UserWorkspace.user_id == user.id).first()
+    if workspace_link:
+        workspace_id = workspace_link[0]
+    else:
+        workspace = db.query(models.Workspace.id).first()
+        workspace_id = workspace[0] if workspace else None
+    return PhoneOwner(user.id, workspace_id, user.full_name, user.email)
+
+
+def resolve(db: Session, phone_number: str) -> Optional[PhoneOwner]:
+    """The user (and workspace) behind a phone number, or None if no account is linked to it."""
+    owner = phone_cache.get(phone_number, _MISSING)
+    if owner is _MISSING:
+        owner = _load(db, phone_number)
+        phone_cache.set(phone_number, owner)
+    return owner
+
+
+def invalidate_phone(phone_number: str):
+    phone_cache.discard(lambda phone, owner: phone == phone_number)
+
+
+def invalidate_users(user_ids: Iterable[int]):
+    user_ids = set(user_ids)
+    phone_cache.discard(lambda phone, owner: owner is not None and owner.id in user_ids)
+
+
+def invalidate_workspace(workspace_id: int):
+    phone_cache.discard(lambda phone, owner: owner is not None and owner.workspace_id == workspace_id)
@@ -1,7 +1,7 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
-from .. import database, schemas_category, crud, auth as auth_service, models
+from .. import database, schemas_category, crud, data_versions, etags, auth as auth_service, models
 
 router = APIRouter(
     prefix="/categories",
@@ -10,10 +10,17 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas_category.Category])
 def read_categories(
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db), 
     current_user: models.User = Depends(auth_service.get_current_active_user),
     workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
+    # Only category writes change this list (transaction writes bump another counter)
+    version = data_versions.get_category_version(db, current_user.id, workspace_id)
+    not_modified = etags.conditional_response(request, response, version, current_user.id, workspace_id)
+    if not_modified:
+        return not_modified
     return crud.get_categories(db, user_id=current_user.id, workspace_id=workspace_id)
 
 @router.post("/", response_model=schemas_category.Category)
@@ -37,13 +37,9 @@ def compare_gains(
         models.PlannedIncome.month == month
     ).scalar() or 0.0
     
-    # Realized
-    realized = db.query(func.sum(models.Transaction.amount)).filter(
-        models.Transaction.user_id == current_user.id,
-        models.Transaction.type == "income",
-        func.strftime('%Y', models.Transaction.date) == str(year),
-        func.strftime('%m', models.Transaction.date) == str(month).zfill(2)
-    ).scalar() or 0.0
+    # Realized (from the monthly rollups)
+    month_totals = crud.get_month_totals(db, current_user.id, None, year, month)
+    realized = sum(total for (tx_type, _), (total, _) in month_totals.items() if tx_type == "income")
     
     return {
         "month": month,
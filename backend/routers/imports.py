@@ -1,149 +1,119 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import csv
-import io
-from datetime import datetime
-from .. import database, schemas_transaction, crud, auth as auth_service, models
-from ..smart_categorization import categorizer
+import os
+from .. import database, schemas_transaction, crud, crud_category_learning, auth as auth_service, models
+from ..smart_categorization import CategoryResolver
+from ..services.statement_parser import StatementFormatError, PreviewStats, iter_statement_rows
+from ..importers import supported_extensions
+from ..services import import_jobs
 
 router = APIRouter(
     prefix="/imports",
     tags=["Imports"]
 )
 
-def parse_date(date_str: str) -> datetime:
-    """Parse date string trying common Brazilian formats."""
-    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%y"):
-        try:
-            return datetime.strptime(date_str.strip(), fmt)
-        except ValueError:
-            continue
-    return datetime.now()
+# Rows returned for review by /preview; the stats always cover the whole file, and the
+# dialog imports the rows past the limit with a background job (POST /jobs?skip_rows=)
+PREVIEW_ROW_LIMIT = int(os.getenv("IMPORT_PREVIEW_ROWS", "1000"))
+DUPLICATE_LOOKUP_BATCH = 500
 
-@router.post("/preview", response_model=List[schemas_transaction.TransactionImportPreview])
-async def preview_import_csv(
+def _check_extension(file: UploadFile):
+    extension = "." + file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else ""
+    if extension not in supported_extensions():
+        raise HTTPException(status_code=400, detail="Formato inválido. Envie um arquivo CSV (Nubank), OFX ou QIF.")
+
+@router.post("/preview", response_model=schemas_transaction.ImportPreview)
+def preview_import_csv(
     file: UploadFile = File(...), 
+    limit: int = Query(PREVIEW_ROW_LIMIT, ge=0, le=10000),
     db: Session = Depends(database.get_db), 
-    current_user: models.User = Depends(auth_service.get_current_active_user)
+    current_user: models.User = Depends(auth_service.get_current_active_user),
+    workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Formato inválido. Por favor envie um arquivo CSV.")
-    
-    content = await file.read()
-    try:
-        text = content.decode('utf-8')
-        reader = csv.DictReader(io.StringIO(text))
-        
-        # Normalize column names
-        if reader.fieldnames is None:
-            raise HTTPException(status_code=400, detail="CSV vazio ou sem cabeçalho.")
-        
-        # Create normalized mapping: original -> lowercase stripped
-        col_map = {col: col.strip().lower() for col in reader.fieldnames}
-        
-        # Find required columns
-        has_data = any(v == 'data' for v in col_map.values())
-        has_valor = any(v == 'valor' for v in col_map.values())
-        has_desc = any(v in ('descrição', 'descricao', 'description') for v in col_map.values())
-        
-        if not (has_data and has_valor and has_desc):
-            raise HTTPException(
-                status_code=400, 
-                detail="Formato do CSV não reconhecido. Certifique-se que é um CSV do Nubank (colunas: Data, Valor, Descrição)."
-            )
-        
-        # Build reverse map: normalized -> original column name
-        norm_to_orig = {v: k for k, v in col_map.items()}
-        data_col = norm_to_orig.get('data', 'data')
-        valor_col = norm_to_orig.get('valor', 'valor')
-        desc_col = norm_to_orig.get('descrição') or norm_to_orig.get('descricao') or norm_to_orig.get('description', 'descrição')
-        
-        rows = list(reader)
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Erro ao ler CSV: {str(e)}")
+    """
+    Parses the upload in one streaming pass (the multipart body is already spooled
+    to a temp file), returning the first `limit` rows for review plus stats for
+    the whole file. Memory stays flat regardless of file size.
+    Lines already imported into the current scope come back with duplicate=True.
+    """
+    _check_extension(file)
 
-    # Get user categories for mapping
-    user_cats = crud.get_categories(db, current_user.id)
+    # Categories of the current scope (workspace if set, else the user's) for mapping
+    user_cats = crud.get_categories(db, current_user.id, workspace_id)
     cat_map = {c.name.lower(): {'id': c.id, 'name': c.name} for c in user_cats}
-    
-    preview_transactions = []
-    
-    for row in rows:
-        description = row.get(desc_col, '').strip()
-        
-        try:
-            amount = float(row.get(valor_col, '0').replace(',', '.').strip())
-        except ValueError:
-            amount = 0.0
-            
-        date_str = row.get(data_col, '')
-        date_obj = parse_date(date_str)
 
-        transaction_type = "income" if amount > 0 else "expense"
-        
-        # Categorization logic
-        desc_upper = description.upper()
-        target_category_name = "Outros"
-        
-        if 'UBER' in desc_upper or 'BARBEARIA' in desc_upper or 'PISTA' in desc_upper:
-             target_category_name = "Alimentação"
-        elif 'TRANSFERÊNCIA ENVIADA' in desc_upper or 'TRANSFERÊNCIA RECEBIDA' in desc_upper:
-             target_category_name = "Transferências"
-        elif 'APLICAÇÃO RDB' in desc_upper or 'RESGATE RDB' in desc_upper:
-             target_category_name = "Investimentos"
-        elif 'PAGAMENTO DE BOLETO' in desc_upper:
-             target_category_name = "Boletos"
-        elif 'PAGAMENTO DE FATURA' in desc_upper:
-             target_category_name = "Fatura"
-        elif any(x in desc_upper for x in ['SYMPLA', 'UNIFIQUE', 'CELESC', 'ULTRAGAZ', 'AMBIENTAL']):
-             target_category_name = "Serviços"
-        elif 'UNINTER' in desc_upper:
-             target_category_name = "Educação"
-        elif 'DEPÓSITO DE EMPRÉSTIMO' in desc_upper:
-             target_category_name = "Empréstimo"
-        elif 'PIX' in desc_upper:
-             target_category_name = "Pix"
-        else:
-             target_category_name = "Não categorizado"
-        
-        # Try to find category ID
-        cat_data = cat_map.get(target_category_name.lower())
-        cat_id = cat_data['id'] if cat_data else None
-        
-        if not cat_id and target_category_name != "Não categorizado":
-             cat_data = cat_map.get('outros')
-             if cat_data:
-                  cat_id = cat_data['id']
-                  target_category_name = "Outros"
-        
-        preview_transactions.append({
-            "date": date_obj,
-            "description": description,
-            "amount": amount,
-            "type": transaction_type,
-            "category_id": cat_id,
-            "category_name": target_category_name if not cat_id else cat_data['name']
-        })
+    rows = []
+    stats = PreviewStats()
+    pending = []
+
+    def flush_pending():
+        # Duplicates are looked up a batch at a time against the fingerprint index
+        duplicates = crud.existing_fingerprints(db, current_user.id, workspace_id, (r["fingerprint"] for r in pending))
+        for row in pending:
+            row["duplicate"] = row["fingerprint"] in duplicates
+            stats.add(row)
+            if len(rows) < limit:
+                rows.append(row)
+        pending.clear()
+
+    try:
+        learned = crud_category_learning.get_model(db, current_user.id, workspace_id)
+        for row in iter_statement_rows(file.file, file.filename, cat_map, CategoryResolver(user_cats), learned):
+            pending.append(row)
+            if len(pending) >= DUPLICATE_LOOKUP_BATCH:
+                flush_pending()
+        flush_pending()
+    except StatementFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo: {str(e)}")
+
+    return {"rows": rows, "stats": stats.as_dict(), "truncated": stats.row_count > len(rows)}
 
-    return preview_transactions
+# Rows inserted and committed per round trip by /confirm (overridable per request)
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
 
-@router.post("/confirm", response_model=List[schemas_transaction.Transaction])
+@router.post("/confirm", response_model=schemas_transaction.ImportSummary)
 def confirm_import(
     transactions: List[schemas_transaction.TransactionCreate],
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=10000),
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth_service.get_current_active_user),
     workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
     """
     Receives a list of transactions (already reviewed by user) and saves them.
+    Returns a summary (counts, created id range, failed rows) instead of the rows.
+    """
+    return crud.import_transactions(db, transactions, current_user.id, workspace_id=workspace_id, chunk_size=chunk_size)
+
+@router.post("/jobs", response_model=schemas_transaction.ImportJobStatus, status_code=202)
+def create_import_job(
+    file: UploadFile = File(...),
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=10000),
+    skip_rows: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth_service.get_current_active_user),
+    workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
+):
+    """
+    Queues the file for import in the background and returns the job right away.
+    Poll GET /imports/jobs/{id} for progress.
+    `skip_rows` leaves out the first rows of the file: the review dialog confirms the
+    previewed rows itself and sends a truncated file here for the rest.
     """
-    created_txs = []
-    for tx_data in transactions:
-        new_tx = crud.create_user_transaction(db, tx_data, current_user.id, workspace_id=workspace_id)
-        created_txs.append(new_tx)
-        
-    return created_txs
+    _check_extension(file)
+    job = import_jobs.enqueue(db, file, current_user.id, workspace_id=workspace_id, chunk_size=chunk_size, skip_rows=skip_rows)
+    return import_jobs.job_status(job)
+
+@router.get("/jobs/{job_id}", response_model=schemas_transaction.ImportJobStatus)
+def get_import_job(
+    job_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth_service.get_current_active_user)
+):
+    job = import_jobs.get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Importação não encontrada")
+    return import_jobs.job_status(job)
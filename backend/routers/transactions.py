@@ -1,7 +1,14 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from .. import database, schemas_transaction, crud, auth as auth_service, models
+from datetime import datetime, date, timedelta
+import csv
+import io
+import json
+from .. import database, schemas_transaction, crud, crud_category_learning, crud_recurrence, data_versions, etags, auth as auth_service, models
+from ..response_cache import summary_cache
+from ..smart_categorization import categorizer
 
 router = APIRouter(
     prefix="/transactions",
@@ -10,23 +17,41 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas_transaction.Transaction])
 def read_transactions(
+    request: Request,
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
     summary_view: bool = False,
     filter_by: Optional[str] = None,  # mine, partner, joint, all
+    cursor: Optional[str] = None,  # opaque keyset cursor from X-Next-Cursor (skip is ignored when set)
     db: Session = Depends(database.get_db), 
     current_user: models.User = Depends(auth_service.get_current_active_user),
     workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
-    return crud.get_transactions(
-        db, 
-        skip=skip, 
-        limit=limit, 
-        user_id=current_user.id, 
-        workspace_id=workspace_id, 
-        summary_view=summary_view,
-        filter_by=filter_by
-    )
+    version = data_versions.get_version(db, current_user.id, workspace_id)
+    # Virtual occurrences run up to listing_end(), which moves every day
+    not_modified = etags.conditional_response(request, response, version, current_user.id, workspace_id, crud_recurrence.listing_end())
+    if not_modified:
+        return not_modified
+
+    try:
+        transactions = crud.get_transactions(
+            db, 
+            skip=skip, 
+            limit=limit, 
+            user_id=current_user.id, 
+            workspace_id=workspace_id, 
+            summary_view=summary_view,
+            filter_by=filter_by,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+
+    # A full page means there may be more rows: hand out the cursor for the next one
+    if limit > 0 and len(transactions) == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_transaction_cursor(transactions[-1], summary_view)
+    return transactions
 
 @router.post("/", response_model=schemas_transaction.Transaction)
 def create_transaction(
@@ -37,8 +62,43 @@ def create_transaction(
 ):
     return crud.create_user_transaction(db=db, transaction=transaction, user_id=current_user.id, workspace_id=workspace_id)
 
+MAX_BATCH_SIZE = 5000
+
+@router.post("/batch", response_model=schemas_transaction.TransactionBatchResult)
+def create_transactions_batch(
+    transactions: List[schemas_transaction.TransactionCreate],
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth_service.get_current_active_user),
+    workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
+):
+    """Create many transactions at once (offline queues, pasted spreadsheets). All or nothing.
+
+    Items without category_id are categorized from their description in one batch.
+    """
+    if len(transactions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote muito grande. Envie no máximo {MAX_BATCH_SIZE} transações por vez.")
+    # Items sent without a category get the predicted one, if the user has it
+    uncategorized = [t for t in transactions if t.category_id is None]
+    if uncategorized:
+        resolver = categorizer.resolver(db, current_user.id, workspace_id)
+        # The user's own history first, then the keyword rules
+        learned = crud_category_learning.get_model(db, current_user.id, workspace_id)
+        for transaction in uncategorized:
+            category_id = learned.predict(transaction.description)
+            if category_id and resolver.name_for(category_id):
+                transaction.category_id = category_id
+        uncategorized = [t for t in uncategorized if t.category_id is None]
+        predictions = categorizer.predict_many([t.description for t in uncategorized], [t.type for t in uncategorized], fallback=False)
+        for transaction, category_name in zip(uncategorized, predictions):
+            if category_name:
+                transaction.category_id = resolver.resolve(category_name)
+    ids = crud.create_user_transactions_batch(db, transactions, user_id=current_user.id, workspace_id=workspace_id)
+    return {"count": len(ids), "ids": ids}
+
 @router.get("/summary", response_model=schemas_transaction.DashboardSummary)
 def read_summary(
+    request: Request,
+    response: Response,
     month: Optional[int] = None,
     year: Optional[int] = None,
     interval: str = "monthly",
@@ -46,7 +106,81 @@ def read_summary(
     current_user: models.User = Depends(auth_service.get_current_active_user),
     workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
-    return crud.get_dashboard_summary(db, user_id=current_user.id, workspace_id=workspace_id, month=month, year=year, interval=interval)
+    now = datetime.now()
+    target_month = month if month is not None else now.month
+    target_year = year if year is not None else now.year
+
+    # Cached per scope and data version: any write in the scope bumps the version
+    # (in the shared database), so every worker misses after a change
+    version = data_versions.get_version(db, current_user.id, workspace_id)
+    not_modified = etags.conditional_response(request, response, version, current_user.id, workspace_id, target_month, target_year)
+    if not_modified:
+        return not_modified
+
+    cache_key = (*data_versions.scope_of(current_user.id, workspace_id), target_month, target_year, interval, version)
+    summary = summary_cache.get(cache_key)
+    if summary is None:
+        summary = crud.get_dashboard_summary(db, user_id=current_user.id, workspace_id=workspace_id, month=target_month, year=target_year, interval=interval)
+        summary_cache.set(cache_key, summary)
+    return summary
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _export_chunks(session: Session, export_format: str, rows_per_chunk: int = 500, **filters):
+    """Serialize export rows in chunks; runs in Starlette's threadpool so it never blocks the event loop."""
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == "csv":
+            writer.writerow(crud.EXPORT_COLUMNS)
+
+        pending = 0
+        for row in crud.iter_transactions_for_export(session, **filters):
+            values = [v.isoformat() if isinstance(v, datetime) else v for v in row]
+            if export_format == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(crud.EXPORT_COLUMNS, values)), ensure_ascii=False))
+                buffer.write("\n")
+            pending += 1
+            if pending >= rows_per_chunk:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        session.close()
+
+@router.get("/export")
+def export_transactions(
+    format: str = "csv",  # csv | ndjson
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),  # inclusive
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth_service.get_current_active_user),
+    workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
+):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use csv ou ndjson.")
+
+    # The stream outlives the request-scoped session, so it reads through its own
+    session = Session(bind=db.get_bind())
+    chunks = _export_chunks(
+        session,
+        format,
+        user_id=current_user.id,
+        workspace_id=workspace_id,
+        date_from=datetime.combine(date_from, datetime.min.time()) if date_from else None,
+        date_to=datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None
+    )
+    filename = f"transacoes.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.get("/{transaction_id}", response_model=schemas_transaction.Transaction)
 def read_transaction(
@@ -63,10 +197,11 @@ def read_transaction(
 def update_transaction(
     transaction_id: int,
     transaction: schemas_transaction.TransactionCreate,
+    occurrence: Optional[int] = None,  # edit only this occurrence of a recurrence
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth_service.get_current_active_user)
 ):
-    updated = crud.update_user_transaction(db, transaction_id, transaction)
+    updated = crud.update_user_transaction(db, transaction_id, transaction, occurrence=occurrence)
     if updated is None:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     return updated
@@ -109,16 +244,19 @@ def bulk_delete_transactions(
 @router.post("/{transaction_id}/pay", response_model=schemas_transaction.Transaction)
 def pay_transaction(
     transaction_id: int,
+    occurrence: Optional[int] = None,  # occurrence of a recurrence to pay (defaults to the first open one)
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth_service.get_current_active_user)
 ):
-    transaction = crud.settle_transaction(db, transaction_id=transaction_id, user_id=current_user.id)
+    transaction = crud.settle_transaction(db, transaction_id=transaction_id, user_id=current_user.id, occurrence=occurrence)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
     return transaction
 
 @router.get("/upcoming/list", response_model=List[schemas_transaction.Transaction])
 def get_upcoming_transactions(
+    request: Request,
+    response: Response,
     limit: int = 10,
     month: Optional[int] = None,
     year: Optional[int] = None,
@@ -126,6 +264,10 @@ def get_upcoming_transactions(
     current_user: models.User = Depends(auth_service.get_current_active_user),
     workspace_id: Optional[int] = Depends(auth_service.get_current_workspace)
 ):
+    version = data_versions.get_version(db, current_user.id, workspace_id)
+    not_modified = etags.conditional_response(request, response, version, current_user.id, workspace_id, crud_recurrence.listing_end())
+    if not_modified:
+        return not_modified
     return crud.get_upcoming_transactions(db, user_id=current_user.id, workspace_id=workspace_id, limit=limit, month=month, year=year)
 
 
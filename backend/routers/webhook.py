@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Form, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from .. import database, models
-from ..services.whatsapp_agent import WhatsappAgent
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from .. import database
+from ..services import whatsapp_deliveries, whatsapp_queue
 from fastapi.responses import Response
 import logging
-import re
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -33,6 +34,7 @@ async def whatsapp_webhook(
     request: Request,
     From: str = Form(...),
     Body: str = Form(...),
+    MessageSid: Optional[str] = Form(None),
     db: Session = Depends(database.get_db)
 ):
     # Log raw info for debugging
@@ -46,57 +48,22 @@ async def whatsapp_webhook(
     
     logger.info(f"📩 Webhook received from: {phone_number}, Body: {message_body}")
 
-    # 1. Try to find user by phone number
-    user = db.query(models.User).filter(models.User.phone_number == phone_number).first()
-    
-    # 2. If not found, check for LINKING command
-    if not user:
-        # Check if message is a linking command: "VINCULAR <EMAIL>"
-        # Regex to capture email, handles 'vincular' with or without accent
-        listing_pattern = r"^[Vv][ÍíIi][Nn][Cc][Uu][Ll][Aa][Rr]\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})$"
-        match = re.search(listing_pattern, message_body)
-        
-        if match:
-            email = match.group(1)
-            logger.info(f"Linking request for email: {email}")
-            
-            target_user = db.query(models.User).filter(models.User.email == email).first()
-            
-            if target_user:
-                # Update user with phone number
-                target_user.phone_number = phone_number
-                db.commit()
-                return Response(content=f"<?xml version='1.0' encoding='UTF-8'?><Response><Message>✅ Vinculado com sucesso! Olá, {target_user.full_name or target_user.email}. Agora você pode lançar despesas direto por aqui.</Message></Response>", media_type="application/xml")
-            else:
-                return Response(content="<?xml version='1.0' encoding='UTF-8'?><Response><Message>❌ E-mail não encontrado no sistema. Verifique e tente novamente: VINCULAR <SEU_EMAIL></Message></Response>", media_type="application/xml")
-        
-        # If not linking command and user not found
-        return Response(content="<?xml version='1.0' encoding='UTF-8'?><Response><Message>👋 Olá! Não reconheci seu número. \n\nPara acessar seu financeiro, vincule sua conta enviando:\n*VINCULAR <SEU_EMAIL_DE_CADASTRO>*</Message></Response>", media_type="application/xml")
-
-    # 3. User Found - Proceed to Agent logic
-    logger.info(f"User identified by phone: {user.email} (ID: {user.id})")
-
-    # Get active workspace (Linked to user)
-    workspace_link = db.query(models.UserWorkspace).filter(models.UserWorkspace.user_id == user.id).first()
-    
-    if workspace_link:
-        workspace_id = workspace_link.workspace_id
-    else:
-        # Fallback: Try to find ANY workspace (should ideally be handled better)
-        workspace = db.query(models.Workspace).first()
-        if workspace:
-            workspace_id = workspace.id
-        else:
-             error_msg = "Erro: Você não tem nenhum workspace vinculado."
-             return Response(content=f"<?xml version='1.0' encoding='UTF-8'?><Response><Message>{error_msg}</Message></Response>", media_type="application/xml")
+    # Fast ack: a worker replies through the outbound sender
+    pool = whatsapp_queue.pool
+    if pool is not None:
+        if MessageSid and whatsapp_deliveries.seen(MessageSid) is not None:
+            # Twilio retry of a message this process already took: its reply goes out once
+            pool.metrics.record_duplicate()
+            return Response(content=whatsapp_queue.EMPTY_TWIML, media_type="application/xml")
+        if pool.submit(phone_number, message_body, MessageSid):
+            return Response(content=whatsapp_queue.EMPTY_TWIML, media_type="application/xml")
+        pool.metrics.record_inline()
 
-    try:
-        agent = WhatsappAgent(db, user, workspace_id)
-        response_text = agent.process_message(message_body)
-        logger.info(f"Agent response: {response_text}")
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
-        response_text = "Desculpe, ocorreu um erro interno."
+    # Inline (no worker pool, or its queue is full): the database work runs off the event loop
+    response_text, is_retry = await run_in_threadpool(whatsapp_queue.handle_delivery, db, phone_number, message_body, MessageSid)
+    if is_retry and response_text == whatsapp_deliveries.IN_PROGRESS:
+        # The first delivery is still being answered
+        return Response(content=whatsapp_queue.EMPTY_TWIML, media_type="application/xml")
     
-    # Return TwiML
-    return Response(content=f"<?xml version='1.0' encoding='UTF-8'?><Response><Message>{response_text}</Message></Response>", media_type="application/xml")
+    # Return TwiML (a retry gets the original reply again)
+    return Response(content=whatsapp_queue.twiml(response_text), media_type="application/xml")
@@ -43,7 +43,12 @@ class TransactionBase(BaseModel):
     credit_card_id: Optional[int] = None
 
 class TransactionCreate(TransactionBase):
-    pass
+    # Set by statement imports (from /imports/preview); a line with a fingerprint is imported once per scope
+    import_fingerprint: Optional[str] = None
+
+class TransactionBatchResult(BaseModel):
+    count: int
+    ids: list[int] # Root id of each created item, in request order
 
 class Transaction(TransactionBase):
     id: int
@@ -58,6 +63,7 @@ class Transaction(TransactionBase):
     paid_at: Optional[datetime] = None
     due_date: Optional[datetime] = None
     total_value: Optional[float] = None # For summary views
+    is_virtual: bool = False # Generated occurrence of a recurrence (id is the rule's, installment_number the occurrence)
 
     class Config:
         from_attributes = True
@@ -89,6 +95,64 @@ class TransactionImportPreview(BaseModel):
     type: str # income / expense
     category_id: Optional[int] = None
     category_name: Optional[str] = None
+    fingerprint: Optional[str] = None # Send back as import_fingerprint on /imports/confirm
+    duplicate: bool = False # Already imported; /imports/confirm will skip it
     
     class Config:
         from_attributes = True
+
+class ImportCategoryStat(BaseModel):
+    name: Optional[str] = None
+    count: int
+    total: float
+
+class ImportPreviewStats(BaseModel):
+    row_count: int
+    date_start: Optional[datetime] = None
+    date_end: Optional[datetime] = None
+    total_income: float
+    total_expenses: float
+    duplicate_count: int = 0
+    categories: list[ImportCategoryStat] = []
+
+class ImportPreview(BaseModel):
+    rows: list[TransactionImportPreview]
+    stats: ImportPreviewStats
+    truncated: bool = False # True when the file has more rows than were returned for review
+
+class ImportFailure(BaseModel):
+    index: int # Position in the submitted list
+    error: str
+
+class ImportSummary(BaseModel):
+    received: int
+    created: int
+    skipped: int = 0 # Already imported (same fingerprint)
+    failed: int
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
+    failures: list[ImportFailure] = []
+
+class ImportJobError(BaseModel):
+    row: int # 1-based data row in the file
+    error: str
+
+class ImportJobStatus(BaseModel):
+    id: int
+    filename: Optional[str] = None
+    status: str # queued, running, done, failed
+    file_size: int
+    processed_bytes: int
+    progress: float # 0..1, by bytes read
+    processed_rows: int
+    created: int
+    skipped: int = 0
+    failed: int
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
+    rows_per_second: float
+    errors: list[ImportJobError] = [] # First few failed rows
+    error: Optional[str] = None # Why the whole job failed
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
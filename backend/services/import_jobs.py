@@ -0,0 +1,272 @@
+import io
+import json
+import logging
+import os
+import socket
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from .. import models, crud, crud_category_learning, schemas_transaction
+from ..smart_categorization import CategoryResolver
+from .statement_parser import StatementFormatError, iter_statement_rows
+
+logger = logging.getLogger(__name__)
+
+# Background statement imports.
+# The upload is stored in `import_job_files` and an `import_jobs` row is queued;
+# that table is the queue. Keeping the file in the database rather than on a local
+# disk lets a worker in any process or host run or resume the job. Workers (threads
+# in every API process) claim the oldest queued job with a conditional UPDATE, so
+# two workers never run the same job, and then parse, categorize and insert it in
+# chunks. Progress is written in the same commit as each chunk, so after a crash
+# the job is requeued once its heartbeat goes stale and resumes right after the
+# last committed row.
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+POLL_SECONDS = float(os.getenv("IMPORT_POLL_SECONDS", "2"))
+# A running job whose heartbeat is older than this is considered abandoned
+STALE_SECONDS = int(os.getenv("IMPORT_STALE_SECONDS", "300"))
+MAX_STORED_ERRORS = 50
+
+
+def enqueue(db: Session, upload, user_id: int, workspace_id: Optional[int] = None, chunk_size: int = 500, skip_rows: int = 0) -> models.ImportJob:
+    """Store an uploaded file and queue a job for it. Commits.
+
+    The first `skip_rows` rows are left out, as if already processed (the review
+    dialog confirms those itself and hands the rest of a long file to a job).
+    """
+    upload.file.seek(0)
+    data = upload.file.read()
+
+    job = models.ImportJob(
+        user_id=user_id,
+        workspace_id=workspace_id,
+        filename=upload.filename,
+        file_size=len(data),
+        chunk_size=chunk_size,
+        processed_rows=skip_rows,
+        status="queued"
+    )
+    db.add(job)
+    db.flush()
+    db.add(models.ImportJobFile(job_id=job.id, data=data))
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[models.ImportJob]:
+    return db.query(models.ImportJob).filter(
+        models.ImportJob.id == job_id,
+        models.ImportJob.user_id == user_id
+    ).first()
+
+
+def requeue_stale(db: Session) -> int:
+    """Put running jobs whose worker stopped heartbeating back in the queue. Commits."""
+    cutoff = datetime.now() - timedelta(seconds=STALE_SECONDS)
+    count = db.query(models.ImportJob).filter(
+        models.ImportJob.status == "running",
+        models.ImportJob.heartbeat_at < cutoff
+    ).update({"status": "queued", "worker_id": None}, synchronize_session=False)
+    db.commit()
+    if count:
+        logger.info(f"Requeued {count} stale import job(s)")
+    return count
+
+
+def claim_next(db: Session, worker_id: str) -> Optional[models.ImportJob]:
+    """Atomically take the oldest queued job, or None if the queue is empty. Commits."""
+    while True:
+        candidate = db.query(models.ImportJob.id).filter(
+            models.ImportJob.status == "queued"
+        ).order_by(models.ImportJob.id).first()
+        if candidate is None:
+            return None
+        now = datetime.now()
+        claimed = db.query(models.ImportJob).filter(
+            models.ImportJob.id == candidate.id,
+            models.ImportJob.status == "queued"
+        ).update({"status": "running", "worker_id": worker_id, "heartbeat_at": now}, synchronize_session=False)
+        db.commit()
+        # Another worker won the race for this one; try the next
+        if claimed:
+            job = db.get(models.ImportJob, candidate.id)
+            if job.started_at is None:
+                job.started_at = now
+                db.commit()
+            return job
+
+
+def _finish(db: Session, job: models.ImportJob, status: str, error: Optional[str] = None):
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.now()
+    job.heartbeat_at = job.finished_at
+    db.query(models.ImportJobFile).filter(models.ImportJobFile.job_id == job.id).delete(synchronize_session=False)
+    db.commit()
+
+
+def _to_create(row: dict) -> schemas_transaction.TransactionCreate:
+    # Same values the review dialog submits for statement lines
+    return schemas_transaction.TransactionCreate(
+        amount=row["amount"],
+        description=row["description"],
+        date=row["date"],
+        type=row["type"],
+        category_id=row["category_id"],
+        payment_method="Credit Card",
+        status="paid",
+        paid_at=row["date"],
+        import_fingerprint=row["fingerprint"]
+    )
+
+
+def run_job(db: Session, job: models.ImportJob):
+    """Process a claimed job from its first unprocessed row to the end."""
+    user_cats = crud.get_categories(db, job.user_id, job.workspace_id)
+    cat_map = {c.name.lower(): {'id': c.id, 'name': c.name} for c in user_cats}
+    chunk_size = max(1, job.chunk_size or 500)
+
+    # Totals committed so far; chunk callbacks add to these, so a rolled back
+    # chunk never leaves half-counted progress behind
+    done_rows = job.processed_rows or 0
+    totals = {"created": job.created_count or 0, "skipped": job.skipped_count or 0, "failed": job.failed_count or 0, "first_id": job.first_id, "last_id": job.last_id}
+    errors = json.loads(job.errors) if job.errors else []
+
+    upload = db.get(models.ImportJobFile, job.id)
+    if upload is None or upload.data is None:
+        _finish(db, job, "failed", "O arquivo desta importação não está mais disponível. Envie o arquivo novamente.")
+        return
+    try:
+        with io.BytesIO(upload.data) as raw:
+            learned = crud_category_learning.get_model(db, job.user_id, job.workspace_id)
+            # Closed before the file, also when a chunk fails, so the parser lets go of it first
+            with closing(iter_statement_rows(raw, job.filename, cat_map, CategoryResolver(user_cats), learned)) as rows:
+                # Rows committed before a restart are parsed again (fingerprints count occurrences) but not inserted
+                for _ in range(done_rows):
+                    next(rows, None)
+
+                batch = []
+                for row in rows:
+                    batch.append(_to_create(row))
+                    if len(batch) >= chunk_size:
+                        done_rows, errors = _ingest(db, job, batch, done_rows, totals, errors, raw.tell())
+                        batch = []
+                if batch:
+                    done_rows, errors = _ingest(db, job, batch, done_rows, totals, errors, raw.tell())
+    except StatementFormatError as e:
+        db.rollback()
+        _finish(db, job, "failed", str(e))
+        return
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"Import job {job.id} failed")
+        _finish(db, job, "failed", f"Erro ao processar arquivo: {str(e)}")
+        return
+
+    job.processed_bytes = job.file_size
+    _finish(db, job, "done")
+
+
+def _ingest(db: Session, job: models.ImportJob, batch: list, done_rows: int, totals: dict, errors: list, position: int):
+    """Insert one parsed batch, committing job progress together with each chunk."""
+    def before_commit(summary: dict, done: int):
+        job.processed_rows = done_rows + done
+        # The reader runs ahead of the rows in buffered blocks, so bytes are approximate
+        job.processed_bytes = min(position, job.file_size or position)
+        job.created_count = totals["created"] + summary["created"]
+        job.skipped_count = totals["skipped"] + summary["skipped"]
+        job.failed_count = totals["failed"] + summary["failed"]
+        job.first_id = summary["first_id"] if totals["first_id"] is None else totals["first_id"]
+        job.last_id = summary["last_id"] if summary["last_id"] is not None else totals["last_id"]
+        failures = [{"row": done_rows + f["index"] + 1, "error": f["error"]} for f in summary["failures"]]
+        job.errors = json.dumps((errors + failures)[:MAX_STORED_ERRORS])
+        job.heartbeat_at = datetime.now()
+
+    summary = crud.import_transactions(db, batch, job.user_id, workspace_id=job.workspace_id, chunk_size=job.chunk_size or 500, before_commit=before_commit)
+
+    totals["created"] += summary["created"]
+    totals["skipped"] += summary["skipped"]
+    totals["failed"] += summary["failed"]
+    if totals["first_id"] is None:
+        totals["first_id"] = summary["first_id"]
+    if summary["last_id"] is not None:
+        totals["last_id"] = summary["last_id"]
+    failures = [{"row": done_rows + f["index"] + 1, "error": f["error"]} for f in summary["failures"]]
+    return done_rows + len(batch), (errors + failures)[:MAX_STORED_ERRORS]
+
+
+def process_next(db: Session, worker_id: str) -> Optional[models.ImportJob]:
+    """Requeue abandoned jobs, then claim and run one. Returns the job, or None if idle."""
+    requeue_stale(db)
+    job = claim_next(db, worker_id)
+    if job is None:
+        return None
+    logger.info(f"Worker {worker_id} running import job {job.id} from row {job.processed_rows}")
+    run_job(db, job)
+    return job
+
+
+def job_status(job: models.ImportJob) -> dict:
+    """Progress report for GET /imports/jobs/{id}."""
+    end = job.finished_at or datetime.now()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0.0
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "file_size": job.file_size or 0,
+        "processed_bytes": job.processed_bytes or 0,
+        "progress": round((job.processed_bytes or 0) / job.file_size, 4) if job.file_size else 0.0,
+        "processed_rows": job.processed_rows or 0,
+        "created": job.created_count or 0,
+        "skipped": job.skipped_count or 0,
+        "failed": job.failed_count or 0,
+        "first_id": job.first_id,
+        "last_id": job.last_id,
+        "rows_per_second": round((job.processed_rows or 0) / elapsed, 1) if elapsed > 0 else 0.0,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+
+class ImportWorkerPool:
+    """Daemon threads polling the job table, each with its own session."""
+
+    def __init__(self, session_factory, size: int = IMPORT_WORKERS):
+        self.session_factory = session_factory
+        self.size = size
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for n in range(self.size):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{n}"
+            thread = threading.Thread(target=self._loop, args=(worker_id,), name=f"import-worker-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def _loop(self, worker_id: str):
+        while not self.stop_event.is_set():
+            db = self.session_factory()
+            try:
+                job = process_next(db, worker_id)
+            except Exception as e:
+                logger.exception(f"Import worker {worker_id} error")
+                job = None
+            finally:
+                db.close()
+            if job is None:
+                self.stop_event.wait(POLL_SECONDS)
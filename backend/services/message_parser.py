@@ -0,0 +1,169 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Optional
+
+# Grammar of WhatsApp messages, compiled once at import.
+# A message is either an exact command ("saldo", "ajuda", ...) or a transaction.
+# For a transaction, one anchored match picks the pattern (expense, income,
+# "<amount> <desc>", "<desc> <amount>") in the order WhatsappAgent always tried
+# them, a few short-circuiting searches read status, recurrence and installments,
+# and the description cleanup skips the digit-only rules for text without digits.
+# Input is normalized (smart_categorization.normalize: lowercase, no accents)
+# except for dates, so no pattern needs IGNORECASE.
+
+# Normalized text -> WhatsappAgent command
+COMMANDS = {
+    **dict.fromkeys(("ajuda", "help", "menu", "oi", "ola", "hey", "bom dia", "boa tarde", "boa noite", "oi!"), "help"),
+    **dict.fromkeys(("saldo", "resumo", "balanco"), "balance"),
+    **dict.fromkeys(("ultimas", "historico", "extrato", "recentes"), "recent"),
+    **dict.fromkeys(("meta", "metas", "objetivo"), "goal"),
+    **dict.fromkeys(("categorias", "minhas categorias", "cats"), "categories"),
+    **dict.fromkeys(("desfazer", "cancelar", "cancelar ultimo", "anular"), "undo"),
+}
+
+# Status markers are substrings, not words ("para" also hits "reparo"): kept that way on purpose.
+# Future verbs or intent
+_FUTURE = re.compile(r"vou|irei|planejo|agendar|agendado[oa]?|vencimento|para|pro|previsto[oa]?|a pagar|a receber|amanh[aã]|amanha|boleto")
+# Past verbs or confirmation
+_PAID = re.compile(r"paguei|recebi|gastei|ja|concluido|feito|pago|recebido|quitado|liquidado|hoje|ontem")
+_PENDING = re.compile(r"pendente|aberto|devendo|conta")
+_RECURRING = re.compile(r"mensal|todo mes|todo mês|fixo|recorrente|assinatura")
+# "10x", "em 10 vezes", "10 parcelas"
+_INSTALLMENTS = re.compile(r"(\d{1,2})\s*(?:x|vezes|parcelas)")
+
+# Checked in this order, first one contained in the message wins
+PAYMENT_METHODS = (
+    ("pix", "Pix"),
+    ("cartao", "Cartão"),
+    ("transferencia", "Transferência"),
+    ("boleto", "Boleto"),
+    ("dinheiro", "Dinheiro"),
+    ("debito", "Débito"),
+    ("credito", "Crédito"),
+)
+
+# DD/MM or DD/MM/YYYY (spaces around the slash/dash allowed)
+_DATE = re.compile(r"(\d{1,2})\s*[/-]\s*(\d{1,2})(?:\s*[/-]\s*(\d{2,4}))?")
+
+_VERB = r"(?:vou|irei|quero|queria|planejo|agendar|agendado[oa]?|preciso|devo|tenho que)?\s*"
+_AMOUNT = r"R?\$?\s*(?P<{}>\d+(?:[.,]\d{{1,2}})?)"
+_EXPENSE = r"(?:gastei|paguei|pagar|comprei|compra|pago|gastos|despesa|debito|debitei|assinatura|plano|mensalidade)"
+_INCOME = r"(?:recebi|receber|ganhei|ganhar|entrada|entrou|ganho|receita|pix|credito|creditei)"
+
+# Alternatives are tried left to right at the start of the message, so the first
+# one that matches is the one the old sequence of re.match calls would have taken
+_TRANSACTION = re.compile(
+    # "gastei 50 no uber", "vou pagar 120 luz", "assinatura netflix 44"
+    rf"^{_VERB}{_EXPENSE}\s+{_AMOUNT.format('expense')}\s*(?:no|na|em|com|de|do|da|pra|pro|para|at[eé]|no\(a\))?\s*(?P<expense_desc>.*)"
+    # "recebi 3000 salario", "vou receber 150 freelance"
+    rf"|^{_VERB}{_INCOME}\s+{_AMOUNT.format('income')}\s*(?:de|do|da|via|por|no|na)?\s*(?P<income_desc>.*)"
+    # "50 uber", "vou pagar 120,90 mercado", "R$ 45 almoço"
+    rf"|^{_VERB}{_AMOUNT.format('simple')}\s+(?P<simple_desc>.+)"
+    # "Netflix 44,50", "Uber 30 ontem"
+    rf"|^(?P<flexible_desc>.*?)\s+{_AMOUNT.format('flexible')}(?:\s+(?P<flexible_rest>.*))?$"
+)
+# A command followed by a number ("saldo 100") is not a "<desc> <amount>" expense
+_NOT_DESCRIPTIONS = {"ajuda", "saldo", "ultimas", "recentes", "meta"}
+
+# Description cleanup, applied in this order
+_AMOUNT_UNIT = re.compile(r"^(?:reais|real)\s*")
+_DATE_AND_PAYMENT_WORDS = re.compile(
+    r"\b(?:ontem|hoje|amanhã|amanha"
+    r"|pix|cartão|cartao|tranferencia|transferencia|boleto|dinheiro|debito|débito|credito|crédito)\b"
+)
+_DIGIT = re.compile(r"\d")
+_INSTALLMENT_WORDS = re.compile(r"\b(em|de)?\s*\d+\s*(?:x|vezes|parcelas)\b")
+_RECURRENCE_WORDS = re.compile(r"\b(mensal|todo mes|todo mês|fixo|recorrente|assinatura)\b")
+# Trailing dates: "dia 22/03", "para 25/02", "p/ 30/01", "primeira dia 13/03"
+_TRAILING_DATE = re.compile(r"\s+(?:no dia|dia|para|pro|p/|em|primeira|vencimento|venc|1ª|1a)?\s*(?:dia)?\s*\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?$")
+_TRAILING_CONNECTIVE = re.compile(r"\s+(?:no|na|de|do|da|com|por|via|em|de apenas|primeira|1ª|1a)$")
+
+ParsedTransaction = namedtuple(
+    "ParsedTransaction",
+    "amount_str description tx_type status custom_date payment_method installment_count is_recurring recurrence_period"
+)
+
+
+def parse_date(message: str, now: datetime, normalized: str) -> datetime:
+    """The date a message refers to: DD/MM[/YYYY], 'amanha', 'ontem' or now."""
+    match = _DATE.search(message)
+    if match:
+        day, month, year = match.groups()
+        year = int(year) if year else now.year
+        if year < 100:
+            year += 2000
+        try:
+            return now.replace(day=int(day), month=int(month), year=year)
+        except ValueError:
+            return now
+    if "amanha" in normalized:
+        return now + timedelta(days=1)
+    if "ontem" in normalized:
+        return now - timedelta(days=1)
+    return now
+
+
+def parse_transaction(message: str, normalized: str, now: Optional[datetime] = None) -> Optional[ParsedTransaction]:
+    """Fields for WhatsappAgent._create_transaction, or None when the message isn't a transaction.
+
+    `message` is the stripped original text (for dates), `normalized` its normalized form.
+    """
+    match = _TRANSACTION.match(normalized)
+    if not match:
+        return None
+    groups = match.groupdict()
+    if groups["expense"] is not None:
+        amount_str, description, tx_type = groups["expense"], groups["expense_desc"], "expense"
+    elif groups["income"] is not None:
+        amount_str, description, tx_type = groups["income"], groups["income_desc"], "income"
+    elif groups["simple"] is not None:
+        amount_str, description, tx_type = groups["simple"], groups["simple_desc"], "expense"
+    else:
+        if groups["flexible_desc"].strip() in _NOT_DESCRIPTIONS:
+            return None
+        amount_str, tx_type = groups["flexible"], "expense"
+        description = f"{groups['flexible_desc']} {groups['flexible_rest'] or ''}".strip()
+
+    # Future verbs mean pending unless the message also says it is paid;
+    # without either, "pendente"/"aberto"/"devendo"/"conta" mean pending and anything else is paid
+    if _PAID.search(normalized):
+        status = "paid"
+    elif _FUTURE.search(normalized) or _PENDING.search(normalized):
+        status = "pending"
+    else:
+        status = "paid"
+
+    payment_method = next((label for key, label in PAYMENT_METHODS if key in normalized), "Outros")
+    installments = _INSTALLMENTS.search(normalized)
+    is_recurring = _RECURRING.search(normalized) is not None
+
+    return ParsedTransaction(
+        amount_str=amount_str,
+        description=description,
+        tx_type=tx_type,
+        status=status,
+        custom_date=parse_date(message, now or datetime.now(), normalized),
+        payment_method=payment_method,
+        installment_count=int(installments.group(1)) if installments else 1,
+        is_recurring=is_recurring,
+        recurrence_period="monthly" if is_recurring else None
+    )
+
+
+def clean_description(description: str, tx_type: str) -> str:
+    """Strip amount units, dates, payment methods, installments and recurrence words from a (normalized) description."""
+    description = _AMOUNT_UNIT.sub("", description.strip()).strip()
+    description = _DATE_AND_PAYMENT_WORDS.sub("", description).strip()
+    has_digits = _DIGIT.search(description) is not None
+    if has_digits:
+        description = _INSTALLMENT_WORDS.sub("", description).strip()
+    description = _RECURRENCE_WORDS.sub("", description).strip()
+    if has_digits:
+        description = _TRAILING_DATE.sub("", description).strip()
+    description = " ".join(description.split())
+    description = _TRAILING_CONNECTIVE.sub("", description).strip()
+
+    if not description:
+        return "Despesa via WhatsApp" if tx_type == "expense" else "Receita via WhatsApp"
+    return description[0].upper() + description[1:]
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import re
+import unicodedata
+from datetime import datetime
+from .. import importers
+from ..smart_categorization import categorizer
+from ..importers import StatementFormatError
+
+# Normalized row pipeline shared by the /imports endpoints and the background import jobs:
+# any registered statement format (see importers/) -> typed, categorized rows.
+# Rows are produced lazily so callers can stream arbitrarily large files.
+
+# How many bytes are inspected to pick the encoding and the parser
+SNIFF_BYTES = 8192
+# Lines handed to SmartCategorizer.predict_many at once
+CATEGORIZE_BATCH = 1000
+
+# Keyword rules for statement lines, checked in order; the first rule with a keyword
+# contained in the (upper-cased) description wins
+CATEGORY_RULES = (
+    ("Alimentação", ("UBER", "BARBEARIA", "PISTA")),
+    ("Transferências", ("TRANSFERÊNCIA ENVIADA", "TRANSFERÊNCIA RECEBIDA")),
+    ("Investimentos", ("APLICAÇÃO RDB", "RESGATE RDB")),
+    ("Boletos", ("PAGAMENTO DE BOLETO",)),
+    ("Fatura", ("PAGAMENTO DE FATURA",)),
+    ("Serviços", ("SYMPLA", "UNIFIQUE", "CELESC", "ULTRAGAZ", "AMBIENTAL")),
+    ("Educação", ("UNINTER",)),
+    ("Empréstimo", ("DEPÓSITO DE EMPRÉSTIMO",)),
+    ("Pix", ("PIX",)),
+)
+UNCATEGORIZED = "Não categorizado"
+
+
+def rule_category(description: str) -> str:
+    desc_upper = description.upper()
+    for category_name, keywords in CATEGORY_RULES:
+        if any(keyword in desc_upper for keyword in keywords):
+            return category_name
+    return UNCATEGORIZED
+
+def categorize_description(description: str, cat_map: dict):
+    """(category_id, category_name) for a statement line, using the user's categories."""
+    target_category_name = rule_category(description)
+    
+    # Try to find category ID
+    cat_data = cat_map.get(target_category_name.lower())
+    cat_id = cat_data['id'] if cat_data else None
+    
+    if not cat_id and target_category_name != UNCATEGORIZED:
+         cat_data = cat_map.get('outros')
+         if cat_data:
+              cat_id = cat_data['id']
+              target_category_name = "Outros"
+
+    return cat_id, target_category_name if not cat_id else cat_data['name']
+
+def _encoding(head: bytes) -> str:
+    # Exports from Brazilian banks (OFX, QIF) are often Windows-1252
+    try:
+        head.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sniffed block is still UTF-8
+        return "utf-8-sig" if e.start >= len(head) - 3 else "cp1252"
+
+def _smart_categorize(rows: list, resolver):
+    """Give rows the statement rules left uncategorized a keyword prediction, in one batch."""
+    misses = [row for row in rows if row["category_id"] is None]
+    if not misses:
+        return
+    predictions = categorizer.predict_many([r["description"] for r in misses], [r["type"] for r in misses], fallback=False)
+    for row, category_name in zip(misses, predictions):
+        category_id = resolver.resolve(category_name) if category_name else None
+        if category_id is not None:
+            row["category_id"] = category_id
+            row["category_name"] = resolver.name_for(category_id)
+
+def iter_statement_rows(binary, filename: str, cat_map: dict, resolver=None, learned=None):
+    """Parse a statement (seekable binary file) lazily, yielding preview dicts one row at a time.
+
+    Rows carry their import fingerprint, so the file must be read from its first line.
+    With a CategoryResolver, lines the statement rules don't know are also run
+    through the smart categorizer, CATEGORIZE_BATCH lines at a time. A learned
+    model (crud_category_learning.get_model, needs the resolver) is asked first.
+
+    The format comes from the file name and its first bytes; raises
+    StatementFormatError when no registered parser accepts it.
+    """
+    binary.seek(0)
+    head = binary.read(SNIFF_BYTES)
+    binary.seek(0)
+    encoding = _encoding(head)
+    parser = importers.detect(filename, head.decode(encoding, errors="replace"))
+
+    fingerprint = Fingerprinter()
+    stream = io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline="")
+    batch = []
+    try:
+        for line in parser.parse(stream):
+            amount = line["amount"]
+            tx_type = "income" if amount > 0 else "expense"
+            # What the user picked for similar lines before beats the generic rules
+            cat_id = learned.predict(line["description"]) if learned else None
+            cat_name = resolver.name_for(cat_id) if cat_id else None
+            if not cat_name:
+                cat_id, cat_name = categorize_description(line["description"], cat_map)
+            row = {
+                "date": line["date"],
+                "description": line["description"],
+                "amount": amount,
+                "type": tx_type,
+                "category_id": cat_id,
+                "category_name": cat_name,
+                "fingerprint": fingerprint(line["date"], amount, tx_type, line["description"])
+            }
+            if resolver is None:
+                yield row
+                continue
+            batch.append(row)
+            if len(batch) >= CATEGORIZE_BATCH:
+                _smart_categorize(batch, resolver)
+                yield from batch
+                batch = []
+        if batch:
+            _smart_categorize(batch, resolver)
+            yield from batch
+    finally:
+        # Leave the file for its owner to close
+        stream.detach()
+
+class PreviewStats:
+    """Aggregates over every parsed row, accumulated in the same streaming pass."""
+
+    def __init__(self):
+        self.row_count = 0
+        self.date_start = None
+        self.date_end = None
+        self.total_income = 0.0
+        self.total_expenses = 0.0
+        self.duplicate_count = 0
+        self.categories = {}
+
+    def add(self, row: dict):
+        self.row_count += 1
+        if row.get("duplicate"):
+            self.duplicate_count += 1
+        if self.date_start is None or row["date"] < self.date_start:
+            self.date_start = row["date"]
+        if self.date_end is None or row["date"] > self.date_end:
+            self.date_end = row["date"]
+        if row["type"] == "income":
+            self.total_income += row["amount"]
+        else:
+            self.total_expenses += abs(row["amount"])
+        count, total = self.categories.get(row["category_name"], (0, 0.0))
+        self.categories[row["category_name"]] = (count + 1, total + abs(row["amount"]))
+
+    def as_dict(self):
+        return {
+            "row_count": self.row_count,
+            "date_start": self.date_start,
+            "date_end": self.date_end,
+            "total_income": round(self.total_income, 2),
+            "total_expenses": round(self.total_expenses, 2),
+            "duplicate_count": self.duplicate_count,
+            "categories": [
+                {"name": name, "count": count, "total": round(total, 2)}
+                for name, (count, total) in sorted(self.categories.items(), key=lambda item: -item[1][0])
+            ]
+        }
+
+
+def normalize_description(description: str) -> str:
+    """Case, accents and spacing don't make two statement lines different."""
+    text = description or ""
+    if not text.isascii():
+        text = COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    return " ".join(text.split()).casefold()
+
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+class Fingerprinter:
+    """Content fingerprints for statement lines, stored as Transaction.import_fingerprint.
+
+    The hash covers the normalized date, signed amount and description plus an
+    occurrence counter, so two identical lines in one file (two coffees on the
+    same day) stay distinct while re-importing an overlapping file maps every
+    line to the fingerprint it got the first time. Feed lines in file order.
+    """
+
+    def __init__(self):
+        self.seen = {}
+
+    def __call__(self, date: datetime, amount: float, tx_type: str, description: str) -> str:
+        signed = -abs(amount) if tx_type == "expense" else abs(amount)
+        base = f"{date:%Y-%m-%d}|{signed:.2f}|{normalize_description(description)}"
+        occurrence = self.seen.get(base, 0) + 1
+        self.seen[base] = occurrence
+        return hashlib.sha256(f"{base}|{occurrence}".encode("utf-8")).hexdigest()[:32]
@@ -1,10 +1,10 @@
-import re
 import logging
 import random
 from sqlalchemy.orm import Session
 from datetime import datetime
-from .. import models, crud, schemas_transaction
+from .. import models, crud, crud_category_learning, crud_rollups, data_versions, schemas_transaction
 from ..smart_categorization import categorizer, normalize as from_smart_categorization_normalize
+from . import message_parser
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -56,199 +56,27 @@ class WhatsappAgent:
         msg = message.strip()
         # Normalize: lowercase and remove accents for command matching
         msg_normalized = from_smart_categorization_normalize(msg)
-        msg_lower = msg_normalized # Keep original name for compatibility with existing code
-
-        # --- TIME & STATUS DETECTION ---
-        # Look for future indicators: verbs in future or intent
-        future_regex = r"(?:vou|irei|planejo|agendar|agendado[oa]?|vencimento|para|pro|previsto[oa]?|a pagar|a receber|amanh[aã]|amanha|boleto)"
-        is_future = bool(re.search(future_regex, msg_lower))
-        
-        # Immediate indicators of "paid/received" status: past verbs or confirmation
-        paid_regex = r"(?:paguei|recebi|gastei|ja|concluido|feito|pago|recebido|quitado|liquidado|hoje|ontem)"
-        is_paid_explicit = bool(re.search(paid_regex, msg_lower))
-
-        # Payment Methods
-        payment_methods = {
-            "pix": "Pix",
-            "cartao": "Cartão",
-            "transferencia": "Transferência",
-            "boleto": "Boleto",
-            "dinheiro": "Dinheiro",
-            "debito": "Débito",
-            "credito": "Crédito"
-        }
-        detected_payment_method = "Outros"
-        for key, val in payment_methods.items():
-            if key in msg_normalized:
-                detected_payment_method = val
-                break
-
-        # Decision: If explicitly future verbs are used, it's pending unless explicitly confirmed as paid
-        if is_future and not is_paid_explicit:
-            status = "pending"
-        elif is_paid_explicit:
-            status = "paid"
-        else:
-            # Words like "pendente", "aberto", "devendo" always mean pending regardless of other words
-            if re.search(r"(?:pendente|aberto|devendo|conta)", msg_lower):
-                status = "pending"
-            else:
-                status = "paid" # Default for "50 uber"
-
-        # --- RECURRENCE & INSTALLMENTS EXTRACTION ---
-        installment_count = 1
-        is_recurring = False
-        recurrence_period = None
-
-        # Look for installments: "10x", "em 10 vezes", "10 parcelas"
-        installment_match = re.search(r"(\d{1,2})\s*(?:x|vezes|parcelas)", msg_lower)
-        if installment_match:
-            installment_count = int(installment_match.group(1))
-
-        # Look for recurrence: "mensal", "todo mes", "fixo", "recorrente"
-        if re.search(r"(mensal|todo mes|todo mês|fixo|recorrente|assinatura)", msg_lower):
-            is_recurring = True
-            recurrence_period = "monthly"
-
-        # --- DATE EXTRACTION ---
-        target_date = datetime.now()
-        # Look for DD/MM or DD/MM/YYYY (handles spaces around the slash/dash)
-        date_match = re.search(r"(\d{1,2})\s*[/-]\s*(\d{1,2})(?:\s*[/-]\s*(\d{2,4}))?", msg)
-        if date_match:
-            day = int(date_match.group(1))
-            month = int(date_match.group(2))
-            year = int(date_match.group(3)) if date_match.group(3) else target_date.year
-            # Basic validation
-            try:
-                if year < 100: year += 2000 # Handle 2-digit year
-                target_date = target_date.replace(day=day, month=month, year=year)
-            except ValueError:
-                pass # Invalid date, keep current
-        elif "amanha" in msg_normalized:
-            from datetime import timedelta
-            target_date += timedelta(days=1)
-        elif "ontem" in msg_normalized:
-            from datetime import timedelta
-            target_date -= timedelta(days=1)
 
         # --- COMMAND ROUTING ---
-
-        # Help / Greeting
-        if msg_lower in ("ajuda", "help", "menu", "oi", "olá", "ola", "hey", "bom dia", "boa tarde", "boa noite", "oi!"):
+        command = message_parser.COMMANDS.get(msg_normalized)
+        if command == "help":
             return self.HELP_TEXT
-
-        # Balance
-        if msg_lower in ("saldo", "resumo", "balanço", "balanco"):
+        if command == "balance":
             return self._get_balance()
-
-        # Recent transactions
-        if msg_lower in ("ultimas", "últimas", "historico", "histórico", "extrato", "recentes"):
+        if command == "recent":
             return self._get_recent_transactions()
-
-        # Savings goal
-        if msg_lower in ("meta", "metas", "objetivo"):
+        if command == "goal":
             return self._get_savings_goal()
-
-        # Categories
-        if msg_lower in ("categorias", "minhas categorias", "cats"):
+        if command == "categories":
             return self._get_categories()
-
-        # Undo
-        if msg_lower in ("desfazer", "cancelar", "cancelar ultimo", "cancelar última", "anular"):
+        if command == "undo":
             return self._undo_last_transaction()
 
-        # Verbs that can prefix a transaction command (optional)
-        verb_prefixes = r"(?:vou|irei|quero|queria|planejo|agendar|agendado[oa]?|preciso|devo|tenho que)?\s*"
-
-        # Patterns for expenses
-        # "gastei 50 no uber", "vou pagar 120 luz", "assinatura netflix 44"
-        expense_keywords = r"(?:gastei|paguei|pagar|comprei|compra|pago|gastos|despesa|debito|debitei|assinatura|plano|mensalidade)"
-        expense_match = re.match(
-            rf"^{verb_prefixes}({expense_keywords})\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s*(?:no|na|em|com|de|do|da|pra|pro|para|at[eé]|no\(a\))?\s*(.*)",
-            msg_lower
-        )
-
-        if expense_match:
-            return self._create_transaction(
-                amount_str=expense_match.group(2),
-                description=expense_match.group(3),
-                tx_type="expense",
-                status=status,
-                custom_date=target_date,
-                payment_method=detected_payment_method,
-                installment_count=installment_count,
-                is_recurring=is_recurring,
-                recurrence_period=recurrence_period
-            )
-
-        # Patterns for income
-        # "recebi 3000 salario", "vou receber 150 freelance"
-        income_keywords = r"(?:recebi|receber|ganhei|ganhar|entrada|entrou|ganho|receita|pix|credito|creditei)"
-        income_match = re.match(
-            rf"^{verb_prefixes}({income_keywords})\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s*(?:de|do|da|via|por|no|na)?\s*(.*)",
-            msg_lower
-        )
-
-        if income_match:
-            return self._create_transaction(
-                amount_str=income_match.group(2),
-                description=income_match.group(3),
-                tx_type="income",
-                status=status,
-                custom_date=target_date,
-                payment_method=detected_payment_method,
-                installment_count=installment_count,
-                is_recurring=is_recurring,
-                recurrence_period=recurrence_period
-            )
-
-        # Fallback pattern: just a number + description (treated as expense)
-        # "50 uber", "vou pagar 120,90 mercado", "R$ 45 almoço"
-        simple_match = re.match(
-            rf"^{verb_prefixes}R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)\s+(.+)",
-            msg_lower
-        )
-
-        if simple_match:
-            # If it captures a future verb but no explicit income/expense keyword, we treat as expense
-            return self._create_transaction(
-                amount_str=simple_match.group(1),
-                description=simple_match.group(2),
-                tx_type="expense",
-                status=status,
-                custom_date=target_date,
-                payment_method=detected_payment_method,
-                installment_count=installment_count,
-                is_recurring=is_recurring,
-                recurrence_period=recurrence_period
-            )
-
-        # Flexible pattern: "Netflix 44,50", "Uber 30"
-        # Matches <description> <amount> <rest of message>
-        flexible_match = re.match(
-            rf"^(.*?)\s+R?\$?\s*(\d+(?:[.,]\d{{1,2}})?)(?:\s+(.*))?$",
-            msg_lower
-        )
-        # Avoid matching commands or pure numbers
-        if flexible_match and flexible_match.group(1).strip() not in ("ajuda", "saldo", "ultimas", "recentes", "meta"):
-            desc_part1 = flexible_match.group(1)
-            amount_str = flexible_match.group(2)
-            desc_part2 = flexible_match.group(3) or ""
-            
-            # Combine description and check if it sounds like an expense
-            full_desc = f"{desc_part1} {desc_part2}".strip()
-            
-            return self._create_transaction(
-                amount_str=amount_str,
-                description=full_desc,
-                tx_type="expense", # Default to expense for this pattern
-                status=status,
-                custom_date=target_date,
-                payment_method=detected_payment_method,
-                installment_count=installment_count,
-                is_recurring=is_recurring,
-                recurrence_period=recurrence_period
-            )
+        # --- TRANSACTIONS ---
+        # Amount, description, type, status, date, payment method, installments and recurrence
+        parsed = message_parser.parse_transaction(msg, msg_normalized)
+        if parsed:
+            return self._create_transaction(**parsed._asdict())
 
         # Nothing matched
         return (
@@ -278,40 +106,16 @@ class WhatsappAgent:
         except ValueError:
             return "⚠️ Não consegui entender o valor. Use formato: 50 ou 50,90"
 
-        # Clean description
-        description = description.strip()
-        
-        # Remove "reais" or "real" if it's the first word after the amount
-        description = re.sub(r"^(?:reais|real)\s*", "", description, flags=re.IGNORECASE).strip()
-        
-        # Remove relative date keywords (ontem, hoje, amanha)
-        description = re.sub(r"\b(ontem|hoje|amanhã|amanha)\b", "", description, flags=re.IGNORECASE).strip()
-
-        # Remove payment methods from description
-        description = re.sub(r"\b(pix|cartão|cartao|tranferencia|transferencia|boleto|dinheiro|debito|débito|credito|crédito)\b", "", description, flags=re.IGNORECASE).strip()
-
-        # Remove installment/recurrence keywords from description
-        description = re.sub(r"\b(em|de)?\s*\d+\s*(?:x|vezes|parcelas)\b", "", description, flags=re.IGNORECASE).strip()
-        description = re.sub(r"\b(mensal|todo mes|todo mês|fixo|recorrente|assinatura)\b", "", description, flags=re.IGNORECASE).strip()
+        description = message_parser.clean_description(description, tx_type)
 
-        # Remove date mention if it's trailing like "dia 22/03", "para 25/02", "p/ 30/01", "primeira dia 13/03"
-        description = re.sub(r"\s+(?:no dia|dia|para|pro|p/|em|primeira|vencimento|venc|1ª|1a)?\s*(?:dia)?\s*\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?$", "", description, flags=re.IGNORECASE).strip()
-
-        # Extra cleanup: double spaces and common connecting words at the end
-        description = re.sub(r"\s+", " ", description)
-        description = re.sub(r"\s+(?:no|na|de|do|da|com|por|via|em|de apenas|primeira|1ª|1a)$", "", description, flags=re.IGNORECASE).strip()
-
-        if not description:
-            description = "Despesa via WhatsApp" if tx_type == "expense" else "Receita via WhatsApp"
-        else:
-            # Capitalize first letter
-            description = description[0].upper() + description[1:]
-
-        # Auto categorize
-        category_name = categorizer.predict(description, tx_type)
-        category_id = categorizer.find_category_id(
-            self.db, self.user.id, category_name, self.workspace_id
-        )
+        # Auto categorize: how the user categorized similar descriptions, else the keyword rules
+        category_id = crud_category_learning.predict(self.db, self.user.id, self.workspace_id, description)
+        category_name = categorizer.resolver(self.db, self.user.id, self.workspace_id).name_for(category_id) if category_id else None
+        if not category_name:
+            category_name = categorizer.predict(description, tx_type)
+            category_id = categorizer.find_category_id(
+                self.db, self.user.id, category_name, self.workspace_id
+            )
 
         # If category does not exist, create it auto
         if not category_id:
@@ -334,6 +138,8 @@ class WhatsappAgent:
                 icon=icon
             )
             self.db.add(new_cat)
+            data_versions.bump_for(self.db, self.user.id, self.workspace_id)
+            data_versions.bump_categories(self.db, self.user.id, self.workspace_id)
             self.db.commit()
             self.db.refresh(new_cat)
             category_id = new_cat.id
@@ -387,27 +193,40 @@ class WhatsappAgent:
     # BALANCE / SUMMARY
     # ─────────────────────────────────────────────
 
+    def _month_totals(self, now: datetime):
+        """({type: {"paid": total, "pending": total}}, count of the transactions in those totals)
+        for the month of `now`.
+
+        Read from the monthly rollups (plus virtual recurrences), so the cost doesn't grow with
+        how many transactions the month has.
+        """
+        totals = {"income": {"paid": 0.0, "pending": 0.0}, "expense": {"paid": 0.0, "pending": 0.0}}
+        tx_count = 0
+        month_totals = crud.get_month_totals(self.db, self.user.id, self.workspace_id, now.year, now.month)
+        for (tx_type, status), (total, count) in month_totals.items():
+            if tx_type not in totals:
+                continue
+            # Same statuses as the dashboard (paid) and the upcoming list (pending); others are left out
+            if status in crud.PAID_STATUSES:
+                bucket = "paid"
+            elif status == crud.PENDING_STATUS:
+                bucket = "pending"
+            else:
+                continue
+            totals[tx_type][bucket] += total
+            # Counted like the totals, so "Total de N transações" matches the lines above it
+            tx_count += count
+        return totals, tx_count
+
     def _get_balance(self) -> str:
         """Get current month balance summary."""
         now = datetime.now()
-        first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        query = self.db.query(models.Transaction).filter(
-            models.Transaction.date >= first_day,
-            models.Transaction.date <= now,
-        )
-
-        if self.workspace_id:
-            query = query.filter(models.Transaction.workspace_id == self.workspace_id)
-        else:
-            query = query.filter(models.Transaction.user_id == self.user.id)
-
-        transactions = query.all()
 
-        income = sum(t.amount for t in transactions if t.type == "income")
-        expense = sum(t.amount for t in transactions if t.type == "expense")
+        totals, tx_count = self._month_totals(now)
+        income = totals["income"]["paid"]
+        expense = totals["expense"]["paid"]
         balance = income - expense
-        tx_count = len(transactions)
+        forecast = balance + totals["income"]["pending"] - totals["expense"]["pending"]
 
         # Balance emoji
         balance_emoji = "📈" if balance >= 0 else "📉"
@@ -424,6 +243,9 @@ class WhatsappAgent:
             f"🟢 Receitas: R$ {income:,.2f}\n"
             f"🔴 Despesas: R$ {expense:,.2f}\n"
             f"{balance_emoji} *Saldo: R$ {balance:,.2f}*\n\n"
+            f"⏳ A receber: R$ {totals['income']['pending']:,.2f}\n"
+            f"⏳ A pagar: R$ {totals['expense']['pending']:,.2f}\n"
+            f"🔮 Saldo previsto: R$ {forecast:,.2f}\n\n"
             f"📊 Total de {tx_count} transações no mês."
         )
 
@@ -477,21 +299,10 @@ class WhatsappAgent:
 
         goal = settings.monthly_savings_goal
 
-        # Calculate current month savings
-        now = datetime.now()
-        first_day = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        query = self.db.query(models.Transaction).filter(
-            models.Transaction.date >= first_day,
-            models.Transaction.date <= now,
-        )
-        if self.workspace_id:
-            query = query.filter(models.Transaction.workspace_id == self.workspace_id)
-
-        transactions = query.all()
-        income = sum(t.amount for t in transactions if t.type == "income")
-        expense = sum(t.amount for t in transactions if t.type == "expense")
-        saved = income - expense
+        # Saved so far this month: what was actually received minus what was actually paid
+        totals, _ = self._month_totals(datetime.now())
+        saved = totals["income"]["paid"] - totals["expense"]["paid"]
+        forecast = saved + totals["income"]["pending"] - totals["expense"]["pending"]
 
         percentage = min((saved / goal) * 100, 100) if goal > 0 else 0
         remaining = max(goal - saved, 0)
@@ -506,7 +317,8 @@ class WhatsappAgent:
             f"🎯 *Meta de Economia Mensal*\n\n"
             f"Meta: R$ {goal:,.2f}\n"
             f"Economizado: R$ {saved:,.2f}\n"
-            f"Faltam: R$ {remaining:,.2f}\n\n"
+            f"Faltam: R$ {remaining:,.2f}\n"
+            f"Previsto no mês: R$ {forecast:,.2f}\n\n"
             f"[{bar}] {percentage:.0f}%\n\n"
             f"{status_emoji} {'Meta atingida! Parabéns!' if percentage >= 100 else f'Continue assim! Faltam R$ {remaining:,.2f}'}"
         )
@@ -567,6 +379,8 @@ class WhatsappAgent:
         amount = last_tx.amount
         tx_type = "Despesa" if last_tx.type == "expense" else "Receita"
 
+        crud_rollups.remove_transactions(self.db, [last_tx])
+        crud_category_learning.forget(self.db, [last_tx])
         self.db.delete(last_tx)
         self.db.commit()
 
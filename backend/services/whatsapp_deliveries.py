@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models
+from ..response_cache import LRUCache
+
+# MessageSid idempotency for inbound WhatsApp messages.
+# Twilio retries a webhook that times out with the same MessageSid. The first
+# delivery claims the sid by inserting its `whatsapp_deliveries` row (the primary
+# key makes the claim atomic across processes) and stores its reply when done; a
+# retry finds the row and gets that reply back without running the agent again.
+# Recent sids are also kept in memory, so retries to the same process don't touch
+# the database. Rows are purged after DEDUP_TTL_HOURS, long past Twilio's retries.
+
+DEDUP_TTL_HOURS = int(os.getenv("WHATSAPP_DEDUP_TTL_HOURS", "48"))
+# A claim with no reply after this long belongs to a delivery that died; a retry takes it over
+PROCESSING_TIMEOUT_SECONDS = 120
+# Purge expired rows every this many claims (per process)
+PURGE_EVERY = 500
+
+# Reply of a delivery still being processed
+IN_PROGRESS = ""
+
+Delivery = models.WhatsappDelivery
+
+# sid -> reply (or IN_PROGRESS)
+delivery_cache = LRUCache(max_size=int(os.getenv("WHATSAPP_DEDUP_CACHE_SIZE", "10000")), ttl=3600)
+_claims = 0
+
+
+def seen(message_sid: str) -> Optional[str]:
+    """The reply of a delivery this process already handled (IN_PROGRESS if still running), or None. No database."""
+    return delivery_cache.get(message_sid)
+
+
+def claim(db: Session, message_sid: str, phone_number: str) -> Optional[str]:
+    """Claim a MessageSid. Commits.
+
+    None means it is new and the caller must process it (then complete() or release()); otherwise
+    it is a retry and this is the original reply, or IN_PROGRESS while the original is still running.
+    """
+    global _claims
+    cached = delivery_cache.get(message_sid)
+    if cached:
+        return cached
+    # (IN_PROGRESS is rechecked in the database, which knows when a claim went stale)
+
+    db.add(Delivery(message_sid=message_sid, phone_number=phone_number))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        row = db.query(Delivery).filter(Delivery.message_sid == message_sid).first()
+        if row is None:
+            # Released (or purged) in between: try again
+            return claim(db, message_sid, phone_number)
+        if row.reply is not None:
+            delivery_cache.set(message_sid, row.reply)
+            return row.reply
+        if row.created_at >= datetime.now() - timedelta(seconds=PROCESSING_TIMEOUT_SECONDS):
+            return IN_PROGRESS
+        # The first delivery died without a reply: this retry does the work
+        row.created_at = datetime.now()
+        db.commit()
+
+    delivery_cache.set(message_sid, IN_PROGRESS)
+    _claims += 1
+    if _claims % PURGE_EVERY == 0:
+        purge(db)
+    return None
+
+
+def complete(db: Session, message_sid: str, reply: str):
+    """Store the reply of a claimed delivery for its retries. Commits."""
+    db.query(Delivery).filter(Delivery.message_sid == message_sid).update({"reply": reply}, synchronize_session=False)
+    db.commit()
+    delivery_cache.set(message_sid, reply)
+
+
+def release(db: Session, message_sid: str):
+    """Forget a claim whose processing failed, so a retry runs it again. Commits."""
+    db.query(Delivery).filter(Delivery.message_sid == message_sid).delete(synchronize_session=False)
+    db.commit()
+    delivery_cache.discard(lambda sid, reply: sid == message_sid)
+
+
+def purge(db: Session) -> int:
+    """Delete deliveries older than DEDUP_TTL_HOURS. Commits."""
+    cutoff = datetime.now() - timedelta(hours=DEDUP_TTL_HOURS)
+    count = db.query(Delivery).filter(Delivery.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return count
@@ -0,0 +1,346 @@
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+from typing import Optional
+import httpx
+from sqlalchemy.orm import Session
+from .. import models, phone_directory
+from . import whatsapp_deliveries
+from .whatsapp_agent import WhatsappAgent
+
+logger = logging.getLogger(__name__)
+
+# Fast-ack processing for the WhatsApp webhook.
+# With a worker pool running, the webhook only puts the message on an in-memory
+# queue and answers Twilio with an empty TwiML right away; a worker thread (with
+# its own session) runs the agent and sends the reply through the configured
+# sender; messages from one phone number always go to the same worker, in order.
+# Without a pool (WHATSAPP_WORKERS=0 or no sender configured), or when the queue is
+# full, the message is handled inside the request as before.
+# The queue lives in the API process: messages accepted right before a crash are
+# lost, like a reply Twilio never got.
+
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "2"))
+QUEUE_SIZE = int(os.getenv("WHATSAPP_QUEUE_SIZE", "1000"))
+# Latency percentiles are computed over the most recent messages
+LATENCY_WINDOW = 1000
+
+EMPTY_TWIML = "<?xml version='1.0' encoding='UTF-8'?><Response></Response>"
+ERROR_REPLY = "Desculpe, ocorreu um erro interno."
+
+# "VINCULAR <email>", with or without the accent
+LINK_COMMAND = re.compile(r"^[Vv][ÍíIi][Nn][Cc][Uu][Ll][Aa][Rr]\s+([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})$")
+
+
+def twiml(message: str) -> str:
+    return f"<?xml version='1.0' encoding='UTF-8'?><Response><Message>{message}</Message></Response>"
+
+
+def handle_message(db: Session, phone_number: str, message_body: str) -> str:
+    """Reply text for one inbound message: account linking for unknown numbers, else the agent."""
+    # 1. Who is writing (cached per phone number)
+    user = phone_directory.resolve(db, phone_number)
+
+    # 2. If not found, check for LINKING command
+    if not user:
+        match = LINK_COMMAND.search(message_body)
+        if match:
+            email = match.group(1)
+            logger.info(f"Linking request for email: {email}")
+
+            target_user = db.query(models.User).filter(models.User.email == email).first()
+            if target_user:
+                # Update user with phone number
+                target_user.phone_number = phone_number
+                db.commit()
+                # Both this number and the one the user had before now resolve differently
+                phone_directory.invalidate_phone(phone_number)
+                phone_directory.invalidate_users([target_user.id])
+                return f"✅ Vinculado com sucesso! Olá, {target_user.full_name or target_user.email}. Agora você pode lançar despesas direto por aqui."
+            return "❌ E-mail não encontrado no sistema. Verifique e tente novamente: VINCULAR <SEU_EMAIL>"
+
+        # If not linking command and user not found
+        return "👋 Olá! Não reconheci seu número. \n\nPara acessar seu financeiro, vincule sua conta enviando:\n*VINCULAR <SEU_EMAIL_DE_CADASTRO>*"
+
+    # 3. User Found - Proceed to Agent logic
+    logger.info(f"User identified by phone: {user.email} (ID: {user.id})")
+    if user.workspace_id is None:
+        return "Erro: Você não tem nenhum workspace vinculado."
+
+    try:
+        response_text = WhatsappAgent(db, user, user.workspace_id).process_message(message_body)
+        logger.info(f"Agent response: {response_text}")
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        db.rollback()
+        response_text = ERROR_REPLY
+    return response_text
+
+
+def handle_delivery(db: Session, phone_number: str, message_body: str, message_sid: Optional[str] = None):
+    """(reply, is_retry). Like handle_message, but a MessageSid seen before gets its original reply
+    (whatsapp_deliveries.IN_PROGRESS while that one is still running) without touching the ledger."""
+    if not message_sid:
+        return handle_message(db, phone_number, message_body), False
+    previous = whatsapp_deliveries.claim(db, message_sid, phone_number)
+    if previous is not None:
+        return previous, True
+    try:
+        reply = handle_message(db, phone_number, message_body)
+    except Exception:
+        db.rollback()
+        whatsapp_deliveries.release(db, message_sid)
+        raise
+    if reply == ERROR_REPLY:
+        # Nothing was written: let Twilio's retry try again
+        whatsapp_deliveries.release(db, message_sid)
+    else:
+        whatsapp_deliveries.complete(db, message_sid, reply)
+    return reply, False
+
+
+# ─────────────────────────────────────────────
+# OUTBOUND SENDERS
+# ─────────────────────────────────────────────
+
+class TwilioSender:
+    """Sends replies through Twilio's Messages API."""
+
+    API_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, timeout: float = 10.0):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number if from_number.startswith("whatsapp:") else f"whatsapp:{from_number}"
+        self.client = httpx.Client(timeout=timeout)
+
+    def send(self, to: str, body: str):
+        response = self.client.post(
+            self.API_URL.format(sid=self.account_sid),
+            data={"From": self.from_number, "To": f"whatsapp:{to}", "Body": body},
+            auth=(self.account_sid, self.auth_token)
+        )
+        response.raise_for_status()
+
+
+class FakeSender:
+    """Keeps replies in memory instead of sending them (tests, local development)."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to: str, body: str):
+        self.sent.append((to, body))
+
+
+def _twilio_from_env():
+    sid, token, from_number = (os.getenv(name) for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_WHATSAPP_FROM"))
+    if not (sid and token and from_number):
+        logger.warning("WHATSAPP_SENDER=twilio needs TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_WHATSAPP_FROM")
+        return None
+    return TwilioSender(sid, token, from_number)
+
+
+# Name -> factory; anything with send(to, body) can be registered
+SENDERS = {
+    "twilio": _twilio_from_env,
+    "fake": FakeSender,
+}
+
+
+def sender_from_env():
+    """The sender named by WHATSAPP_SENDER (Twilio when its credentials are set), or None."""
+    name = os.getenv("WHATSAPP_SENDER") or ("twilio" if os.getenv("TWILIO_ACCOUNT_SID") else None)
+    factory = SENDERS.get(name) if name else None
+    return factory() if factory else None
+
+
+# ─────────────────────────────────────────────
+# QUEUE AND WORKERS
+# ─────────────────────────────────────────────
+
+InboundMessage = namedtuple("InboundMessage", "phone_number body message_sid received_at")
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class QueueMetrics:
+    """Counters plus queue wait and processing latencies of the last LATENCY_WINDOW messages."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.inline = 0
+        self.processed = 0
+        self.failed = 0
+        self.send_failed = 0
+        self.duplicates = 0
+        self.max_depth = 0
+        self.wait = deque(maxlen=window)
+        self.processing = deque(maxlen=window)
+
+    def record_enqueued(self, depth: int):
+        with self.lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def record_inline(self):
+        with self.lock:
+            self.inline += 1
+
+    def record_duplicate(self):
+        with self.lock:
+            self.duplicates += 1
+
+    def record_processed(self, wait: float, processing: float, failed: bool, send_failed: bool):
+        with self.lock:
+            self.processed += 1
+            self.failed += failed
+            self.send_failed += send_failed
+            self.wait.append(wait)
+            self.processing.append(processing)
+
+    def stats(self, depth: int) -> dict:
+        with self.lock:
+            wait, processing = list(self.wait), list(self.processing)
+            counters = {
+                "enqueued": self.enqueued,
+                "inline": self.inline,
+                "processed": self.processed,
+                "failed": self.failed,
+                "send_failed": self.send_failed,
+                "duplicates": self.duplicates,
+                "max_depth": self.max_depth,
+            }
+        return {
+            "queue_depth": depth,
+            **counters,
+            "wait_ms": {"p50": round(_percentile(wait, 0.5) * 1000, 1), "p99": round(_percentile(wait, 0.99) * 1000, 1)},
+            "processing_ms": {
+                "p50": round(_percentile(processing, 0.5) * 1000, 1),
+                "p95": round(_percentile(processing, 0.95) * 1000, 1),
+                "p99": round(_percentile(processing, 0.99) * 1000, 1)
+            },
+        }
+
+
+class WhatsappWorkerPool:
+    """Daemon threads draining the inbound queues, each message with its own session.
+
+    Every worker has its own queue and a phone number always goes to the same one, so
+    one sender's messages run one at a time and in order ("desfazer" never overtakes
+    the expense it undoes) while different senders are processed in parallel.
+    """
+
+    def __init__(self, session_factory, sender, size: int = WHATSAPP_WORKERS, max_queue: int = QUEUE_SIZE):
+        self.session_factory = session_factory
+        self.sender = sender
+        self.size = size
+        # max_queue is split across the workers' queues
+        count = max(size, 1)
+        self.queues = [queue.Queue(maxsize=max(max_queue // count, 1)) for _ in range(count)]
+        self.metrics = QueueMetrics()
+        self.threads = []
+
+    def start(self):
+        for n in range(self.size):
+            thread = threading.Thread(target=self._loop, args=(self.queues[n],), name=f"whatsapp-worker-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        # One sentinel per worker, behind whatever is already queued
+        for n in range(len(self.threads)):
+            self.queues[n].put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def queue_for(self, phone_number: str) -> queue.Queue:
+        # crc32 rather than hash(): the same number maps to the same worker on every run
+        return self.queues[zlib.crc32(phone_number.encode()) % len(self.queues)]
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def submit(self, phone_number: str, body: str, message_sid: Optional[str] = None) -> bool:
+        """Queue a message for the phone number's worker; False when its queue is full."""
+        try:
+            self.queue_for(phone_number).put_nowait(InboundMessage(phone_number, body, message_sid, time.monotonic()))
+        except queue.Full:
+            return False
+        self.metrics.record_enqueued(self.depth())
+        return True
+
+    def join(self):
+        """Block until every queued message has been processed."""
+        for q in self.queues:
+            q.join()
+
+    def stats(self) -> dict:
+        return {"workers": len(self.threads), **self.metrics.stats(self.depth())}
+
+    def _loop(self, inbound: queue.Queue):
+        while True:
+            message = inbound.get()
+            try:
+                if message is None:
+                    return
+                self._process(message)
+            finally:
+                inbound.task_done()
+
+    def _process(self, message: InboundMessage):
+        started = time.monotonic()
+        failed = send_failed = is_retry = False
+        db = self.session_factory()
+        try:
+            reply, is_retry = handle_delivery(db, message.phone_number, message.body, message.message_sid)
+        except Exception as e:
+            logger.error(f"Error processing queued WhatsApp message: {e}")
+            failed = True
+            reply = ERROR_REPLY
+        finally:
+            db.close()
+        if is_retry:
+            # The first delivery of this MessageSid sends (or sent) the reply
+            self.metrics.record_duplicate()
+            return
+        try:
+            self.sender.send(message.phone_number, reply)
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp reply to {message.phone_number}: {e}")
+            send_failed = True
+        self.metrics.record_processed(started - message.received_at, time.monotonic() - started, failed, send_failed)
+
+
+# The running pool, if any (set by main's startup hook)
+pool: Optional[WhatsappWorkerPool] = None
+
+
+def start_pool(session_factory, sender=None) -> Optional[WhatsappWorkerPool]:
+    """Start fast-ack processing if workers and a sender are configured."""
+    global pool
+    sender = sender or sender_from_env()
+    if WHATSAPP_WORKERS <= 0 or sender is None:
+        return None
+    pool = WhatsappWorkerPool(session_factory, sender)
+    pool.start()
+    return pool
+
+
+def stop_pool():
+    global pool
+    if pool:
+        pool.stop()
+        pool = None
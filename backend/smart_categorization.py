@@ -1,16 +1,94 @@
+import os
 import re
 import unicodedata
+from bisect import bisect_left
+from collections import deque
+from itertools import islice
+from .response_cache import LRUCache
 
 
 def normalize(text: str) -> str:
     """Remove accents and lowercase for matching."""
-    nfkd = unicodedata.normalize("NFKD", text.lower())
+    text = text.lower()
+    if text.isascii():
+        return text
+    nfkd = unicodedata.normalize("NFKD", text)
     return "".join(c for c in nfkd if not unicodedata.combining(c))
 
 
+class KeywordAutomaton:
+    """Aho-Corasick matcher over normalized keywords, each with a priority (lower wins).
+
+    match() makes one pass over the text and returns the best priority among the
+    keywords it contains, or None. Keywords added with whole_word=True only count
+    when not surrounded by letters or digits.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]] # (priority, whole_word, length) ending at each state
+
+    def add(self, keyword: str, priority: int, whole_word: bool = False):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((priority, whole_word, len(keyword)))
+
+    def build(self):
+        """Compute failure links breadth-first and fold each state's suffix outputs into it."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+        # Best-first, so match() can stop at the first acceptable output of a state
+        self.outputs = [sorted(out) for out in self.outputs]
+        return self
+
+    def match(self, text: str):
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        best = None
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for priority, whole_word, length in outputs[state]:
+                if best is not None and priority >= best:
+                    break
+                if whole_word and not _at_word_boundary(text, end - length, end):
+                    continue
+                best = priority
+                break
+            if best == 0:
+                break
+        return best
+
+
+def _at_word_boundary(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
 class SmartCategorizer:
+    # Categories predict() considers for incoming money; every other one is for expenses
+    INCOME_CATEGORIES = {"Salário", "Freelance", "Investimentos", "Pix", "Vendas"}
+
     def __init__(self):
-        # Keywords in Portuguese mapped to common category names
+        # Keywords in Portuguese mapped to common category names (substring matches on
+        # normalized text; list a keyword under "whole_words" to require word boundaries)
         self.rules = {
             # --- DESPESAS ---
             "Alimentação": {
@@ -150,46 +228,142 @@ class SmartCategorizer:
             },
         }
 
+        # Keywords are normalized once; a category's position in `rules` is its priority
+        self.automata = {
+            "income": self._compile(lambda category: category in self.INCOME_CATEGORIES),
+            "expense": self._compile(lambda category: category not in self.INCOME_CATEGORIES),
+        }
+        self.categories = list(self.rules.keys())
+
+    def _compile(self, relevant) -> KeywordAutomaton:
+        automaton = KeywordAutomaton()
+        for priority, (category, data) in enumerate(self.rules.items()):
+            if not relevant(category):
+                continue
+            for keyword in data["keywords"]:
+                automaton.add(normalize(keyword), priority)
+            for keyword in data.get("whole_words", []):
+                automaton.add(normalize(keyword), priority, whole_word=True)
+        return automaton.build()
+
+    def _match(self, normalized: str, transaction_type: str):
+        automaton = self.automata["income" if transaction_type == "income" else "expense"]
+        priority = automaton.match(normalized)
+        return self.categories[priority] if priority is not None else None
+
     def predict(self, description: str, transaction_type: str = "expense") -> str:
         """Predict category based on description and transaction type."""
-        desc_normalized = normalize(description)
+        category = self._match(normalize(description), transaction_type)
+        if category is not None:
+            return category
 
-        # Filter relevant categories based on transaction type
-        income_categories = {"Salário", "Freelance", "Investimentos", "Pix", "Vendas"}
-        expense_categories = {k for k in self.rules.keys() if k not in income_categories}
+        return "Outros" if transaction_type == "expense" else "Receita"
 
-        relevant = income_categories if transaction_type == "income" else expense_categories
+    def predict_many(self, descriptions, types="expense", fallback: bool = True) -> list:
+        """predict() for many descriptions; `types` is one type for all or one per description.
 
-        for category, data in self.rules.items():
-            if category not in relevant:
-                continue
-            for keyword in data["keywords"]:
-                if normalize(keyword) in desc_normalized:
-                    return category
+        Repeated descriptions (the norm in statements) are matched once. With
+        fallback=False, descriptions no keyword matches come back as None instead of
+        the generic "Outros"/"Receita".
+        """
+        if isinstance(types, str):
+            types = [types] * len(descriptions)
+        memo = {}
+        predictions = []
+        for description, transaction_type in zip(descriptions, types):
+            kind = "income" if transaction_type == "income" else "expense"
+            key = (description, kind)
+            if key not in memo:
+                category = self._match(normalize(description), kind)
+                if category is None and fallback:
+                    category = "Outros" if kind == "expense" else "Receita"
+                memo[key] = category
+            predictions.append(memo[key])
+        return predictions
 
-        return "Outros" if transaction_type == "expense" else "Receita"
+    def resolver(self, db, user_id: int, workspace_id: int = None) -> "CategoryResolver":  # type: ignore
+        """Name index of the scope's categories (workspace if set, else the user's).
+
+        Cached per scope and category data version, so it is rebuilt only after a
+        category is created, renamed or deleted (see data_versions.bump_categories).
+        """
+        from . import models, data_versions
+
+        scope, scope_id = data_versions.scope_of(user_id, workspace_id)
+        key = (scope, scope_id, data_versions.get_category_version(db, user_id, workspace_id))
+        resolver = category_index_cache.get(key)
+        if resolver is None:
+            query = db.query(models.Category.id, models.Category.name)
+            if workspace_id:
+                query = query.filter(models.Category.workspace_id == workspace_id)
+            else:
+                query = query.filter(models.Category.user_id == user_id)
+            resolver = CategoryResolver(query.order_by(models.Category.id).all())
+            category_index_cache.set(key, resolver)
+        return resolver
 
     def find_category_id(self, db, user_id: int, predicted_name: str, workspace_id: int = None):  # type: ignore
         """Try to find existing user category by name similarity."""
-        from . import models
+        return self.resolver(db, user_id, workspace_id).resolve(predicted_name)
 
-        query = db.query(models.Category).filter(
-            models.Category.user_id == user_id
-        )
+    def find_category_ids(self, db, user_id: int, predicted_names, workspace_id: int = None) -> list:  # type: ignore
+        """find_category_id for many names with a single category query."""
+        resolver = self.resolver(db, user_id, workspace_id)
+        return [resolver.resolve(name) for name in predicted_names]
 
-        categories = query.all()
-        predicted_lower = normalize(predicted_name)
 
-        for cat in categories:
-            if normalize(cat.name) == predicted_lower:
-                return cat.id
+class CategoryResolver:
+    """Predicted category name -> id among a fixed list of categories.
 
-        # Partial match
+    Lookups are accent and case insensitive: an exact match is a dict lookup, then
+    the first category whose name starts with the predicted one (binary search over
+    the sorted names), then the first whose name contains it or is contained in it.
+    Results are memoized per name.
+    """
+
+    def __init__(self, categories):
+        self.names = []
+        self.exact = {}
+        self.display_names = {}
         for cat in categories:
-            if predicted_lower in normalize(cat.name) or normalize(cat.name) in predicted_lower:
-                return cat.id
+            name = normalize(cat.name)
+            self.names.append((name, cat.id))
+            self.exact.setdefault(name, cat.id)
+            self.display_names[cat.id] = cat.name
+        # (name, position) sorted by name; position keeps "first category" semantics among prefix matches
+        self.sorted_names = sorted((name, position) for position, (name, _) in enumerate(self.names))
+        self.memo = {}
+
+    def name_for(self, category_id: int):
+        return self.display_names.get(category_id)
+
+    def _prefix_match(self, prefix: str):
+        start = bisect_left(self.sorted_names, (prefix, -1))
+        first = None
+        for name, position in islice(self.sorted_names, start, None):
+            if not name.startswith(prefix):
+                break
+            first = position if first is None else min(first, position)
+        return self.names[first][1] if first is not None else None
+
+    def resolve(self, predicted_name: str):
+        if predicted_name in self.memo:
+            return self.memo[predicted_name]
+        predicted_lower = normalize(predicted_name)
+        category_id = self.exact.get(predicted_lower)
+        if category_id is None and predicted_lower:
+            category_id = self._prefix_match(predicted_lower)
+        if category_id is None:
+            # Partial match
+            category_id = next(
+                (cat_id for name, cat_id in self.names if predicted_lower in name or name in predicted_lower),
+                None
+            )
+        self.memo[predicted_name] = category_id
+        return category_id
 
-        return None
 
+# Category name indexes, keyed by (scope, scope_id, category data version)
+category_index_cache = LRUCache(max_size=int(os.getenv("CATEGORY_INDEX_CACHE_SIZE", "1024")))
 
 categorizer = SmartCategorizer()
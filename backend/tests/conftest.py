@@ -1,13 +1,19 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_test_engine
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+# Tests run import jobs synchronously (import_jobs.process_next) instead of in the worker pool
+os.environ.setdefault("IMPORT_WORKERS", "0")
+# ...and WhatsApp messages inline unless a test starts a pool with a FakeSender
+os.environ.setdefault("WHATSAPP_WORKERS", "0")
+
 from ..main import app
 from ..database import Base, get_db
 
 # Setup test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_test_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 @pytest.fixture(scope="module")
@@ -19,6 +25,15 @@ def db():
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
+        # Process-wide caches are keyed by ids and data versions, which start over
+        # with the next module's database
+        from .. import crud_category_learning, phone_directory, response_cache, smart_categorization
+        from ..services import whatsapp_deliveries
+        for cache in (
+            response_cache.summary_cache, crud_category_learning.model_cache, phone_directory.phone_cache,
+            smart_categorization.category_index_cache, whatsapp_deliveries.delivery_cache
+        ):
+            cache.clear()
 
 @pytest.fixture(scope="module")
 def client(db):
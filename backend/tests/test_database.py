@@ -0,0 +1,38 @@
+from sqlalchemy.orm import sessionmaker
+from .. import crud_category_learning, crud_rollups, database, models
+
+
+def test_backfills_run_once(db, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    runs = []
+
+    def backfill(session):
+        runs.append(1)
+        session.commit()
+
+    def broken(session):
+        raise RuntimeError("boom")
+
+    database._backfill_once("test_backfill", backfill)
+    database._backfill_once("test_backfill", backfill)
+    assert len(runs) == 1
+
+    # A failed backfill is logged and leaves no marker, so the next start retries it
+    database._backfill_once("test_broken", broken)
+    assert db.get(models.DataMigration, "test_broken") is None
+    database._backfill_once("test_broken", backfill)
+    assert len(runs) == 2
+    assert db.get(models.DataMigration, "test_broken") is not None
+
+    # create_tables runs the real backfills whenever their marker is missing, even though
+    # the tables already exist
+    monkeypatch.setattr(database, "engine", db.get_bind())
+    monkeypatch.setattr(crud_rollups, "rebuild_rollups", broken)
+    monkeypatch.setattr(crud_category_learning, "rebuild", backfill)
+    database.create_tables()
+    assert db.get(models.DataMigration, "transaction_monthly_rollups") is None
+    monkeypatch.setattr(crud_rollups, "rebuild_rollups", backfill)
+    database.create_tables()
+    db.expire_all()
+    assert db.get(models.DataMigration, "transaction_monthly_rollups") is not None
+    assert len(runs) == 4
@@ -0,0 +1,356 @@
+import io
+from datetime import datetime, timedelta
+import pytest
+from types import SimpleNamespace
+from .. import crud, models, schemas_category, schemas_transaction, auth as auth_service
+from ..importers import StatementFormatError, parse_amount
+from ..main import app
+from ..services.statement_parser import iter_statement_rows
+from ..smart_categorization import CategoryResolver
+
+CAT_MAP = {"pix": {"id": 7, "name": "Pix"}, "outros": {"id": 9, "name": "Outros"}}
+
+NUBANK_CHECKING = (
+    "Data,Valor,Identificador,Descrição\n"
+    "05/03/2024,-12.50,a1,Pix enviado - Padaria\n"
+    "06/03/2024,1500.00,a2,Salário\n"
+)
+NUBANK_CARD = (
+    "date,title,amount\n"
+    "2024-03-05,Padaria Pix,12.50\n"
+    "2024-03-06,Pagamento recebido,-1500.00\n"
+)
+OFX_SGML = """OFXHEADER:100
+DATA:OFXSGML
+CHARSET:1252
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240305000000[-3:BRT]
+<TRNAMT>-12,50
+<FITID>1
+<MEMO>Pix enviado - Padaria São João
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240306<TRNAMT>1500.00<FITID>2<NAME>Salário</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+OFX_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="220"?>
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20240305</DTPOSTED><TRNAMT>-12.50</TRNAMT><NAME>Pix &amp; Padaria</NAME></STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20240306</DTPOSTED><TRNAMT>1500.00</TRNAMT><NAME>Salário</NAME></STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+QIF = """!Type:Bank
+D05/03/2024
+T-12,50
+PPix Padaria
+^
+D6/3'24
+T1,500.00
+PSalário
+MMarço
+^
+"""
+
+
+@pytest.mark.parametrize("filename, content, encoding", [
+    ("nubank.csv", NUBANK_CHECKING, "utf-8-sig"),
+    ("fatura.csv", NUBANK_CARD, "utf-8"),
+    ("extrato.ofx", OFX_SGML, "cp1252"),
+    ("extrato.ofx", OFX_XML, "utf-8"),
+    ("extrato.qif", QIF, "utf-8"),
+])
+def test_every_format_feeds_the_same_rows(filename, content, encoding):
+    rows = list(iter_statement_rows(io.BytesIO(content.encode(encoding)), filename, CAT_MAP))
+
+    assert [(r["date"], r["amount"], r["type"]) for r in rows] == [
+        (datetime(2024, 3, 5), -12.5, "expense"),
+        (datetime(2024, 3, 6), 1500.0, "income"),
+    ]
+    assert "Padaria" in rows[0]["description"]
+    assert (rows[0]["category_id"], rows[1]["category_id"]) == (7, None)
+    assert rows[0]["fingerprint"] != rows[1]["fingerprint"]
+
+
+
+@pytest.mark.parametrize("header", ["", "!Option:MDY\n"])
+def test_qif_date_order_is_chosen_once_per_file(header):
+    # 2/3'24 alone could be 2 March; 1/15'24 (or the header) makes the whole file month/day
+    us = header + "!Type:Bank\nD2/3'24\nT-10.00\nPCafe\n^\nD1/15'24\nT-20.00\nPBooks\n^\n"
+    rows = list(iter_statement_rows(io.BytesIO(us.encode()), "us.qif", CAT_MAP))
+    assert [r["date"] for r in rows] == [datetime(2024, 2, 3), datetime(2024, 1, 15)]
+
+    # Only ambiguous dates: day/month, as Brazilian banks write them
+    ambiguous = "!Type:Bank\nD2/3'24\nT-10.00\nPCafe\n^\n"
+    assert next(iter_statement_rows(io.BytesIO(ambiguous.encode()), "br.qif", CAT_MAP))["date"] == datetime(2024, 3, 2)
+
+def test_ofx_values_split_across_read_blocks(monkeypatch):
+    from ..importers import ofx
+    monkeypatch.setattr(ofx, "READ_SIZE", 7)
+    rows = list(iter_statement_rows(io.BytesIO(OFX_SGML.encode("cp1252")), "extrato.ofx", CAT_MAP))
+    assert rows[0]["description"] == "Pix enviado - Padaria São João"
+    assert len(rows) == 2
+
+
+def test_unknown_layout_is_rejected():
+    with pytest.raises(StatementFormatError):
+        list(iter_statement_rows(io.BytesIO(b"foo,bar\n1,2\n"), "x.csv", CAT_MAP))
+    with pytest.raises(StatementFormatError):
+        list(iter_statement_rows(io.BytesIO(NUBANK_CHECKING.encode()), "x.qif", CAT_MAP))
+
+
+def test_parse_amount_separators():
+    assert parse_amount("1.234,56") == 1234.56
+    assert parse_amount("-1,234.56") == -1234.56
+    assert parse_amount("R$ 12,5") == 12.5
+    assert parse_amount("") == 0.0
+
+
+def test_rows_the_rules_miss_get_a_smart_prediction():
+    categories = [SimpleNamespace(id=7, name="Pix"), SimpleNamespace(id=12, name="Farmácia e Saúde")]
+    csv_text = "Data,Valor,Identificador,Descrição\n05/03/2024,-40.00,a1,Drogaria Central\n06/03/2024,-5.00,a2,Xyz\n"
+    rows = list(iter_statement_rows(io.BytesIO(csv_text.encode()), "nubank.csv", CAT_MAP, CategoryResolver(categories)))
+    assert [(r["category_id"], r["category_name"]) for r in rows] == [(12, "Farmácia e Saúde"), (None, "Não categorizado")]
+
+
+
+@pytest.fixture(scope="module")
+def user(db):
+    db_user = models.User(email="importer@example.com", hashed_password="x", full_name="Import Test")
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+@pytest.fixture(scope="module")
+def auth_client(client, user):
+    app.dependency_overrides[auth_service.get_current_active_user] = lambda: user
+    yield client
+    app.dependency_overrides.pop(auth_service.get_current_active_user, None)
+
+def test_import_confirm_ingests_in_chunks(auth_client, db, monkeypatch):
+    items = [
+        {"amount": 5, "description": f"Extrato {i}", "date": "2020-03-10T00:00:00", "type": "expense"}
+        for i in range(1200)
+    ]
+    items[700]["description"] = "BROKEN"
+
+    # Make one row fail at insert time to exercise the per-row fallback
+    original_rows = crud.transaction_rows
+
+    def rows_with_a_bad_one(transaction, *args, **kwargs):
+        rows = original_rows(transaction, *args, **kwargs)
+        if transaction.description == "BROKEN":
+            rows[0]["date"] = "not a date"
+        return rows
+
+    monkeypatch.setattr(crud, "transaction_rows", rows_with_a_bad_one)
+    response = auth_client.post("/imports/confirm", params={"chunk_size": 500}, json=items)
+
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary["received"], summary["created"], summary["failed"]) == (1200, 1199, 1)
+    assert summary["failures"][0]["index"] == 700
+    created = db.query(models.Transaction).filter(
+        models.Transaction.id.between(summary["first_id"], summary["last_id"]),
+        models.Transaction.description.like("Extrato %")
+    ).count()
+    assert created == 1199
+
+
+def test_import_failure_without_a_message(db, user, monkeypatch):
+    original_insert = crud._insert_expanded
+
+    def insert_failing_silently(db, expanded):
+        if any(rows[0]["description"] == "SILENT" for rows in expanded):
+            raise RuntimeError()
+        return original_insert(db, expanded)
+
+    monkeypatch.setattr(crud, "_insert_expanded", insert_failing_silently)
+    items = [
+        schemas_transaction.TransactionCreate(amount=3, description=description, date=datetime(2020, 4, 1), type="expense")
+        for description in ("Antes", "SILENT", "Depois")
+    ]
+    summary = crud.import_transactions(db, items, user_id=user.id)
+
+    assert (summary["created"], summary["failed"]) == (2, 1)
+    assert summary["failures"] == [{"index": 1, "error": "RuntimeError"}]
+
+
+def test_import_preview_streams_rows_and_stats(auth_client):
+    lines = ["Data,Valor,Identificador,Descrição"]
+    for i in range(3000):
+        amount = "1500.00" if i % 100 == 0 else "-12.50"
+        description = "Transferência Recebida" if i % 100 == 0 else "Pix enviado"
+        lines.append(f"{(i % 28) + 1:02d}/02/2024,{amount},id-{i},{description}")
+    payload = ("﻿" + "\n".join(lines)).encode("utf-8")
+
+    response = auth_client.post(
+        "/imports/preview", params={"limit": 50},
+        files={"file": ("nubank.csv", payload, "text/csv")}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["rows"]) == 50 and body["truncated"]
+    stats = body["stats"]
+    assert stats["row_count"] == 3000
+    assert stats["total_income"] == 30 * 1500.0
+    assert stats["total_expenses"] == 2970 * 12.5
+    assert (stats["date_start"][:10], stats["date_end"][:10]) == ("2024-02-01", "2024-02-28")
+    assert sum(c["count"] for c in stats["categories"]) == 3000
+
+    bad = auth_client.post("/imports/preview", files={"file": ("x.csv", b"foo,bar\n1,2\n", "text/csv")})
+    assert bad.status_code == 400
+
+
+def test_truncated_preview_imports_the_rest_of_the_file_in_a_job(auth_client, db, user):
+    from ..services import import_jobs
+    lines = ["Data,Valor,Identificador,Descrição"] + [f"07/03/2024,-{i + 1}.00,r-{i},Resto {i}" for i in range(5)]
+    upload = {"file": ("nubank.csv", "\n".join(lines).encode("utf-8"), "text/csv")}
+    preview = auth_client.post("/imports/preview", params={"limit": 3}, files=upload).json()
+    assert preview["truncated"] and len(preview["rows"]) == 3
+
+    # The dialog confirms the reviewed rows (the user dropped the third one)...
+    reviewed = [
+        {"amount": r["amount"], "description": r["description"], "date": r["date"], "type": r["type"], "import_fingerprint": r["fingerprint"]}
+        for r in preview["rows"][:2]
+    ]
+    assert auth_client.post("/imports/confirm", json=reviewed).json()["created"] == 2
+    # ...and queues the rest of the file
+    job = auth_client.post("/imports/jobs", params={"skip_rows": 3}, files=upload).json()
+    import_jobs.process_next(db, "worker-d")
+
+    status = auth_client.get(f"/imports/jobs/{job['id']}").json()
+    assert (status["status"], status["processed_rows"], status["created"]) == ("done", 5, 2)
+    imported = db.query(models.Transaction.description).filter(
+        models.Transaction.user_id == user.id, models.Transaction.description.like("Resto %")
+    ).all()
+    assert sorted(d for d, in imported) == ["Resto 0", "Resto 1", "Resto 3", "Resto 4"]
+
+
+def test_import_preview_maps_to_the_workspace_categories(auth_client, db, user):
+    partner = models.User(email="import-partner@example.com", hashed_password="x")
+    workspace = models.Workspace(name="Empresa", type="business")
+    db.add_all([partner, workspace])
+    db.commit()
+    db.add(models.UserWorkspace(user_id=user.id, workspace_id=workspace.id, role="owner", status="active"))
+    db.commit()
+    personal = crud.create_user_category(db, schemas_category.CategoryCreate(name="Outros", type="expense"), user.id)
+    shared = crud.create_user_category(db, schemas_category.CategoryCreate(name="Outros", type="expense"), partner.id, workspace.id)
+    payload = "Data,Valor,Identificador,Descrição\n01/03/2024,-20.00,id-1,Uber do Brasil\n".encode("utf-8")
+
+    def preview_category(headers):
+        response = auth_client.post("/imports/preview", headers=headers, files={"file": ("nubank.csv", payload, "text/csv")})
+        return response.json()["rows"][0]["category_id"]
+
+    assert preview_category({}) == personal.id
+    assert preview_category({"X-Workspace-Id": str(workspace.id)}) == shared.id
+
+
+class _WorkerCrash(BaseException):
+    pass
+
+
+def test_import_job_runs_in_background_and_resumes(auth_client, db, user, monkeypatch):
+    from ..services import import_jobs
+    lines = ["Data,Valor,Identificador,Descrição"]
+    lines += [f"05/03/2024,-{i + 1}.00,id-{i},Compra job {i}" for i in range(120)]
+    response = auth_client.post(
+        "/imports/jobs", params={"chunk_size": 50},
+        files={"file": ("nubank.csv", "\n".join(lines).encode("utf-8"), "text/csv")}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response.json()["status"] == "queued"
+
+    # The worker dies while parsing row 71: the first chunk is committed with its progress
+    parsed = []
+    real_to_create = import_jobs._to_create
+    def crashing_to_create(row):
+        if len(parsed) == 70:
+            raise _WorkerCrash()
+        parsed.append(row)
+        return real_to_create(row)
+    monkeypatch.setattr(import_jobs, "_to_create", crashing_to_create)
+    with pytest.raises(_WorkerCrash):
+        import_jobs.process_next(db, "worker-a")
+    status = auth_client.get(f"/imports/jobs/{job_id}").json()
+    assert (status["status"], status["processed_rows"], status["created"]) == ("running", 50, 50)
+
+    # Nothing to do until the heartbeat goes stale, then another worker resumes it
+    monkeypatch.setattr(import_jobs, "_to_create", real_to_create)
+    assert import_jobs.process_next(db, "worker-b") is None
+    db.query(models.ImportJob).filter(models.ImportJob.id == job_id).update(
+        {"heartbeat_at": datetime.now() - timedelta(seconds=import_jobs.STALE_SECONDS + 1)}
+    )
+    db.commit()
+    assert import_jobs.process_next(db, "worker-b").id == job_id
+
+    status = auth_client.get(f"/imports/jobs/{job_id}").json()
+    assert status["status"] == "done"
+    assert (status["processed_rows"], status["created"], status["failed"]) == (120, 120, 0)
+    assert status["progress"] == 1.0
+    db.expire_all()
+    assert db.get(models.ImportJobFile, job_id) is None
+    assert db.query(models.Transaction).filter(
+        models.Transaction.user_id == user.id, models.Transaction.description.like("Compra job %")
+    ).count() == 120
+
+    other = auth_client.get(f"/imports/jobs/{job_id + 1000}")
+    assert other.status_code == 404
+
+
+def test_import_job_without_its_file_fails_clearly(auth_client, db):
+    from ..services import import_jobs
+    response = auth_client.post(
+        "/imports/jobs", files={"file": ("nubank.csv", b"Data,Valor,Identificador,Descri\xc3\xa7\xc3\xa3o\n", "text/csv")}
+    )
+    job_id = response.json()["id"]
+    # The upload lives in the database, not on the local disk of the process that received it
+    assert db.get(models.ImportJobFile, job_id).data
+    db.query(models.ImportJobFile).filter(models.ImportJobFile.job_id == job_id).delete()
+    db.commit()
+
+    assert import_jobs.process_next(db, "worker-c").id == job_id
+    status = auth_client.get(f"/imports/jobs/{job_id}").json()
+    assert status["status"] == "failed"
+    assert "não está mais disponível" in status["error"]
+
+
+def test_reimporting_an_overlapping_statement_skips_duplicates(auth_client, db, user):
+    def csv_payload(lines):
+        return ("Data,Valor,Identificador,Descrição\n" + "\n".join(lines)).encode("utf-8")
+
+    def preview(lines):
+        response = auth_client.post("/imports/preview", files={"file": ("nubank.csv", csv_payload(lines), "text/csv")})
+        assert response.status_code == 200
+        return response.json()
+
+    def confirm(rows):
+        return auth_client.post("/imports/confirm", json=[{
+            "amount": r["amount"], "description": r["description"], "date": r["date"], "type": r["type"],
+            "category_id": r["category_id"], "import_fingerprint": r["fingerprint"]
+        } for r in rows]).json()
+
+    # Two identical coffees on the same day are two lines, not a duplicate
+    january = ["10/01/2024,-7.50,a,Café Dedup", "10/01/2024,-7.50,b,Café Dedup", "11/01/2024,-30.00,c,Mercado Dedup"]
+    first = preview(january)
+    assert first["stats"]["duplicate_count"] == 0
+    assert len({r["fingerprint"] for r in first["rows"]}) == 3
+    assert confirm(first["rows"])["created"] == 3
+
+    # The next export overlaps: same lines (different casing/accents) plus a new one
+    overlap = ["10/01/2024,-7.50,a,CAFE  dedup", "10/01/2024,-7.50,b,Café Dedup", "11/01/2024,-30.00,c,Mercado Dedup", "12/01/2024,-7.50,d,Café Dedup"]
+    second = preview(overlap)
+    assert [r["duplicate"] for r in second["rows"]] == [True, True, True, False]
+    assert second["stats"]["duplicate_count"] == 3
+
+    summary = confirm(second["rows"])
+    assert (summary["created"], summary["skipped"], summary["failed"]) == (1, 3, 0)
+    assert db.query(models.Transaction).filter(
+        models.Transaction.user_id == user.id, models.Transaction.description.like("%Dedup")
+    ).count() == 4
@@ -0,0 +1,130 @@
+from datetime import datetime
+import pytest
+from ..services import message_parser
+from ..smart_categorization import normalize
+
+NOW = datetime(2024, 3, 15, 10, 30)
+
+# Captured from the sequential-regex WhatsappAgent.process_message before the
+# grammar was precompiled; quirks included ("R$ almoco", "Ntista") on purpose.
+# (message, command | None | (type, amount, description, status, date, payment method, installments, recurring))
+GOLDEN = [
+    ('oi', 'help'),
+    ('Olá', 'help'),
+    ('ajuda', 'help'),
+    ('MENU', 'help'),
+    ('bom dia', 'help'),
+    ('saldo', 'balance'),
+    ('Balanço', 'balance'),
+    ('resumo', 'balance'),
+    ('últimas', 'recent'),
+    ('historico', 'recent'),
+    ('extrato', 'recent'),
+    ('meta', 'goal'),
+    ('objetivo', 'goal'),
+    ('categorias', 'categories'),
+    ('cats', 'categories'),
+    ('desfazer', 'undo'),
+    ('Cancelar ultimo', 'undo'),
+    ('cancelar última', None),
+    ('anular', 'undo'),
+    ('gastei 50 no uber', ("expense", 50.0, 'Uber', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('Gastei 50,90 no Uber', ("expense", 50.9, 'Uber', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('paguei 120 luz', ("expense", 120.0, 'Luz', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('comprei 30 farmacia', ("expense", 30.0, 'Farmacia', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('compra 1200 iphone em 10x', ("expense", 1200.0, 'Iphone', "paid", "2024-03-15T10:30", "Outros", 10, False)),
+    ('Compra 1200 iPhone em 10 vezes no cartão', ("expense", 1200.0, 'Iphone', "paid", "2024-03-15T10:30", "Cartão", 10, False)),
+    ('vou pagar 150 internet dia 10/03', ("expense", 150.0, 'Internet', "pending", "2024-03-10T10:30", "Outros", 1, False)),
+    ('Vou pagar 150 Internet para 25/02', ("expense", 150.0, 'Internet', "pending", "2024-02-25T10:30", "Outros", 1, False)),
+    ('paguei 80 conta de agua 05/03/2024', ("expense", 80.0, 'Conta de agua', "paid", "2024-03-05T10:30", "Outros", 1, False)),
+    ('paguei 80 agua 5/3/24', ("expense", 80.0, 'Agua', "paid", "2024-03-05T10:30", "Outros", 1, False)),
+    ('gastei 45 almoço ontem', ("expense", 45.0, 'Almoco', "paid", "2024-03-14T10:30", "Outros", 1, False)),
+    ('gastei 45 almoço hoje', ("expense", 45.0, 'Almoco', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('vou pagar 200 aluguel amanhã', ("expense", 200.0, 'Aluguel', "pending", "2024-03-16T10:30", "Outros", 1, False)),
+    ('Assinatura Netflix 50 fixo mensal', ("expense", 50.0, 'Netflix', "paid", "2024-03-15T10:30", "Outros", 1, True)),
+    ('assinatura 44,90 spotify', ("expense", 44.9, 'Spotify', "paid", "2024-03-15T10:30", "Outros", 1, True)),
+    ('plano 99 academia todo mês', ("expense", 99.0, 'Academia', "paid", "2024-03-15T10:30", "Outros", 1, True)),
+    ('mensalidade 300 escola recorrente', ("expense", 300.0, 'Escola', "paid", "2024-03-15T10:30", "Outros", 1, True)),
+    ('debitei 20 padaria no débito', ("expense", 20.0, 'Padaria', "paid", "2024-03-15T10:30", "Débito", 1, False)),
+    ('despesa 75 mercado via pix', ("expense", 75.0, 'Mercado', "paid", "2024-03-15T10:30", "Pix", 1, False)),
+    ('recebi 3000 salario', ("income", 3000.0, 'Salario', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('Recebi 3500 salário ontem', ("income", 3500.0, 'Salario', "paid", "2024-03-14T10:30", "Outros", 1, False)),
+    ('ganhei 150 freelance', ("income", 150.0, 'Freelance', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('vou receber 800 consultoria dia 20/03', ("income", 800.0, 'Consultoria', "pending", "2024-03-20T10:30", "Outros", 1, False)),
+    ('pix 200 do joão', ("income", 200.0, 'Joao', "paid", "2024-03-15T10:30", "Pix", 1, False)),
+    ('entrou 1000 de bonus', ("income", 1000.0, 'Bonus', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('receita 50 venda', ("income", 50.0, 'Venda', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('credito 10 cashback', ("income", 10.0, 'Cashback', "paid", "2024-03-15T10:30", "Crédito", 1, False)),
+    ('20 mercado', ("expense", 20.0, 'Mercado', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('R$ 45 almoço', ("expense", 45.0, 'R$ almoco', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('vou pagar 120,90 mercado', ("expense", 120.9, 'Mercado', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('50 uber pix', ("expense", 50.0, 'Uber', "paid", "2024-03-15T10:30", "Pix", 1, False)),
+    ('0 uber', ("expense", 0.0, 'Uber', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('12 parcelas 300 sofa', ("expense", 12.0, 'Parcelas 300 sofa', "paid", "2024-03-15T10:30", "Outros", 12, False)),
+    ('Netflix 44,50', ("expense", 44.5, 'Netflix', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('Uber 30', ("expense", 30.0, 'Uber', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('uber 30 ontem cartao', ("expense", 30.0, 'Uber', "paid", "2024-03-14T10:30", "Cartão", 1, False)),
+    ('conta de luz 150 pendente', ("expense", 150.0, 'Conta de luz pendente', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('boleto 90 condominio', ("expense", 90.0, 'Condominio', "pending", "2024-03-15T10:30", "Boleto", 1, False)),
+    ('saldo 100', None),
+    ('feito 30 lanche', ("expense", 30.0, 'Feito lanche', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('jantar 80 com amigos dinheiro', ("expense", 80.0, 'Jantar com amigos', "paid", "2024-03-15T10:30", "Dinheiro", 1, False)),
+    ('lanche 15 transferencia', ("expense", 15.0, 'Lanche', "paid", "2024-03-15T10:30", "Transferência", 1, False)),
+    ('qualquer coisa', None),
+    ('50', None),
+    ('gastei R$ 25 em pastel', ("expense", 25.0, 'Gastei r$ em pastel', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('gastei 10 reais pão', ("expense", 10.0, 'Pao', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('paguei 60 gás no dia 12/03', ("expense", 60.0, 'Gas', "paid", "2024-03-12T10:30", "Outros", 1, False)),
+    ('Gastei 33 de 3x pizza', ("expense", 33.0, 'Pizza', "paid", "2024-03-15T10:30", "Outros", 3, False)),
+    ('paguei 100 de fixo 10x', ("expense", 100.0, 'Despesa via WhatsApp', "paid", "2024-03-15T10:30", "Outros", 10, True)),
+    ('comprei 500 tv em 5x 01 / 04', ("expense", 500.0, 'Tv 01 / 04', "paid", "2024-04-01T10:30", "Outros", 5, False)),
+    ('preciso pagar 70 dentista', ("expense", 70.0, 'Ntista', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('tenho que pagar 40 multa', ("expense", 40.0, 'Multa', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('agendado 300 seguro 31/02', ("expense", 300.0, 'Seguro', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('vou pagar 10 coisa 1/13', ("expense", 10.0, 'Coisa', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('quero 50 teste', ("expense", 50.0, 'Teste', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('gastei 50 no', ("expense", 50.0, 'Despesa via WhatsApp', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('   Gastei   50   no   uber   ', ("expense", 50.0, 'Uber', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('pagar 35 para', ("expense", 35.0, 'Despesa via WhatsApp', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('gastei 12 primeira dia 13/03', ("expense", 12.0, 'Primeira', "paid", "2024-03-13T10:30", "Outros", 1, False)),
+    ('recebi 100 de ja', ("income", 100.0, 'Ja', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('aberto 80 oficina', ("expense", 80.0, 'Aberto oficina', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('devendo 100 pro carlos', ("expense", 100.0, 'Devendo pro carlos', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('pro 20 lanche', ("expense", 20.0, 'Pro lanche', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('conta pagar 50 luz', ("expense", 50.0, 'Conta pagar luz', "pending", "2024-03-15T10:30", "Outros", 1, False)),
+    ('123x 10 teste', ("expense", 10.0, 'Teste', "paid", "2024-03-15T10:30", "Outros", 23, False)),
+    ('boleto 50 pix amanha', ("expense", 50.0, 'Despesa via WhatsApp', "pending", "2024-03-16T10:30", "Pix", 1, False)),
+    ('recebido 20 reembolso', ("expense", 20.0, 'Recebido reembolso', "paid", "2024-03-15T10:30", "Outros", 1, False)),
+    ('Pagar 99 de 12 parcelas dia 1/1/25', ("expense", 99.0, 'Dia', "paid", "2025-01-01T10:30", "Outros", 12, False)),
+]
+
+
+def parse(message: str):
+    msg = message.strip()
+    normalized = normalize(msg)
+    command = message_parser.COMMANDS.get(normalized)
+    if command:
+        return command
+    parsed = message_parser.parse_transaction(msg, normalized, now=NOW)
+    if parsed is None:
+        return None
+    return (
+        parsed.tx_type,
+        float(parsed.amount_str.replace(",", ".")),
+        message_parser.clean_description(parsed.description, parsed.tx_type),
+        parsed.status,
+        parsed.custom_date.isoformat(timespec="minutes"),
+        parsed.payment_method,
+        parsed.installment_count,
+        parsed.is_recurring,
+    )
+
+
+@pytest.mark.parametrize("message, expected", GOLDEN)
+def test_golden_corpus(message, expected):
+    assert parse(message) == expected
+
+
+def test_recurrence_sets_the_period():
+    parsed = message_parser.parse_transaction("netflix 50 mensal", "netflix 50 mensal", now=NOW)
+    assert (parsed.is_recurring, parsed.recurrence_period) == (True, "monthly")
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from .. import crud, models, schemas_transaction
+
+# The plans are read from the SQL the crud functions actually emit, so a change to
+# one of those queries that stops it from using its index fails here.
+
+
+@pytest.fixture(scope="module")
+def user(db):
+    db_user = models.User(email="plans@example.com", hashed_password="x", full_name="Plans Test")
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+@contextmanager
+def _captured(db):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def _plan(db, statements, *markers):
+    """EXPLAIN QUERY PLAN of the one captured statement containing every marker.
+
+    The same SQL run more than once (income then expense) counts as one statement.
+    """
+    matches = {sql: params for sql, params in statements if all(m in sql for m in markers)}
+    assert len(matches) == 1, f"expected one statement with {markers}, got {len(matches)}"
+    (sql, params), = matches.items()
+    rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+    return " | ".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("workspace_id, index", [(1, "ix_transactions_workspace_date"), (None, "ix_transactions_user_date")])
+def test_statement_listing_uses_scope_date_index(db, user, workspace_id, index):
+    with _captured(db) as statements:
+        crud.get_transactions(db, user.id, workspace_id)
+    plan = _plan(db, statements, "ORDER BY transactions.date DESC")
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("workspace_id, scope", [(1, "workspace_id"), (None, "user_id")])
+def test_dashboard_range_aggregates_use_scope_date_index(db, user, workspace_id, scope):
+    # Week-based intervals aggregate the raw rows over half-open date ranges
+    with _captured(db) as statements:
+        crud.get_dashboard_summary(db, user.id, workspace_id, month=3, year=2024, interval="weekly")
+    expected = f"ix_transactions_{scope.split('_')[0]}_date ({scope}=? AND date>? AND date<?)"
+    assert expected in _plan(db, statements, "GROUP BY CASE WHEN")
+    assert expected in _plan(db, statements, "FROM categories JOIN transactions", "transactions.type = ?")
+
+
+def test_installment_group_lookups_use_parent_index(db, user):
+    tx = schemas_transaction.TransactionCreate(
+        amount=300, description="Plans installments", date=datetime(2024, 5, 10), type="expense", installment_count=3
+    )
+    parent = crud.create_user_transaction(db, tx, user_id=user.id)
+
+    with _captured(db) as statements:
+        crud.delete_user_transaction(db, parent.id, "single", month=6, year=2024)
+    # The month of the group is found through the id / parent_id lookups, not a scan
+    plan = _plan(db, statements, "transactions.parent_id = ?", "transactions.date >= ?")
+    assert "ix_transactions_parent_id" in plan
+    assert "SCAN transactions" not in plan
+
+    with _captured(db) as statements:
+        crud.delete_user_transaction(db, parent.id, "all")
+    assert "ix_transactions_parent_id" in _plan(db, statements, "DELETE FROM transactions WHERE transactions.parent_id = ?")
+
+
+@pytest.mark.parametrize("workspace_id, index", [(1, "ix_transactions_upcoming_workspace"), (None, "ix_transactions_upcoming_user")])
+def test_upcoming_bills_use_partial_pending_index(db, user, workspace_id, index):
+    with _captured(db) as statements:
+        crud.get_upcoming_transactions(db, user.id, workspace_id)
+    plan = _plan(db, statements, "ORDER BY coalesce(transactions.due_date, transactions.date) ASC")
+    assert index in plan
+    # The index already yields rows in effective-date order
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,137 @@
+from datetime import datetime
+from types import SimpleNamespace
+from .. import crud, crud_category_learning, data_versions, models, schemas_category, schemas_transaction
+from ..smart_categorization import CategoryResolver, KeywordAutomaton, SmartCategorizer, categorizer
+from ..benchmarks.bench_categorizer import legacy_predict, sample_descriptions
+
+
+def test_predictions_match_the_keyword_loop():
+    categorizer = SmartCategorizer()
+    descriptions = sample_descriptions(categorizer, 3000) + [
+        "", "Barbearia do Zé", "UBER EATS", "Pão de Açúcar", "conta de água", "PIX recebido salário", "R$ 99,90"
+    ]
+    for tx_type in ("expense", "income"):
+        for description in descriptions:
+            assert categorizer.predict(description, tx_type) == legacy_predict(categorizer, description, tx_type), description
+
+
+def test_automaton_priority_overlaps_and_word_boundaries():
+    automaton = KeywordAutomaton()
+    automaton.add("mercado livre", 0)
+    automaton.add("mercado", 2)
+    automaton.add("livre", 1)
+    automaton.add("bar", 3, whole_word=True)
+    automaton.build()
+
+    assert automaton.match("compra mercado livre") == 0
+    assert automaton.match("supermercado") == 2
+    assert automaton.match("ar livre") == 1
+    assert automaton.match("barbearia") is None
+    assert automaton.match("bar do ze") == 3
+    assert automaton.match("nada") is None
+
+
+def test_predict_many_and_category_resolver():
+    categorizer = SmartCategorizer()
+    descriptions = ["Almoço no restaurante", "Uber para casa", "Almoço no restaurante", "xyz", "Salário março"]
+    types = ["expense", "expense", "expense", "expense", "income"]
+    assert categorizer.predict_many(descriptions, types) == [categorizer.predict(d, t) for d, t in zip(descriptions, types)]
+    assert categorizer.predict_many(["xyz", "xyz"], "income", fallback=False) == [None, None]
+
+    categories = [SimpleNamespace(id=1, name="Alimentacao"), SimpleNamespace(id=2, name="Transporte e Viagens"), SimpleNamespace(id=3, name="Saúde")]
+    resolver = CategoryResolver(categories)
+    assert [resolver.resolve(n) for n in ("Alimentação", "Transporte", "SAUDE", "Pet")] == [1, 2, 3, None]
+    assert resolver.name_for(1) == "Alimentacao"
+
+
+def test_category_index_is_cached_per_scope_until_a_category_write(db):
+    user = models.User(email="index@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    first = categorizer.resolver(db, user.id)
+    assert categorizer.resolver(db, user.id) is first
+
+    zoo = crud.create_user_category(db, schemas_category.CategoryCreate(name="Zoológico Municipal", type="expense"), user.id)
+    index = categorizer.resolver(db, user.id)
+    assert index is not first
+    assert categorizer.find_category_id(db, user.id, "zoologico") == zoo.id
+
+    crud.update_user_category(db, zoo.id, schemas_category.CategoryCreate(name="Aquário", type="expense"))
+    assert categorizer.find_category_id(db, user.id, "zoologico") is None
+    crud.delete_category(db, zoo.id)
+    assert categorizer.find_category_id(db, user.id, "Aquario") is None
+
+    # Workspace lookups see the workspace's categories, not the caller's personal ones
+    shared = models.Category(name="Feira da Casa", type="expense", user_id=user.id + 1000, workspace_id=4242)
+    db.add(shared)
+    data_versions.bump_categories(db, shared.user_id, 4242)
+    db.commit()
+    assert categorizer.find_category_id(db, user.id, "Feira", workspace_id=4242) == shared.id
+    assert categorizer.find_category_id(db, user.id, "Feira") is None
+
+
+def test_learned_categorizer_follows_the_users_choices(db):
+    owner = models.User(email="learner@example.com", hashed_password="x", full_name="Learner")
+    db.add(owner)
+    db.commit()
+    market = crud.create_user_category(db, schemas_category.CategoryCreate(name="Mercado", type="expense"), owner.id)
+    pets = crud.create_user_category(db, schemas_category.CategoryCreate(name="Pets", type="expense"), owner.id)
+    now = datetime.now()
+
+    assert crud_category_learning.predict(db, owner.id, None, "Casa Kobayashi") is None
+    txs = [
+        crud.create_user_transaction(db, schemas_transaction.TransactionCreate(
+            amount=30, description=f"Casa Kobayashi {n}", date=now, type="expense", category_id=market.id
+        ), user_id=owner.id)
+        for n in range(2)
+    ]
+    assert crud_category_learning.predict(db, owner.id, None, "CASA KOBAYASHI ltda") == market.id
+    assert crud_category_learning.predict(db, owner.id, None, "Padaria") is None
+
+    # Recategorizing moves the evidence, and the prediction follows
+    for tx in txs:
+        crud.update_user_transaction(db, tx.id, schemas_transaction.TransactionCreate(
+            amount=30, description=tx.description, date=now, type="expense", category_id=pets.id
+        ))
+    assert crud_category_learning.predict(db, owner.id, None, "Casa Kobayashi") == pets.id
+
+    # The persisted counts rebuild the same model in a fresh process
+    crud_category_learning.model_cache.clear()
+    assert crud_category_learning.predict(db, owner.id, None, "Casa Kobayashi") == pets.id
+    assert crud_category_learning.rebuild(db) >= 2
+    assert crud_category_learning.predict(db, owner.id, None, "Casa Kobayashi") == pets.id
+
+    crud.delete_category(db, pets.id)
+    crud_category_learning.model_cache.clear()
+    assert crud_category_learning.predict(db, owner.id, None, "Casa Kobayashi") is None
+
+
+def test_learned_model_follows_commits_and_deletes(db):
+    owner = models.User(email="forgetful@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    market = crud.create_user_category(db, schemas_category.CategoryCreate(name="Feira", type="expense"), owner.id)
+    assert crud_category_learning.predict(db, owner.id, None, "Feira Livre") is None
+
+    # Counts of a rolled back transaction never reach the cached model
+    row = SimpleNamespace(description="Feira Livre", category_id=market.id, user_id=owner.id, workspace_id=None, parent_id=None)
+    crud_category_learning.learn(db, [row, row])
+    db.rollback()
+    assert crud_category_learning.predict(db, owner.id, None, "Feira Livre") is None
+
+    txs = [
+        crud.create_user_transaction(db, schemas_transaction.TransactionCreate(
+            amount=8, description="Feira Livre", date=datetime.now(), type="expense", category_id=market.id
+        ), user_id=owner.id)
+        for _ in range(2)
+    ]
+    learned = crud_category_learning.get_model(db, owner.id)
+    assert learned.predict("Feira Livre") == market.id
+
+    # Deleted rows stop voting; the model readers already hold is left as it was
+    crud.delete_user_transactions(db, [txs[0].id])
+    crud.delete_user_transaction(db, txs[1].id)
+    assert crud_category_learning.predict(db, owner.id, None, "Feira Livre") is None
+    assert learned.predict("Feira Livre") == market.id
+    crud_category_learning.model_cache.clear()
+    assert crud_category_learning.predict(db, owner.id, None, "Feira Livre") is None
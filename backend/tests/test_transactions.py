@@ -0,0 +1,376 @@
+import json
+import pytest
+from sqlalchemy import event
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from .. import crud, crud_recurrence, crud_rollups, data_versions, models, schemas_category, schemas_transaction, schemas_workspace, auth as auth_service
+from ..response_cache import LRUCache, summary_cache
+from ..main import app
+
+
+@pytest.fixture(scope="module")
+def user(db):
+    db_user = models.User(email="ledger@example.com", hashed_password="x", full_name="Ledger Test")
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+@pytest.fixture(scope="module")
+def auth_client(client, user):
+    app.dependency_overrides[auth_service.get_current_active_user] = lambda: user
+    yield client
+    app.dependency_overrides.pop(auth_service.get_current_active_user, None)
+
+
+def _add(db, user, amount, date, tx_type="expense", **extra):
+    tx = schemas_transaction.TransactionCreate(
+        amount=amount, description=f"Tx {amount}", date=date, type=tx_type, **extra
+    )
+    return crud.create_user_transaction(db, tx, user_id=user.id)
+
+
+def test_cursor_pages_match_offset_pages(db, user):
+    base = datetime(2023, 1, 1, 12, 0)
+    for i in range(25):
+        # Pairs of rows share a date so the id tie-breaker is exercised
+        _add(db, user, 10 + i, base + timedelta(days=i // 2))
+
+    offset_ids = [t["id"] for t in crud.get_transactions(db, user_id=user.id, limit=100)]
+
+    cursor_ids = []
+    cursor = None
+    while True:
+        page = crud.get_transactions(db, user_id=user.id, limit=7, cursor=cursor)
+        cursor_ids.extend(t["id"] for t in page)
+        if len(page) < 7:
+            break
+        cursor = crud.encode_transaction_cursor(page[-1])
+
+    assert cursor_ids == offset_ids
+
+
+def test_summary_view_cursor_orders_by_id(db, user):
+    first = crud.get_transactions(db, user_id=user.id, limit=5, summary_view=True)
+    cursor = crud.encode_transaction_cursor(first[-1], summary_view=True)
+    second = crud.get_transactions(db, user_id=user.id, limit=5, summary_view=True, cursor=cursor)
+
+    assert max(t["id"] for t in second) < min(t["id"] for t in first)
+
+
+def test_invalid_cursor_is_rejected(auth_client):
+    response = auth_client.get("/transactions/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_next_cursor_header(auth_client):
+    response = auth_client.get("/transactions/", params={"limit": 10})
+    assert response.status_code == 200
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = auth_client.get("/transactions/", params={"limit": 10, "cursor": next_cursor})
+    assert response.status_code == 200
+    assert len(response.json()) == 10
+
+
+def test_dashboard_trend_buckets(db):
+    owner = models.User(email="trend@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    _add(db, owner, 100, datetime(2024, 2, 10), "income")
+    _add(db, owner, 40, datetime(2024, 3, 5), "expense")
+    _add(db, owner, 60, datetime(2024, 3, 31, 23, 59), "expense")
+    _add(db, owner, 500, datetime(2024, 4, 1), "income")
+    _add(db, owner, 999, datetime(2024, 3, 15), "expense", status="pending")
+
+    summary = crud.get_dashboard_summary(db, user_id=owner.id, month=3, year=2024)
+
+    assert summary["total_expenses"] == 100.0
+    assert [p["value"] for p in summary["income_trend"]] == [100.0, 0.0, 500.0, 0.0]
+    assert [p["value"] for p in summary["expense_trend"]] == [0.0, 100.0, 0.0, 0.0]
+    assert [p["name"] for p in summary["income_trend"]] == ["Feb 2024", "Mar 2024", "Apr 2024", "May 2024"]
+
+    yearly = crud.get_dashboard_summary(db, user_id=owner.id, month=3, year=2024, interval="yearly")
+    assert [p["value"] for p in yearly["income_trend"]] == [0.0, 0.0, 600.0, 0.0, 0.0]
+
+
+def _rollup_snapshot(db, owner):
+    rows = db.query(models.TransactionMonthlyRollup).filter(models.TransactionMonthlyRollup.user_id == owner.id).all()
+    snapshot = {}
+    for r in rows:
+        key = (r.year, r.month, r.type, r.status, r.category_id)
+        total, count = snapshot.get(key, (0.0, 0))
+        snapshot[key] = (round(total + r.total, 2), count + r.count)
+    return {k: v for k, v in snapshot.items() if v != (0.0, 0)}
+
+
+def test_rollups_follow_every_write_path(db):
+    owner = models.User(email="rollup@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+
+    single = _add(db, owner, 80, datetime(2024, 5, 3))
+    pending = _add(db, owner, 30, datetime(2024, 5, 20), status="pending")
+    series = _add(db, owner, 300, datetime(2024, 5, 10), installment_count=3)
+    _add(db, owner, 25, datetime(2024, 5, 1), is_recurring=True, recurrence_period="monthly")
+    doomed = _add(db, owner, 12, datetime(2024, 6, 2), "income")
+
+    crud.update_user_transaction(db, single.id, schemas_transaction.TransactionCreate(
+        amount=90, description="Edited", date=datetime(2024, 6, 3), type="expense"
+    ))
+    crud.settle_transaction(db, pending.id, owner.id)
+    crud.delete_user_transaction(db, series.id, delete_type="all")
+    crud.delete_user_transactions(db, [doomed.id])
+
+    maintained = _rollup_snapshot(db, owner)
+    crud_rollups.rebuild_rollups(db, user_id=owner.id)
+    assert maintained == _rollup_snapshot(db, owner)
+
+    summary = crud.get_dashboard_summary(db, user_id=owner.id, month=5, year=2024)
+    assert summary["total_expenses"] == 55.0
+
+
+def test_summary_cache_hits_until_a_write(auth_client, db, user):
+    summary_cache.clear()
+    params = {"month": 1, "year": 2023}
+
+    first = auth_client.get("/transactions/summary", params=params).json()
+    second = auth_client.get("/transactions/summary", params=params).json()
+    assert first == second
+    assert summary_cache.stats()["hits"] == 1
+
+    _add(db, user, 7, datetime(2023, 1, 20))
+    third = auth_client.get("/transactions/summary", params=params).json()
+    assert third["total_expenses"] == first["total_expenses"] + 7
+    assert summary_cache.stats()["misses"] == 2
+
+
+def test_category_write_bumps_data_version(db, user):
+    before = data_versions.get_version(db, user.id)
+    crud.create_user_category(db, schemas_category.CategoryCreate(name="Viagem", type="expense"), user_id=user.id)
+    assert data_versions.get_version(db, user.id) == before + 1
+
+
+def test_deleting_a_workspace_bumps_its_members_personal_versions(db):
+    from .. import workspace_crud
+    owner = models.User(email="ws-owner@example.com", hashed_password="x")
+    member = models.User(email="ws-member@example.com", hashed_password="x")
+    db.add_all([owner, member])
+    db.commit()
+    workspace = workspace_crud.create_workspace(db, schemas_workspace.WorkspaceCreate(name="Casa", type="family"), owner.id)
+    db.add(models.UserWorkspace(user_id=member.id, workspace_id=workspace.id, role="member", status="active"))
+    db.commit()
+    crud.create_user_transaction(db, schemas_transaction.TransactionCreate(
+        amount=40, description="Feira", date=datetime(2024, 7, 1), type="expense"
+    ), user_id=member.id, workspace_id=workspace.id)
+    before = {u.id: data_versions.get_version(db, u.id) for u in (owner, member)}
+
+    assert workspace_crud.delete_workspace(db, workspace.id, owner.id)
+    assert all(data_versions.get_version(db, user_id) > version for user_id, version in before.items())
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_etag_revalidation(auth_client, db, user, monkeypatch):
+    for path in ("/transactions/", "/transactions/summary", "/transactions/upcoming/list", "/categories/"):
+        first = auth_client.get(path)
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        cached = auth_client.get(path, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["ETag"] == etag
+
+    etag = auth_client.get("/categories/").headers["ETag"]
+    crud.create_user_category(db, schemas_category.CategoryCreate(name="Pets", type="expense"), user_id=user.id)
+    changed = auth_client.get("/categories/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert any(c["name"] == "Pets" for c in changed.json())
+
+    # Transaction writes leave the categories ETag alone...
+    etag = changed.headers["ETag"]
+    _add(db, user, 3, datetime(2023, 2, 1))
+    assert auth_client.get("/categories/", headers={"If-None-Match": etag}).status_code == 304
+
+    # ...and listings with virtual occurrences change when their window moves to the next day
+    etag = auth_client.get("/transactions/").headers["ETag"]
+    tomorrow = crud_recurrence.listing_end(datetime.now().date() + timedelta(days=1))
+    monkeypatch.setattr(crud_recurrence, "listing_end", lambda today=None: tomorrow)
+    assert auth_client.get("/transactions/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_export_streams_csv_and_ndjson(auth_client, db):
+    response = auth_client.get("/transactions/export", params={"format": "csv", "from": "2023-01-01", "to": "2023-01-03"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.strip().splitlines()
+    assert lines[0].split(",") == crud.EXPORT_COLUMNS
+    # Jan 1-3 2023 hold two seeded rows per day (see test_cursor_pages_match_offset_pages)
+    assert len(lines) == 1 + 6
+
+    response = auth_client.get("/transactions/export", params={"format": "ndjson", "from": "2023-01-01", "to": "2023-01-03"})
+    rows = [json.loads(line) for line in response.text.strip().splitlines()]
+    assert len(rows) == 6
+    assert rows == sorted(rows, key=lambda r: (r["date"], r["id"]))
+
+    assert auth_client.get("/transactions/export", params={"format": "xml"}).status_code == 400
+
+
+def test_recurrence_is_stored_as_a_rule_and_expanded_on_read(db):
+    owner = models.User(email="recurring@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+
+    rule = _add(db, owner, 50, datetime(2024, 1, 31), is_recurring=True, recurrence_period="monthly",
+                recurrence_end_date=datetime(2024, 6, 30))
+    assert db.query(models.Transaction).filter(models.Transaction.user_id == owner.id).count() == 1
+
+    listing = crud.get_transactions(db, user_id=owner.id, limit=100)
+    assert [t["date"].date().isoformat() for t in listing] == [
+        "2024-06-30", "2024-05-31", "2024-04-30", "2024-03-31", "2024-02-29", "2024-01-31"
+    ]
+    assert all(t["is_virtual"] and t["id"] == rule.id for t in listing)
+
+    # Cursor pages walk virtual occurrences like stored rows
+    paged, cursor = [], None
+    while True:
+        page = crud.get_transactions(db, user_id=owner.id, limit=4, cursor=cursor)
+        paged.extend(page)
+        if len(page) < 4:
+            break
+        cursor = crud.encode_transaction_cursor(page[-1])
+    assert [t["date"] for t in paged] == [t["date"] for t in listing]
+
+    assert crud.get_dashboard_summary(db, user_id=owner.id, month=3, year=2024)["total_expenses"] == 50.0
+
+    bill = _add(db, owner, 120, datetime(2024, 1, 10), status="pending", is_recurring=True,
+                recurrence_period="weekly", recurrence_end_date=datetime(2024, 1, 31))
+    upcoming = crud.get_upcoming_transactions(db, user_id=owner.id, month=1, year=2024)
+    assert [t["date"].day for t in upcoming] == [10, 17, 24, 31]
+
+    # Paying one occurrence materializes just that one
+    paid = crud.settle_transaction(db, bill.id, owner.id, occurrence=2)
+    assert (paid.parent_id, paid.installment_number, paid.status) == (bill.id, 2, "paid")
+    assert paid.date == datetime(2024, 1, 17)
+
+    # Deleting by month skips the first remaining occurrence of that month
+    crud.delete_user_transaction(db, bill.id, delete_type="single", month=1, year=2024)
+    upcoming = crud.get_upcoming_transactions(db, user_id=owner.id, month=1, year=2024)
+    assert [t["date"].day for t in upcoming] == [24, 31]
+
+    assert crud.get_dashboard_summary(db, user_id=owner.id, month=1, year=2024)["total_expenses"] == 170.0
+    maintained = _rollup_snapshot(db, owner)
+    crud_rollups.rebuild_rollups(db, user_id=owner.id)
+    assert maintained == _rollup_snapshot(db, owner)
+
+
+def test_occurrences_of_an_imported_rule_leave_its_fingerprint(db):
+    owner = models.User(email="fingerprinted-rule@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    rule = _add(db, owner, 30, datetime(2024, 1, 5), status="pending", is_recurring=True,
+                recurrence_period="monthly", import_fingerprint="line-1")
+
+    first = crud.settle_transaction(db, rule.id, owner.id, occurrence=1)
+    second = crud.settle_transaction(db, rule.id, owner.id, occurrence=2)
+    assert (first.import_fingerprint, second.import_fingerprint) == (None, None)
+    assert crud.existing_fingerprints(db, owner.id, None, ["line-1"]) == {"line-1"}
+
+
+def test_cursor_pages_keep_every_virtual_occurrence(db):
+    owner = models.User(email="weekly-cursor@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    start = datetime.now() - timedelta(days=300)
+    for i in range(40):
+        _add(db, owner, 10 + i, start + timedelta(days=i * 9, hours=3))
+    _add(db, owner, 25, start, is_recurring=True, recurrence_period="weekly")
+
+    listing = crud.get_transactions(db, user_id=owner.id, limit=1000)
+    paged, cursor = [], None
+    while True:
+        page = crud.get_transactions(db, user_id=owner.id, limit=7, cursor=cursor)
+        paged.extend(page)
+        if len(page) < 7:
+            break
+        cursor = crud.encode_transaction_cursor(page[-1])
+    assert [(t["date"], t["id"]) for t in paged] == [(t["date"], t["id"]) for t in listing]
+
+
+def test_recurrence_periods():
+    def dates(period, anchor, start=None, end=None):
+        rule = SimpleNamespace(date=anchor, recurrence_period=period, recurrence_end_date=None, recurrence_skips="2")
+        return [d.date().isoformat() for _, d in crud_recurrence.iter_occurrences(rule, start, end)]
+
+    assert dates("daily", datetime(2024, 3, 1, 9), datetime(2024, 3, 5), datetime(2024, 3, 8)) == [
+        "2024-03-05", "2024-03-06", "2024-03-07"
+    ]
+    assert dates("weekly", datetime(2024, 3, 1), end=datetime(2024, 3, 23)) == ["2024-03-01", "2024-03-15", "2024-03-22"]
+    assert dates("yearly", datetime(2024, 2, 29), end=datetime(2029, 1, 1)) == [
+        "2024-02-29", "2026-02-28", "2027-02-28", "2028-02-29"
+    ]
+
+
+def test_installment_series_is_inserted_in_bulk(db):
+    owner = models.User(email="installments@example.com", hashed_password="x")
+    db.add(owner)
+    db.commit()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        parent = _add(db, owner, 480, datetime(2022, 1, 15), installment_count=48)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert sum(s.startswith("INSERT INTO transactions ") for s in statements) == 2
+    assert len(statements) < 12
+    series = db.query(models.Transaction).filter(models.Transaction.parent_id == parent.id).all()
+    assert len(series) == 47
+    assert round(parent.amount + sum(t.amount for t in series), 2) == 480
+
+
+def test_batch_create(auth_client, db):
+    items = [
+        {"amount": 10 + i, "description": f"Lote {i}", "date": "2021-06-01T10:00:00", "type": "expense"}
+        for i in range(1000)
+    ]
+    items.append({"amount": 300, "description": "Parcelado", "date": "2021-06-02T10:00:00", "type": "expense", "installment_count": 3})
+
+    response = auth_client.post("/transactions/batch", json=items)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 1001 and len(body["ids"]) == 1001
+
+    created = {t.id: t for t in db.query(models.Transaction).filter(models.Transaction.id.in_(body["ids"]))}
+    assert [created[i].description for i in body["ids"][:3]] == ["Lote 0", "Lote 1", "Lote 2"]
+    assert db.query(models.Transaction).filter(models.Transaction.parent_id == body["ids"][-1]).count() == 2
+
+    june = crud.get_dashboard_summary(db, user_id=created[body["ids"][0]].user_id, month=6, year=2021)
+    assert june["total_expenses"] == sum(10 + i for i in range(1000)) + 100
+
+    assert auth_client.post("/transactions/batch", json=[{"amount": "x"}]).status_code == 422
+
+    # Items without a category get the predicted one when the user has it
+    owner_id = created[body["ids"][0]].user_id
+    transporte = crud.create_user_category(db, schemas_category.CategoryCreate(name="Transporte", type="expense"), owner_id)
+    body = auth_client.post("/transactions/batch", json=[
+        {"amount": 25, "description": "Uber aeroporto", "date": "2021-07-01T10:00:00", "type": "expense"},
+        {"amount": 5, "description": "Algo sem regra", "date": "2021-07-01T10:00:00", "type": "expense"},
+    ]).json()
+    assert [db.get(models.Transaction, i).category_id for i in body["ids"]] == [transporte.id, None]
@@ -0,0 +1,159 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from .. import crud, models, schemas_transaction
+from ..services import whatsapp_queue
+from .conftest import TestingSessionLocal
+
+
+@pytest.fixture(scope="module")
+def phone_user(db):
+    user = models.User(email="zap@example.com", hashed_password="x", full_name="Zap", phone_number="+5548999990000")
+    workspace = models.Workspace(name="Casa", type="family")
+    db.add_all([user, workspace])
+    db.commit()
+    db.add(models.UserWorkspace(user_id=user.id, workspace_id=workspace.id, role="owner"))
+    db.commit()
+    return user
+
+
+def test_inline_reply_without_a_worker_pool(client, phone_user):
+    response = client.post("/webhook/whatsapp", data={"From": "whatsapp:+5548999990000", "Body": "ajuda"})
+    assert response.status_code == 200
+    assert "<Message>🤖 *FinControl Pro" in response.text
+
+    unknown = client.post("/webhook/whatsapp", data={"From": "whatsapp:+5511000000000", "Body": "saldo"})
+    assert "VINCULAR" in unknown.text
+
+
+def test_fast_ack_replies_through_the_sender(client, db, phone_user, monkeypatch):
+    sender = whatsapp_queue.FakeSender()
+    pool = whatsapp_queue.WhatsappWorkerPool(TestingSessionLocal, sender, size=2)
+    pool.start()
+    monkeypatch.setattr(whatsapp_queue, "pool", pool)
+    try:
+        response = client.post("/webhook/whatsapp", data={"From": "whatsapp:+5548999990000", "Body": "gastei 42 no cinema"})
+        assert response.status_code == 200
+        assert response.text == whatsapp_queue.EMPTY_TWIML
+        pool.join()
+    finally:
+        pool.stop()
+
+    assert len(sender.sent) == 1
+    to, body = sender.sent[0]
+    assert to == "+5548999990000" and "Despesa registrada" in body
+    db.expire_all()
+    assert db.query(models.Transaction).filter(models.Transaction.description == "Cinema").count() == 1
+
+    stats = pool.stats()
+    assert (stats["enqueued"], stats["processed"], stats["failed"], stats["queue_depth"]) == (1, 1, 0, 0)
+    assert stats["processing_ms"]["p99"] >= stats["processing_ms"]["p50"] >= 0
+
+
+def test_full_queue_falls_back_to_inline(client, phone_user, monkeypatch):
+    pool = whatsapp_queue.WhatsappWorkerPool(TestingSessionLocal, whatsapp_queue.FakeSender(), size=0, max_queue=1)
+    monkeypatch.setattr(whatsapp_queue, "pool", pool)
+    assert pool.submit("+5548999990000", "saldo")
+    response = client.post("/webhook/whatsapp", data={"From": "whatsapp:+5548999990000", "Body": "ajuda"})
+    assert "<Message>" in response.text
+    assert pool.stats()["inline"] == 1
+
+
+
+def test_one_phone_is_handled_in_order_by_a_multi_worker_pool(db, phone_user, monkeypatch):
+    from .. import crud
+    # A slow insert: with a shared queue the second worker would run "desfazer" first
+    create = crud.create_user_transaction
+
+    def slow_create(*args, **kwargs):
+        time.sleep(0.2)
+        return create(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "create_user_transaction", slow_create)
+    sender = whatsapp_queue.FakeSender()
+    pool = whatsapp_queue.WhatsappWorkerPool(TestingSessionLocal, sender, size=2)
+    pool.start()
+    try:
+        assert pool.submit("+5548999990000", "gastei 50 no uber")
+        assert pool.submit("+5548999990000", "desfazer")
+        pool.join()
+    finally:
+        pool.stop()
+
+    replies = [body for _, body in sender.sent]
+    assert "Despesa registrada" in replies[0] and "Uber" in replies[1]
+    db.expire_all()
+    assert db.query(models.Transaction).filter(models.Transaction.description == "Uber").count() == 0
+    # The expense registered before the pair is untouched
+    assert db.query(models.Transaction).filter(models.Transaction.description == "Cinema").count() == 1
+
+def test_phone_resolution_is_cached_until_linking_or_membership_changes(db, phone_user):
+    from .. import phone_directory, workspace_crud
+    phone_directory.phone_cache.clear()
+    owner = phone_directory.resolve(db, "+5548999990000")
+    assert (owner.id, owner.workspace_id) == (phone_user.id, phone_user.workspaces[0].workspace_id)
+    assert phone_directory.resolve(db, "+5548999990000") is owner
+    assert phone_directory.resolve(db, "+5500000000001") is None
+    assert phone_directory.resolve(db, "+5500000000001") is None
+    assert phone_directory.phone_cache.stats()["hits"] == 2
+
+    # Linking a new number invalidates its cached "unknown"
+    other = models.User(email="novo@example.com", hashed_password="x", full_name="Novo")
+    db.add(other)
+    db.commit()
+    reply = whatsapp_queue.handle_message(db, "+5500000000001", "VINCULAR novo@example.com")
+    assert reply.startswith("✅")
+    assert phone_directory.resolve(db, "+5500000000001").id == other.id
+
+    # Leaving the workspace invalidates the member's entry
+    workspace_crud.remove_membership(db, owner.workspace_id, phone_user.id)
+    assert phone_directory.resolve(db, "+5548999990000") is not owner
+
+
+def test_twilio_retries_get_the_original_reply_without_a_second_write(client, db, phone_user):
+    from ..services import whatsapp_deliveries
+    form = {"From": "whatsapp:+5548999990000", "Body": "gastei 37 no teatro", "MessageSid": "SM0001"}
+
+    first = client.post("/webhook/whatsapp", data=form)
+    whatsapp_deliveries.delivery_cache.clear()  # as if the retry reached another process
+    retry = client.post("/webhook/whatsapp", data=form)
+    assert "Despesa registrada" in first.text
+    assert retry.text == first.text
+    db.expire_all()
+    assert db.query(models.Transaction).filter(models.Transaction.description == "Teatro").count() == 1
+    assert db.query(models.WhatsappDelivery).filter(models.WhatsappDelivery.message_sid == "SM0001").one().reply
+
+    # Expired deliveries are purged
+    db.query(models.WhatsappDelivery).update({"created_at": datetime.now() - timedelta(hours=whatsapp_deliveries.DEDUP_TTL_HOURS + 1)})
+    db.commit()
+    assert whatsapp_deliveries.purge(db) == 1
+
+
+def test_whatsapp_balance_splits_paid_and_pending_from_rollups(db):
+    from ..services.whatsapp_agent import WhatsappAgent
+    owner = models.User(email="saldo@example.com", hashed_password="x", full_name="Saldo")
+    db.add(owner)
+    db.commit()
+    now = datetime.now()
+
+    def add(amount, date=now, tx_type="expense", **extra):
+        tx = schemas_transaction.TransactionCreate(amount=amount, description=f"Tx {amount}", date=date, type=tx_type, **extra)
+        crud.create_user_transaction(db, tx, user_id=owner.id)
+
+    add(1000, tx_type="income")
+    add(50, tx_type="income", status="pending")
+    add(300)
+    add(200, status="pending")
+    add(999, now - timedelta(days=40))
+    # Legacy "Pago" counts as received; statuses outside both lists are left out
+    add(100, tx_type="income", status="Pago")
+    add(700, status="pending_approval")
+
+    reply = WhatsappAgent(db, owner, None).process_message("saldo")
+    assert "Receitas: R$ 1,100.00" in reply
+    assert "Despesas: R$ 300.00" in reply
+    assert "*Saldo: R$ 800.00*" in reply
+    assert "A receber: R$ 50.00" in reply and "A pagar: R$ 200.00" in reply
+    assert "Saldo previsto: R$ 650.00" in reply
+    # The pending_approval row is in neither total, so it is not counted either
+    assert "Total de 5 transações" in reply
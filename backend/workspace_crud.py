@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from . import models, schemas_workspace
+from . import models, schemas_workspace, data_versions, phone_directory, crud_category_learning
 from datetime import datetime
 
 def create_workspace(db: Session, workspace: schemas_workspace.WorkspaceCreate, user_id: int):
@@ -36,6 +36,7 @@ def create_workspace(db: Session, workspace: schemas_workspace.WorkspaceCreate,
     )
     db.add(membership)
     db.commit()
+    phone_directory.invalidate_users([user_id])
     return db_workspace
 
 def get_user_workspaces(db: Session, user_id: int):
@@ -72,6 +73,7 @@ def add_team_member(db: Session, workspace_id: int, email: str, role: str):
         status="pending"
     )
     db.add(membership)
+    data_versions.bump(db, [("workspace", workspace_id)])
     
     # Create Notification if it doesn't exist yet
     workspace = db.query(models.Workspace).filter(models.Workspace.id == workspace_id).first()
@@ -93,6 +95,7 @@ def add_team_member(db: Session, workspace_id: int, email: str, role: str):
         db.add(notification)
     
     db.commit()
+    phone_directory.invalidate_users([user.id])
     return membership
 
 def respond_to_invite(db: Session, user_id: int, workspace_id: int, accept: bool):
@@ -109,7 +112,9 @@ def respond_to_invite(db: Session, user_id: int, workspace_id: int, accept: bool
     else:
         db.delete(membership)
     
+    data_versions.bump(db, [("workspace", workspace_id)])
     db.commit()
+    phone_directory.invalidate_users([user_id])
     return membership
 
 def get_team_members(db: Session, workspace_id: int):
@@ -151,7 +156,9 @@ def remove_membership(db: Session, workspace_id: int, user_id: int):
         return False
     
     db.delete(membership)
+    data_versions.bump(db, [("workspace", workspace_id)])
     db.commit()
+    phone_directory.invalidate_users([user_id])
     return True
 
 def delete_workspace(db: Session, workspace_id: int, user_id: int):
@@ -171,15 +178,33 @@ def delete_workspace(db: Session, workspace_id: int, user_id: int):
 
     # Delete related data (manually if cascades aren't set, or just to be safe)
     # 1. Delete all memberships
+    member_ids = [row[0] for row in db.query(models.UserWorkspace.user_id).filter(models.UserWorkspace.workspace_id == workspace_id)]
     db.query(models.UserWorkspace).filter(models.UserWorkspace.workspace_id == workspace_id).delete()
     
-    # 2. Delete transactions
+    # 2. Delete transactions (and their dashboard rollups)
+    # (rows also show up in their owners' personal scope, which may include former members)
+    owner_ids = [row[0] for row in db.query(models.Transaction.user_id).filter(models.Transaction.workspace_id == workspace_id).distinct()]
+    db.query(models.TransactionMonthlyRollup).filter(models.TransactionMonthlyRollup.workspace_id == workspace_id).delete()
     db.query(models.Transaction).filter(models.Transaction.workspace_id == workspace_id).delete()
     
-    # 3. Delete categories
+    # 3. Delete categories (they were also visible in their creators' personal scope)
+    category_owners = [row[0] for row in db.query(models.Category.user_id).filter(models.Category.workspace_id == workspace_id).distinct()]
+    data_versions.bump(db, [("workspace_categories", workspace_id)] + [("user_categories", owner) for owner in category_owners])
+    workspace_categories = db.query(models.Category.id).filter(models.Category.workspace_id == workspace_id)
+    db.query(models.CategoryTokenCount).filter(
+        (models.CategoryTokenCount.scope == "workspace") & (models.CategoryTokenCount.scope_id == workspace_id)
+        | models.CategoryTokenCount.category_id.in_(workspace_categories.scalar_subquery())
+    ).delete(synchronize_session=False)
     db.query(models.Category).filter(models.Category.workspace_id == workspace_id).delete()
     
-    # 4. Delete workspace
+    # 4. Delete workspace (members' personal summaries held its rows too)
+    data_versions.bump(db, [("workspace", workspace_id)] + [("user", user) for user in set(member_ids) | set(owner_ids) if user is not None])
     db.delete(workspace)
     db.commit()
+    # Members (and numbers that fell back to this workspace) resolve again
+    phone_directory.invalidate_workspace(workspace_id)
+    # The deleted counts were also in the personal models of whoever used the workspace's categories
+    crud_category_learning.forget_scopes(
+        [("workspace", workspace_id)] + [("user", user) for user in set(member_ids) | set(category_owners)]
+    )
     return True
@@ -21,6 +21,8 @@ interface TransactionPreview {
     category_id: number | null
     category_name: string
     status?: 'paid' | 'pending'
+    fingerprint?: string
+    duplicate?: boolean // Already imported; the backend skips it on confirm
 }
 
 interface ImportTransactionsDialogProps {
@@ -37,6 +39,9 @@ export function ImportTransactionsDialog({
     const [step, setStep] = useState<'upload' | 'preview' | 'processing'>('upload')
     const [file, setFile] = useState<File | null>(null)
     const [previewData, setPreviewData] = useState<TransactionPreview[]>([])
+    // Rows the preview returned out of the whole file; the rest go to a background job
+    const [previewCount, setPreviewCount] = useState(0)
+    const [truncated, setTruncated] = useState(false)
     const [categories, setCategories] = useState<Category[]>([])
     const [loading, setLoading] = useState(false)
     const fileInputRef = useRef<HTMLInputElement>(null)
@@ -72,7 +77,13 @@ export function ImportTransactionsDialog({
                 headers: { 'Content-Type': 'multipart/form-data' }
             })
 
-            setPreviewData(data)
+            // Large files come back truncated; stats still describe the whole file
+            setPreviewData(data.rows)
+            setPreviewCount(data.rows.length)
+            setTruncated(data.truncated)
+            if (data.truncated) {
+                toast.warning(`Arquivo grande: revisando as primeiras ${data.rows.length} de ${data.stats.row_count} linhas. As demais serão importadas em segundo plano com a categoria sugerida.`)
+            }
             setStep('preview')
         } catch (error: any) {
             console.error("Erro no upload", error)
@@ -101,6 +112,28 @@ export function ImportTransactionsDialog({
         setPreviewData(prev => prev.filter((_, i) => i !== index))
     }
 
+    // Polls the background job for the rows past the preview until it finishes
+    const followImportJob = async (jobId: number) => {
+        try {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 2000))
+                const { data: job } = await api.get(`/imports/jobs/${jobId}`)
+                if (job.status === 'done') {
+                    toast.success(`${job.created} transações restantes importadas com sucesso!`)
+                    onImportSuccess()
+                    return
+                }
+                if (job.status === 'failed') {
+                    toast.error(job.error || "Erro ao importar o restante do arquivo.")
+                    return
+                }
+            }
+        } catch (error) {
+            console.error("Erro ao acompanhar importação", error)
+            toast.error("Não foi possível acompanhar a importação do restante do arquivo.")
+        }
+    }
+
     const handleConfirmImport = async () => {
         setLoading(true)
         setStep('processing')
@@ -116,12 +149,32 @@ export function ImportTransactionsDialog({
                 status: 'paid', // Imported transactions are usually past/paid
                 paid_at: t.date, // Assume paid at transaction date
                 payment_method: 'Credit Card', // Default assumption for Nubank CSV usually
-                is_recurring: false
+                is_recurring: false,
+                import_fingerprint: t.fingerprint
             }))
 
-            await api.post('/imports/confirm', transactionsToSave)
+            const { data: summary } = await api.post('/imports/confirm', transactionsToSave)
 
-            toast.success(`${transactionsToSave.length} transações importadas com sucesso!`)
+            toast.success(`${summary.created} transações importadas com sucesso!`)
+            if (summary.skipped > 0) {
+                toast.info(`${summary.skipped} transações já importadas foram ignoradas.`)
+            }
+
+            if (truncated && file) {
+                // The reviewed rows are in; the rest of the file is imported by a background job
+                const formData = new FormData()
+                formData.append('file', file)
+                try {
+                    const { data: job } = await api.post(`/imports/jobs?skip_rows=${previewCount}`, formData, {
+                        headers: { 'Content-Type': 'multipart/form-data' }
+                    })
+                    toast.info("Importando o restante do arquivo em segundo plano...")
+                    followImportJob(job.id)
+                } catch (error) {
+                    console.error("Erro ao enfileirar importação", error)
+                    toast.error("Erro ao enviar o restante do arquivo. Importe o arquivo novamente: as linhas já salvas serão ignoradas.")
+                }
+            }
             onImportSuccess()
             onOpenChange(false)
 
@@ -130,6 +183,8 @@ export function ImportTransactionsDialog({
                 setStep('upload')
                 setFile(null)
                 setPreviewData([])
+                setPreviewCount(0)
+                setTruncated(false)
             }, 500)
 
         } catch (error: any) {
@@ -151,7 +206,7 @@ export function ImportTransactionsDialog({
         <Dialog open={open} onOpenChange={onOpenChange}>
             <DialogContent className="sm:max-w-[800px] max-h-[90vh] flex flex-col">
                 <DialogHeader>
-                    <DialogTitle>Importar Transações (Nubank)</DialogTitle>
+                    <DialogTitle>Importar Extrato</DialogTitle>
                 </DialogHeader>
 
                 <div className="flex-1 overflow-hidden p-1 flex flex-col">
@@ -159,12 +214,12 @@ export function ImportTransactionsDialog({
                         <div className="flex flex-col items-center justify-center h-64 border-2 border-dashed rounded-lg border-muted-foreground/25 bg-muted/50 gap-4">
                             <Upload className="w-10 h-10 text-muted-foreground" />
                             <div className="text-center space-y-2">
-                                <p className="text-sm font-medium">Arraste seu arquivo CSV ou clique para selecionar</p>
-                                <p className="text-xs text-muted-foreground">Formato suportado: CSV (Nubank)</p>
+                                <p className="text-sm font-medium">Arraste seu extrato ou clique para selecionar</p>
+                                <p className="text-xs text-muted-foreground">Formatos suportados: CSV (Nubank conta ou cartão), OFX e QIF</p>
                             </div>
                             <input
                                 type="file"
-                                accept=".csv"
+                                accept=".csv,.ofx,.qfx,.qif"
                                 className="hidden"
                                 ref={fileInputRef}
                                 onChange={handleFileSelect}
@@ -220,6 +275,9 @@ export function ImportTransactionsDialog({
                                                     {format(new Date(t.date), 'dd/MM/yyyy')}
                                                 </td>
                                                 <td className="p-3 max-w-[200px] truncate" title={t.description}>
+                                                    {t.duplicate && (
+                                                        <span className="mr-2 rounded bg-amber-100 px-1.5 py-0.5 text-xs text-amber-700">Já importada</span>
+                                                    )}
                                                     {t.description}
                                                 </td>
                                                 <td className="p-3">
@@ -12,6 +12,8 @@ interface Transaction {
     due_date: string;
     status: string;
     type: string;
+    installment_number?: number;
+    is_virtual?: boolean;
 }
 
 export function UpcomingBills({ month, year, onUpdate }: { month: number, year: number, onUpdate?: () => void }) {
@@ -29,9 +31,12 @@ export function UpcomingBills({ month, year, onUpdate }: { month: number, year:
         fetchData()
     }, [month, year])
 
-    const handleSettle = async (id: number) => {
+    const handleSettle = async (bill: Transaction) => {
         try {
-            await api.post(`/transactions/${id}/pay`)
+            // Virtual recurrence occurrences share the rule's id; the occurrence number picks the one to pay
+            await api.post(`/transactions/${bill.id}/pay`, null, {
+                params: bill.is_virtual ? { occurrence: bill.installment_number } : undefined
+            })
             fetchData()
             if (onUpdate) onUpdate()
         } catch (error) {
@@ -77,7 +82,7 @@ export function UpcomingBills({ month, year, onUpdate }: { month: number, year:
 
                     return (
                         <div
-                            key={bill.id}
+                            key={`${bill.id}-${bill.installment_number ?? 1}`}
                             className={`relative overflow-hidden rounded-xl bg-muted/20 border-none shadow-sm hover:shadow-xl hover:bg-muted/30 transition-all duration-300 group`}
                         >
                             {/* Accent Line */}
@@ -116,7 +121,7 @@ export function UpcomingBills({ month, year, onUpdate }: { month: number, year:
                                         size="icon"
                                         variant="ghost"
                                         className="h-8 w-8 rounded-full text-slate-400 hover:text-white hover:bg-slate-800 transition-colors"
-                                        onClick={() => handleSettle(bill.id)}
+                                        onClick={() => handleSettle(bill)}
                                         title={bill.type === 'income' ? "Confirmar Recebimento" : "Dar Baixa"}
                                     >
                                         <Check className="w-4 h-4" />